@@ -0,0 +1,15 @@
+#!/usr/bin/python
+
+import sys
+sys.path += ['/esp/web/esp/']
+sys.path += ['/esp/web/esp/esp/']
+sys.path += ['/esp/web/esp/django/']
+
+import os
+os.environ['DJANGO_SETTINGS_MODULE'] = 'esp.settings'
+
+from esp import cache_loader
+import esp.manage
+from esp.program.cache_warmup import run_requested_warmups
+#   Warm up the caches of the programs that admins asked for
+run_requested_warmups()
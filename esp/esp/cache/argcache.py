@@ -33,45 +33,63 @@ Learning Unlimited, Inc.
   Email: web-team@lists.learningu.org
 """
 
+import hashlib
 import random
+import threading
+import time
 import types
+import zlib
 
 from django.core.cache import cache
 from django.dispatch import Signal
-from django.db.models import signals
+from django.db import connection, transaction
+from django.db.models import signals, Q
 from django.conf import settings
 
 from esp.middleware import ESPError
 
 from esp.cache.queued import WithDelayableMethods, delay_method
-from esp.cache.marinade import args_to_key, normalize_args
+from esp.cache.marinade import args_to_key, normalize_args, marinade_dish
 from esp.cache.function import describe_func, get_uid
-from esp.cache.token import Token, SingleEntryToken
+from esp.cache.token import Token, SingleEntryToken, global_cache_time
 from esp.cache.key_set import is_wildcard, specifies_key, token_list_for
 from esp.cache.registry import cache_by_uid, register_cache, all_caches
+from esp.cache.request_memo import memo_get, memo_set, memo_invalidate
+from esp.cache.invalidation import current_batch
 from esp.cache.sad_face import warn_if_loaded
+from esp.cache.telemetry import record, record_recompute
 from esp.cache.signals import m2m_added, m2m_removed
 
 __all__ = ['ArgCache', 'ArgCacheDecorator', 'cache_function']
 
 _delete_signal = Signal(providing_args=['key_set'])
 
+# Defaults for hashed-token mode; see ArgCache.hash_tokens()
+TOKEN_VECTOR_SLOTS = 64
+
+# Defaults for single-flight recomputation; see ArgCache.single_flight()
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT = 5
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+# Default grace period for serving invalidated values; see ArgCache.serve_stale()
+STALE_GRACE = 10
+
 # XXX: For now, all functions must have known arity. No *args or
 # **kwargs are allowed, but optional arguments are fine. This is done to
 # avoid overcomplicating everything, especially this early. If we have a
 # compelling reason to extend it, this can be modified later.
 
 
-# TODO: Don't store each token with the final object, hash them together, to
-# avoid a ridiculous blowup in memory. This will make it about as memory
-# efficient as tiered caching. May be a performance hit though... not sure.
+# NOTE: Caches can opt into storing a single digest of their token values
+# instead of every token alongside the value; see ArgCache.hash_tokens(). The
+# token values then live in a fixed number of per-cache counters, which tokens
+# are hashed into, so a collision costs us an extra miss, never a stale value.
 #
 # I think it's worth it though... this also has the side effect that caches
 # have tokens and then can be used as handles maybe? Kind of another way to
 # express 1-1 dependencies... but offloading work from set() to get(), which
 # isn't so nice... Still, perhaps some relations are hard to reverse.
-#
-# Also, can we pretend we never get a hash collision here?
 
 
 # TODO: This scheme does not allow for sets that involve things like
@@ -86,6 +104,11 @@ _delete_signal = Signal(providing_args=['key_set'])
 # with memory, but still... Gack! I think this is not a blocker though. Tiered
 # caching couldn't do this either... this is simply something we don't know how
 # to implement at all, as far as I know.
+#
+# In the common case, where the cache has a parameter that lives at a single
+# spot in the tree (a Program), ArgCache.depend_on_subtree() sidesteps this:
+# it does the range query at invalidation time instead, and evicts the
+# entries for every Program above or below the node that changed.
 
 
 # TODO: To be really useful, this system needs to track old values of fields,
@@ -132,6 +155,7 @@ _delete_signal = Signal(providing_args=['key_set'])
 # TODO: Somehow collapse these duplicate reports... delay signals? Keep track
 # of when we last set?  problem... multiple processes... I suppose we could use
 # a "IPC" mechanism of the cache. Sigh.
+# (Within one thread, defer_invalidation() in invalidation.py does this.)
 
 
 # TODO: Depend on external factors (a version cookie on each function when
@@ -159,6 +183,17 @@ class ParametrizedSingleton(type):
 
 # XXX: This system cannot thunk functions!!!  We should do some other silly
 # thing, but I really don't want the syntax complicated.
+def anchored_near(anchor_model, node):
+    """
+    Returns the rows of anchor_model whose anchor is node, an ancestor of
+    node or a descendant of node.
+    """
+    # Our copy of node's range may be out of date if the tree was renumbered
+    rangestart, rangeend = node.__class__.objects.filter(id=node.id).values_list('rangestart', 'rangeend')[0]
+    return anchor_model.objects.filter(
+        Q(anchor__rangestart__lte=rangestart, anchor__rangeend__gte=rangeend) |
+        Q(anchor__rangestart__gte=rangestart, anchor__rangeend__lte=rangeend))
+
 def handle_thunk(obj):
     """ If obj is a function (thunk), return result; otherwise return obj. """
     if isinstance(obj, types.FunctionType):
@@ -201,9 +236,29 @@ class ArgCache(WithDelayableMethods):
         # Mostly used to avoid recursion
         self.disabled = False
 
+        # Number of token counter slots, if hashing tokens
+        self.token_vector_slots = None
+
+        # Whether to remember values in-process for the rest of the request
+        self.per_request = False
+
+        # Lock timeout and wait, if only one process should recompute a value
+        self.lock_timeout = None
+        self.lock_wait = None
+
+        # How long to serve invalidated values while refreshing them, if at all
+        self.stale_grace = None
+
+        # Whether to key QuerySets and long lists by fingerprint; see marinade_dish
+        self.fingerprint = False
+
         # Init stats
         self.hit_count = 0
         self.miss_count = 0
+        self.request_hit_count = 0
+        self.stale_hit_count = 0
+        self.wait_hit_count = 0
+        self.background_refresh_count = 0
 
         # Be able to invert param mapping
         self.param_dict = {}
@@ -228,6 +283,7 @@ class ArgCache(WithDelayableMethods):
             print "Cache Hit! %s on %s" % (self.name, arg_list)
             self.disabled = old_disabled
         self.hit_count += 1
+        record(self, 'hits')
 
     def _miss_hook(self, arg_list):
         if settings.CACHE_DEBUG:
@@ -235,6 +291,7 @@ class ArgCache(WithDelayableMethods):
             print "Cache Miss! %s on %s" % (self.name, arg_list)
             self.disabled = old_disabled
         self.miss_count += 1
+        record(self, 'misses')
 
     @property
     def pretty_name(self):
@@ -254,6 +311,8 @@ class ArgCache(WithDelayableMethods):
     connect.alters_data = True
     def send(self, key_set):
         """ Internal: Send the signal. """
+        memo_invalidate(self, key_set)
+        record(self, 'invalidations')
         _delete_signal.send(sender=self, key_set=key_set)
     send.alters_data = True
 
@@ -273,8 +332,7 @@ class ArgCache(WithDelayableMethods):
 
     def key(self, arg_list):
         """ Returns a cache key, given a list of arguments. """
-        from esp.cache.marinade import marinade_dish
-        return self.name + '|' + ':'.join([marinade_dish(arg) for arg in arg_list])
+        return self.name + '|' + ':'.join([marinade_dish(arg, self.fingerprint) for arg in arg_list])
 
     def _token_keys(self, arg_list):
         """ Returns a list of keys to grab for all the tokens. """
@@ -284,6 +342,111 @@ class ArgCache(WithDelayableMethods):
             token_keys.append(token.key(arg_list))
         return token_keys
 
+    def memoize_per_request(self):
+        """
+        Remember values in-process for the rest of the current request, so
+        repeated lookups don't go back to the backend. Deletions in this
+        process still take effect immediately. Values are shared rather than
+        copied, so only use this for caches whose callers don't modify the
+        results. Requires esp.cache.middleware.RequestMemoMiddleware.
+        """
+        self.per_request = True
+    memoize_per_request.alters_data = True
+
+    def fingerprint_keys(self):
+        """
+        Key entries by the SQL of QuerySet arguments rather than by their
+        results, and by a hash of long list arguments, so looking an entry
+        up never runs a query and keys stay short. Use this when a QuerySet
+        argument whose results change will also invalidate the entry (e.g.
+        through depend_on_model), since the key won't change with them.
+        """
+        self.fingerprint = True
+    fingerprint_keys.alters_data = True
+
+    def single_flight(self, lock_timeout=SINGLE_FLIGHT_LOCK_TIMEOUT, wait=SINGLE_FLIGHT_WAIT):
+        """
+        Only let one process at a time recompute a missing value.
+
+        The first caller to miss takes a lock in the cache (for at most
+        lock_timeout seconds) and recomputes. Everyone else gets the value
+        that was there before it was invalidated, if there was one, or
+        waits up to `wait` seconds for the new value before giving up and
+        computing it themselves. Use this for expensive functions that
+        are invalidated often under load, where a slightly old value is
+        fine to show.
+        """
+        self.lock_timeout = lock_timeout
+        self.lock_wait = wait
+    single_flight.alters_data = True
+
+    def serve_stale(self, grace=STALE_GRACE, lock_timeout=SINGLE_FLIGHT_LOCK_TIMEOUT, wait=SINGLE_FLIGHT_WAIT):
+        """
+        Keep serving a value for up to `grace` seconds after it's
+        invalidated, while one process recomputes it in a background thread.
+        If the refresh takes longer than that, callers fall back to
+        single_flight() with the given lock_timeout and wait.
+        """
+        self.single_flight(lock_timeout, wait)
+        self.stale_grace = grace
+    serve_stale.alters_data = True
+
+    def hash_tokens(self, slots=TOKEN_VECTOR_SLOTS):
+        """
+        Store one digest of the token values with each entry, rather than
+        every token value.
+
+        The token values are kept in `slots` counters shared by the whole
+        cache, so get() needs only the value key and the counters for the
+        cache's tokens, which are usually one or two. Deleting a token
+        sets its slot's counter to a new random value.
+        """
+        self.token_vector_slots = slots
+    hash_tokens.alters_data = True
+
+    def _slot_key(self, token_key):
+        """ Returns the key of the counter for a token key's slot. """
+        slot = (zlib.crc32(token_key) & 0xffffffff) % self.token_vector_slots
+        return 'TOKENVEC__%s|%d' % (self.name, slot)
+
+    def _slot_keys(self, arg_list):
+        """ Returns the counter keys for arg_list's tokens, in token order. """
+        return [self._slot_key(tkey) for tkey in self._token_keys(arg_list)]
+
+    def _token_digest(self, slot_keys, counters):
+        """ Folds the token counters for an entry into one digest. """
+        return hashlib.md5(','.join([str(counters[skey]) for skey in slot_keys])).hexdigest()
+
+    def _new_slot_counter(self):
+        """ Returns a fresh counter value, unlikely to match any before it. """
+        return random.randint(0, 2 ** 31 - 1)
+
+    def _get_slot_counters(self, slot_keys):
+        """ Returns the counters at slot_keys, creating any that are missing. """
+        counters = self.cache.get_many(slot_keys)
+        missing = [skey for skey in slot_keys if counters.get(skey) is None]
+        for skey in missing:
+            self.cache.add(skey, self._new_slot_counter(), global_cache_time)
+        if missing:
+            # Someone else may have beaten us to it
+            counters.update(self.cache.get_many(missing))
+        return counters
+
+    def _bump_token_slot(self, token_key):
+        """ Invalidates everything depending on token_key's slot. """
+        # A set rather than incr(): it reaches every host of a multi-host
+        # backend, and replaces a counter that was evicted.
+        self.cache.set(self._slot_key(token_key), self._new_slot_counter(), global_cache_time)
+    _bump_token_slot.alters_data = True
+
+    def delete_token_key(self, token_key):
+        """ Internal: invalidates the token stored at token_key. """
+        if self.token_vector_slots:
+            self._bump_token_slot(token_key)
+        else:
+            self.cache.delete(token_key)
+    delete_token_key.alters_data = True
+
     def add_token(self, token):
         """ Adds the given token to this cache. """
         self.tokens.append(token)
@@ -330,13 +493,92 @@ class ArgCache(WithDelayableMethods):
         if self.disabled:
             return None
 
+        # Waiting to be deleted, so whatever is there is stale
+        batch = current_batch()
+        if batch is not None and batch.covers_args(self, arg_list):
+            self._miss_hook(arg_list)
+            return None
+
         key = self.key(arg_list)
 
-        # gather keys
-        keys_to_get = [key] + self._token_keys(arg_list)
+        if self.per_request:
+            value = memo_get(self, key)
+            if value is not None:
+                return value
+
+        if self.token_vector_slots:
+            slot_keys = self._slot_keys(arg_list)
+            ans_dict = self.cache.get_many([key] + slot_keys)
+            value = self._check_hashed(arg_list, key, slot_keys, ans_dict)
+        else:
+            # gather keys
+            token_keys = self._token_keys(arg_list)
+
+            # extract values
+            ans_dict = self.cache.get_many([key] + token_keys)
+            value = self._check(arg_list, key, token_keys, ans_dict)
+
+        if self.per_request and value is not None:
+            memo_set(self, key, arg_list, value)
+        return value
 
-        # extract values
-        ans_dict = self.cache.get_many(keys_to_get)
+    def get_many_args(self, arg_lists):
+        """
+        Get the values of the cache at each of arg_lists, in one request to
+        the backend. Returns a list in the same order, with None for misses.
+        """
+        if self.disabled:
+            return [None] * len(arg_lists)
+
+        keys = [self.key(arg_list) for arg_list in arg_lists]
+
+        if self.per_request:
+            results = [memo_get(self, key) for key in keys]
+        else:
+            results = [None] * len(keys)
+        # only go to the backend for the ones we don't remember, and that
+        # aren't waiting to be deleted
+        batch = current_batch()
+        todo = []
+        for i in range(len(keys)):
+            if results[i] is not None:
+                continue
+            if batch is not None and batch.covers_args(self, arg_lists[i]):
+                self._miss_hook(arg_lists[i])
+            else:
+                todo.append(i)
+        if not todo:
+            return results
+
+        if self.token_vector_slots:
+            slot_keys = dict([(i, self._slot_keys(arg_lists[i])) for i in todo])
+            keys_to_get = set([keys[i] for i in todo])
+            for i in todo:
+                keys_to_get.update(slot_keys[i])
+            ans_dict = self.cache.get_many(list(keys_to_get))
+            for i in todo:
+                results[i] = self._check_hashed(arg_lists[i], keys[i], slot_keys[i], ans_dict)
+        else:
+            # gather keys; lots of these will share tokens
+            token_keys = {}
+            keys_to_get = set()
+            for i in todo:
+                token_keys[i] = self._token_keys(arg_lists[i])
+                keys_to_get.add(keys[i])
+                keys_to_get.update(token_keys[i])
+
+            ans_dict = self.cache.get_many(list(keys_to_get))
+            for i in todo:
+                results[i] = self._check(arg_lists[i], keys[i], token_keys[i], ans_dict)
+
+        if self.per_request:
+            for i in todo:
+                if results[i] is not None:
+                    memo_set(self, keys[i], arg_lists[i], results[i])
+        return results
+
+    def _check(self, arg_list, key, token_keys, ans_dict):
+        """ Internal: unwraps the value at key in ans_dict, if its tokens are current. """
         wrapped_value = ans_dict.get(key, None)
         if wrapped_value is None:
             self._miss_hook(arg_list)
@@ -344,17 +586,19 @@ class ArgCache(WithDelayableMethods):
         
         try:
             # check tokens
-            if len(wrapped_value) != len(keys_to_get):
+            if len(wrapped_value) != len(token_keys) + 1:
                 # shhhh... that value wasn't really there
                 self.cache.delete(key)
                 self._miss_hook(arg_list)
                 return None
-            for tvalue, tkey in zip(wrapped_value[1:], keys_to_get[1:]):
+            for tvalue, tkey in zip(wrapped_value[1:], token_keys):
                 saved_value = ans_dict.get(tkey, None)
                 # token mismatch!
                 if not saved_value or saved_value != tvalue:
                     # shhhh... that value wasn't really there
-                    self.cache.delete(key)
+                    # (but keep it around to serve while it's recomputed)
+                    if not self.lock_timeout:
+                        self.cache.delete(key)
                     self._miss_hook(arg_list)
                     return None
 
@@ -366,33 +610,107 @@ class ArgCache(WithDelayableMethods):
             self._miss_hook(arg_list)
             return None
 
-    def set(self, arg_list, value, timeout_seconds=None):
-        """ Set the value of the cache at arg_list (which can be a tuple). """
+    def _check_hashed(self, arg_list, key, slot_keys, ans_dict):
+        """ Internal: _check() for caches that hash their tokens. """
+        wrapped_value = ans_dict.get(key, None)
+        if wrapped_value is None or [skey for skey in slot_keys if ans_dict.get(skey) is None]:
+            self._miss_hook(arg_list)
+            return None
+
+        try:
+            value, digest = wrapped_value
+            if digest != self._token_digest(slot_keys, ans_dict):
+                # shhhh... that value wasn't really there
+                # (but keep it around to serve while it's recomputed)
+                if not self.lock_timeout:
+                    self.cache.delete(key)
+                self._miss_hook(arg_list)
+                return None
+
+            self._hit_hook(arg_list)
+            return value
+
+        except Exception: # Don't die on errors, e.g. if wrapped_value is from before hashing
+            self._miss_hook(arg_list)
+            return None
+
+    def get_stale(self, arg_list):
+        """
+        Get whatever value is stored at arg_list, even if it has been
+        invalidated since. Only single-flight caches keep invalidated values.
+        """
         if self.disabled:
-            return
+            return None
 
-        key = self.key(arg_list)
+        # Don't hand this thread back something it's waiting to delete
+        batch = current_batch()
+        if batch is not None and batch.covers_args(self, arg_list):
+            return None
+
+        wrapped_value = self.cache.get(self.key(arg_list))
+        try:
+            return wrapped_value[0]
+        except Exception:
+            return None
+
+    def _wrap_many(self, items):
+        """ Internal: returns a dict of keys to wrapped values for (arg_list, value) pairs. """
+        if self.token_vector_slots:
+            slot_keys = [self._slot_keys(arg_list) for arg_list, value in items]
+            all_slot_keys = set()
+            for skeys in slot_keys:
+                all_slot_keys.update(skeys)
+            counters = self._get_slot_counters(list(all_slot_keys))
+            return dict((self.key(arg_list), (value, self._token_digest(skeys, counters)))
+                        for (arg_list, value), skeys in zip(items, slot_keys))
 
         # gather keys
-        token_keys = self._token_keys(arg_list)
+        token_keys = [self._token_keys(arg_list) for arg_list, value in items]
+        all_token_keys = set()
+        for tkeys in token_keys:
+            all_token_keys.update(tkeys)
 
         # extract what values we can
         #  we use get_many here to optimize the common case: all tokens already present
-        ans_dict = self.cache.get_many(token_keys)
-
-        # regenerate missing tokens
-        for tkey, token in zip(token_keys, self.tokens):
-            if not ans_dict.has_key(tkey):
-                ans_dict[tkey] = token.value_args(arg_list)
-
-        # gather token values
-        wrapped_value = [value]
-        for tkey in token_keys:
-            wrapped_value.append(ans_dict[tkey])
-            
-        self.cache.set(key, wrapped_value, timeout_seconds)
+        ans_dict = self.cache.get_many(list(all_token_keys))
+
+        wrapped_values = {}
+        for (arg_list, value), tkeys in zip(items, token_keys):
+            # regenerate missing tokens
+            for tkey, token in zip(tkeys, self.tokens):
+                if not ans_dict.has_key(tkey):
+                    ans_dict[tkey] = token.value_args(arg_list)
+
+            # gather token values
+            wrapped_value = [value]
+            for tkey in tkeys:
+                wrapped_value.append(ans_dict[tkey])
+            wrapped_values[self.key(arg_list)] = wrapped_value
+
+        return wrapped_values
+
+    def set(self, arg_list, value, timeout_seconds=None):
+        """ Set the value of the cache at arg_list (which can be a tuple). """
+        if self.disabled:
+            return
+
+        for key, wrapped_value in self._wrap_many([(arg_list, value)]).items():
+            self.cache.set(key, wrapped_value, timeout_seconds)
+            if self.per_request:
+                memo_set(self, key, arg_list, value)
     set.alters_data = True
 
+    def set_many_args(self, items, timeout_seconds=None):
+        """ Set many values at once, given a list of (arg_list, value) pairs. """
+        if self.disabled or not items:
+            return
+
+        self.cache.set_many(self._wrap_many(items), timeout_seconds)
+        if self.per_request:
+            for arg_list, value in items:
+                memo_set(self, self.key(arg_list), arg_list, value)
+    set_many_args.alters_data = True
+
     def delete(self, arg_list):
         """ Delete the value of the cache at arg_list (which can be a tuple). """
         key = self.key(arg_list)
@@ -410,6 +728,15 @@ class ArgCache(WithDelayableMethods):
         if settings.CACHE_DEBUG:
             print "Dumping from", _self.name, "keyset", key_set
 
+        # Inside defer_invalidation(), just remember it for later; dependents
+        # still hear about it now, so they can queue their own deletions.
+        batch = current_batch()
+        if batch is not None:
+            if not batch.covers(_self, key_set):
+                batch.add(_self, key_set)
+                _self.send(key_set=key_set)
+            return
+
         # TODO: Would be nicer if we could just make a
         # proxy token for the single-element case
         arg_list = _self.is_arg_list(key_set)
@@ -421,6 +748,15 @@ class ArgCache(WithDelayableMethods):
             _self.send(key_set=key_set)
     delete_key_set.alters_data = True
 
+    def delete_key_set_now(self, key_set):
+        """ Delete key_set from the backend, without telling anyone. """
+        arg_list = self.is_arg_list(key_set)
+        if arg_list:
+            self.cache.delete(self.key(arg_list))
+        else:
+            self.find_token(key_set).delete_key_set(key_set, send_signal=False)
+    delete_key_set_now.alters_data = True
+
     def delete_key_sets(self, list_or_set):
         """ Delete one or multiple (including nested lists) key sets. 
             - Michael P 11/1/2009
@@ -514,6 +850,46 @@ class ArgCache(WithDelayableMethods):
         signals.pre_delete.connect(delete_cb, sender=Model, weak=False)
     depend_on_row.alters_data = True
 
+    @delay_method
+    def depend_on_subtree(self, Model, node_func, param, anchor_model, filter=None):
+        """
+        Depend on rows of Model that are attached to the DataTree, but only
+        evict the entries near where the change happened.
+
+        param is the name of a parameter of this cache whose values are
+        instances of anchor_model, which has an 'anchor' DataTree node (e.g.
+        a Program). When a row changes, node_func(instance) gives its node,
+        and only the entries whose param is anchored at, above or below that
+        node are evicted. For example,
+
+        catalog_cached.depend_on_subtree(lambda: UserBit, lambda bit: bit.qsc,
+                                         'program', lambda: Program)
+
+        means a UserBit under Q/Programs/Spark/2012 only evicts the catalog
+        for that program, where depend_on_model(UserBit) would evict every
+        program's catalog.
+        """
+        # See depend_on_row
+        if self.locked:
+            return
+        Model = handle_thunk(Model)
+        anchor_model = handle_thunk(anchor_model)
+        if filter is None:
+            filter = lambda instance: True
+        self.get_or_create_token((param,))
+
+        def delete_cb(sender, instance, **kwargs):
+            if not filter(instance):
+                return None
+            node = node_func(instance)
+            if node is None:
+                return None
+            for anchored in anchored_near(anchor_model, node):
+                self.delete_key_set(**{param: anchored})
+        signals.post_save.connect(delete_cb, sender=Model, weak=False)
+        signals.pre_delete.connect(delete_cb, sender=Model, weak=False)
+    depend_on_subtree.alters_data = True
+
     @delay_method
     def depend_on_cache(self, cache_obj, mapping_func, filter=None):
         """
@@ -643,14 +1019,171 @@ class ArgCacheDecorator(ArgCache):
             if retVal is not None:
                 return retVal
 
+            if not cache_only and self.stale_grace:
+                retVal = self._serve_stale(arg_list, args, kwargs)
+                if retVal is not None:
+                    return retVal
+
             if not cache_only:
-                retVal = self.func(*args, **kwargs)
-                self.set(arg_list, retVal)
+                if self.lock_timeout:
+                    retVal = self._compute_single_flight(arg_list, args, kwargs)
+                else:
+                    retVal = self._recompute(args, kwargs)
+                    self.set(arg_list, retVal)
         else:
             retVal = self.func(*args, **kwargs)
 
         return retVal
 
+    def _recompute(self, args, kwargs):
+        """ Internal: call the function for a value that wasn't in the cache. """
+        start = time.time()
+        retVal = self.func(*args, **kwargs)
+        record_recompute(self, time.time() - start)
+        return retVal
+
+    def _serve_stale(self, arg_list, args, kwargs):
+        """
+        Internal: returns the invalidated value at arg_list, if it's within
+        its grace period, and makes sure someone is refreshing it.
+        """
+        # A refresh couldn't see our own uncommitted changes, and we'd
+        # rather not show them the old value either
+        if transaction.is_dirty():
+            return None
+
+        retVal = self.get_stale(arg_list)
+        if retVal is None:
+            return None
+
+        # The marker records when the value was first found to be stale
+        marker_key = self.key(arg_list) + '|STALE'
+        now = time.time()
+        if self.cache.add(marker_key, now, self.lock_timeout):
+            # Refresh under the single-flight lock, so that once the grace
+            # period is over callers wait for us rather than all recomputing;
+            # if someone already holds it, they're refreshing it anyway
+            lock_key = self._lock_key(arg_list)
+            if self.cache.add(lock_key, 1, self.lock_timeout):
+                self._refresh_in_background(arg_list, marker_key, lock_key, args, kwargs)
+        else:
+            since = self.cache.get(marker_key)
+            if since is None or now - since > self.stale_grace:
+                return None
+
+        self.stale_hit_count += 1
+        return retVal
+
+    def _refresh_in_background(self, arg_list, marker_key, lock_key, args, kwargs):
+        """ Internal: recompute the value at arg_list in a new thread, then release lock_key. """
+        def refresh():
+            try:
+                self.set(arg_list, self._recompute(args, kwargs))
+                self.background_refresh_count += 1
+            finally:
+                self.cache.delete(lock_key)
+                self.cache.delete(marker_key)
+                # Each thread gets its own database connection; don't leak it
+                connection.close()
+        thread = threading.Thread(target=refresh, name='refresh %s' % self.name)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def _lock_key(self, arg_list):
+        """ Internal: the key held by whoever is recomputing the value at arg_list. """
+        return self.key(arg_list) + '|LOCK'
+
+    def _compute_single_flight(self, arg_list, args, kwargs):
+        """ Internal: recompute a missing value, unless someone else already is. """
+        lock_key = self._lock_key(arg_list)
+        if not self.cache.add(lock_key, 1, self.lock_timeout):
+            # Somebody else is on it; make do with the old value if there is one
+            retVal = self.get_stale(arg_list)
+            if retVal is not None:
+                self.stale_hit_count += 1
+                return retVal
+
+            # Otherwise wait a bit for them to finish
+            deadline = time.time() + self.lock_wait
+            while time.time() < deadline:
+                time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+                retVal = self.get(arg_list)
+                if retVal is not None:
+                    self.wait_hit_count += 1
+                    return retVal
+                if self.cache.add(lock_key, 1, self.lock_timeout):
+                    # They gave up, so it's our turn
+                    break
+            else:
+                # Taking too long; just do it ourselves
+                retVal = self._recompute(args, kwargs)
+                self.set(arg_list, retVal)
+                return retVal
+
+        try:
+            retVal = self._recompute(args, kwargs)
+            self.set(arg_list, retVal)
+        finally:
+            self.cache.delete(lock_key)
+        return retVal
+
+    def get_or_claim(self, *args, **kwargs):
+        """
+        For callers that compute the value themselves, e.g. to also encode
+        it for the response.  Returns (value, None) if a value can be had without
+        computing it -- from the cache, as a stale value, or from whoever is
+        already computing it -- and (None, done) otherwise, in which case
+        the caller should compute the value and then call done(value), or
+        done(None) if it gave up.
+        """
+        arg_list = self.arg_list_from(args, kwargs)
+        retVal = self.get(arg_list)
+        if retVal is not None:
+            return retVal, None
+
+        if self.stale_grace:
+            retVal = self._serve_stale(arg_list, args, kwargs)
+            if retVal is not None:
+                return retVal, None
+
+        lock_key = None
+        if self.lock_timeout:
+            lock_key = self._lock_key(arg_list)
+            if not self.cache.add(lock_key, 1, self.lock_timeout):
+                # Somebody else is on it; let the usual path wait for them
+                return self(*args, **kwargs), None
+
+        def done(value):
+            try:
+                if value is not None:
+                    self.set(arg_list, value)
+            finally:
+                if lock_key:
+                    self.cache.delete(lock_key)
+        return None, done
+
+    def map(self, args_list):
+        """
+        Call the function on each tuple of positional arguments in
+        args_list, using the cache where possible. All the lookups go to
+        the backend at once, as do all the values computed for misses.
+
+        For member functions, include the instance, e.g.
+            ClassSection.num_students.map([(sec,) for sec in sections])
+        """
+        arg_lists = [self.arg_list_from(args, {}) for args in args_list]
+        results = self.get_many_args(arg_lists)
+
+        new_items = []
+        for i, args in enumerate(args_list):
+            if results[i] is None:
+                results[i] = self._recompute(args, {})
+                new_items.append((arg_lists[i], results[i]))
+        self.set_many_args(new_items)
+
+        return results
+
     # make bound member functions work...
     def __get__(self, obj, objtype=None):
         """ Python member functions are such hacks... :-D """
@@ -0,0 +1,170 @@
+""" Deferring and collapsing cache invalidations. """
+
+__author__    = "Individual contributors (see AUTHORS file)"
+__date__      = "$DATE$"
+__rev__       = "$REV$"
+__license__   = "AGPL v.3"
+__copyright__ = """
+This file is part of the ESP Web Site
+Copyright (c) 2009 by the individual contributors
+  (see AUTHORS file)
+
+The ESP Web Site is free software; you can redistribute it and/or
+modify it under the terms of the GNU Affero General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public
+License along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+Contact information:
+MIT Educational Studies Program
+  84 Massachusetts Ave W20-467, Cambridge, MA 02139
+  Phone: 617-253-4882
+  Email: esp-webmasters@mit.edu
+Learning Unlimited, Inc.
+  527 Franklin St, Cambridge, MA 02139
+  Phone: 617-379-0178
+  Email: web-team@lists.learningu.org
+"""
+
+import copy
+import threading
+
+from django.db import transaction
+from django.db.models import Model
+
+from esp.cache.marinade import marinade_dish
+from esp.cache.key_set import specifies_key
+
+__all__ = ['defer_invalidation', 'commit_on_success_deferred', 'current_batch']
+
+_local = threading.local()
+
+def current_batch():
+    """ Returns the InvalidationBatch collecting deletions for this thread, if any. """
+    return getattr(_local, 'batch', None)
+
+def _signature(cache_obj, key_set):
+    """ Returns the (params, values) that key_set specifies, by marinaded value. """
+    params = tuple([param for param in cache_obj.params if specifies_key(key_set, param)])
+    values = tuple([marinade_dish(key_set[param]) for param in params])
+    return params, values
+
+class InvalidationBatch(object):
+    """
+    The key_sets waiting to be deleted from each cache.
+
+    For each cache, only the key_sets that aren't contained in some other
+    pending key_set are kept, grouped by which parameters they specify.
+    """
+
+    def __init__(self):
+        # uid -> (cache_obj, {params: {values: key_set}})
+        self.pending = {}
+        self.collapsed_count = 0
+
+    def _groups(self, cache_obj):
+        if cache_obj.uid not in self.pending:
+            self.pending[cache_obj.uid] = (cache_obj, {})
+        return self.pending[cache_obj.uid][1]
+
+    def covers(self, cache_obj, key_set):
+        """ Is key_set already contained in a pending key_set? """
+        if cache_obj.uid not in self.pending:
+            return False
+        params, values = _signature(cache_obj, key_set)
+        specified = dict(zip(params, values))
+        for group_params, group in self._groups(cache_obj).items():
+            if not all([param in specified for param in group_params]):
+                continue
+            if tuple([specified[param] for param in group_params]) in group:
+                return True
+        return False
+
+    def covers_args(self, cache_obj, arg_list):
+        """ Is the entry at arg_list waiting to be deleted? """
+        if cache_obj.uid not in self.pending:
+            return False
+        return self.covers(cache_obj, dict(zip(cache_obj.params, arg_list)))
+
+    def add(self, cache_obj, key_set):
+        """ Queue key_set, dropping any pending key_sets it contains. """
+        params, values = _signature(cache_obj, key_set)
+        groups = self._groups(cache_obj)
+        for group_params, group in groups.items():
+            if not all([param in group_params for param in params]):
+                continue
+            indices = [group_params.index(param) for param in params]
+            for group_values in group.keys():
+                if tuple([group_values[i] for i in indices]) == values:
+                    del group[group_values]
+                    self.collapsed_count += 1
+        # Deleted rows lose their ids, so hang on to a copy
+        key_set = dict([(key, isinstance(val, Model) and copy.copy(val) or val)
+                        for key, val in key_set.items()])
+        groups.setdefault(params, {})[values] = key_set
+
+    def flush(self):
+        """ Actually delete everything that's pending. """
+        pending, self.pending = self.pending, {}
+        for cache_obj, groups in pending.values():
+            for group in groups.values():
+                for key_set in group.values():
+                    cache_obj.delete_key_set_now(key_set)
+
+class defer_invalidation(object):
+    """
+    Collect the cache deletions made while this is active, and perform
+    each one only once, when it exits. Deletions contained in an earlier or
+    later deletion from the same cache are dropped. Use it as a context
+    manager or a decorator:
+
+        with defer_invalidation():
+            for student in students:
+                sec.preregister_student(student)
+
+    Lookups made in the meantime by this thread miss for anything that is
+    waiting to be deleted, so this thread never sees a stale value. Other
+    processes keep seeing the old values until the end of the block, which
+    is what we want inside a transaction: they can't see the new data yet
+    either. Nested uses flush with the outermost one.
+    """
+
+    def __enter__(self):
+        self.outermost = current_batch() is None
+        if self.outermost:
+            _local.batch = InvalidationBatch()
+        return current_batch()
+
+    def __exit__(self, type, value, traceback):
+        if self.outermost:
+            batch = current_batch()
+            _local.batch = None
+            batch.flush()
+
+    def __call__(self, func):
+        def _inner(*args, **kwargs):
+            # A fresh instance per call, since this one may be shared between threads
+            deferrer = defer_invalidation()
+            deferrer.__enter__()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                deferrer.__exit__(None, None, None)
+        _inner.__doc__ = func.__doc__
+        _inner.__name__ = func.__name__
+        return _inner
+
+def commit_on_success_deferred(func):
+    """
+    Like django.db.transaction.commit_on_success, but invalidates caches
+    once, after the transaction commits.
+    """
+    return defer_invalidation()(transaction.commit_on_success(func))
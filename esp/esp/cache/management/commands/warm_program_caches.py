@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from esp.program.models import Program
+from esp.program.cache_warmup import warm_program_caches
+
+class Command(BaseCommand):
+    args = '<program id, or url like Splash/2012>'
+    help = 'Fill the caches for every class, section, QSD page and module view of a program.'
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', dest='processes', default=4,
+                    help='Number of worker processes; 1 does everything in this process.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: warm_program_caches %s' % self.args)
+
+        try:
+            if args[0].isdigit():
+                prog = Program.objects.get(id=int(args[0]))
+            else:
+                prog = Program.by_prog_inst(*args[0].strip('/').split('/', 1))
+        except (Program.DoesNotExist, TypeError):
+            raise CommandError('No such program: %s' % args[0])
+
+        report = warm_program_caches(prog, options['processes'])
+
+        print '%-50s %8s %10s' % ('Cache', 'Items', 'Seconds')
+        for row in report['rows']:
+            print '%-50s %8d %10.2f' % (row['label'], row['items'], row['seconds'])
+            for error in row['errors']:
+                print '    ERROR: %s' % error
+        print 'Warmed %s in %.2f seconds with %d processes.' % (prog.niceName(), report['seconds'], report['processes'])
@@ -33,18 +33,47 @@ Learning Unlimited, Inc.
   Email: web-team@lists.learningu.org
 """
 
+import hashlib
+
 from django.db.models import Model
 from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
 from django.contrib.auth.models import AnonymousUser
 
 from esp.utils import force_str
 from esp.cache.function import describe_class
 
-def marinade_dish(arg):
+# In fingerprint mode, marinaded lists longer than this are replaced by a hash
+LONG_LIST_LENGTH = 64
+
+def fingerprint_queryset(qs):
+    """ Returns a string identifying the query behind qs, without running it. """
+    try:
+        sql, params = qs.query.get_compiler(using=qs.db).as_sql()
+    except EmptyResultSet:
+        # Django knows this one can't match anything
+        return 'QS:%s:empty' % describe_class(qs.model)
+    return 'QS:' + hashlib.md5(force_str(sql) + '|' + repr(params)).hexdigest()
+
+def marinade_dish(arg, fingerprint=False):
+    """
+    Returns a string that identifies arg, for use in cache keys.
+
+    Normally a QuerySet is run and marinaded like the list of its results.
+    With fingerprint=True, QuerySets are identified by their SQL instead, and
+    long lists by a hash of their contents, to keep keys cheap and short.
+    Fingerprints don't match the normal marinade of the same argument, so
+    only use them where both sides of a comparison use them.
+    """
     if isinstance(arg, QuerySet):
+        if fingerprint:
+            return fingerprint_queryset(arg)
         return marinade_dish(list(arg))
     if isinstance(arg, list):
-        return '[%s]' % ','.join([marinade_dish(item) for item in arg])
+        ans = '[%s]' % ','.join([marinade_dish(item, fingerprint) for item in arg])
+        if fingerprint and len(ans) > LONG_LIST_LENGTH:
+            return '[#%s]' % hashlib.md5(ans).hexdigest()
+        return ans
     if isinstance(arg, Model):
         if not isinstance(arg, AnonymousUser) and arg.id is None:
             import random
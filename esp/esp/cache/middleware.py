@@ -0,0 +1,16 @@
+from esp.cache.request_memo import begin_request, end_request
+
+class RequestMemoMiddleware(object):
+    """
+    Middleware that scopes the in-process cache memo (see
+    esp.cache.request_memo) to a single request.
+    """
+    def process_request(self, request):
+        begin_request()
+
+    def process_response(self, request, response):
+        end_request()
+        return response
+
+    def process_exception(self, request, exception):
+        end_request()
@@ -0,0 +1,96 @@
+""" Request-scoped, in-process memo in front of the cache backend. """
+__author__    = "Individual contributors (see AUTHORS file)"
+__date__      = "$DATE$"
+__rev__       = "$REV$"
+__license__   = "AGPL v.3"
+__copyright__ = """
+This file is part of the ESP Web Site
+Copyright (c) 2009 by the individual contributors
+  (see AUTHORS file)
+
+The ESP Web Site is free software; you can redistribute it and/or
+modify it under the terms of the GNU Affero General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public
+License along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+Contact information:
+MIT Educational Studies Program
+  84 Massachusetts Ave W20-467, Cambridge, MA 02139
+  Phone: 617-253-4882
+  Email: esp-webmasters@mit.edu
+Learning Unlimited, Inc.
+  527 Franklin St, Cambridge, MA 02139
+  Phone: 617-379-0178
+  Email: web-team@lists.learningu.org
+"""
+
+import threading
+
+from esp.cache.marinade import marinade_dish
+from esp.cache.key_set import specifies_key
+
+__all__ = ['begin_request', 'end_request', 'memo_get', 'memo_set', 'memo_invalidate']
+
+# Values are only remembered between begin_request() and end_request(), so
+# code running outside of a request (scripts, cron jobs) always goes to the
+# backend.
+#
+# The memo hands back the very object it was given rather than a fresh copy
+# out of the backend, so callers must not modify what they get.
+_local = threading.local()
+
+def _store():
+    return getattr(_local, 'store', None)
+
+def begin_request():
+    """ Start remembering values for this thread. """
+    _local.store = {}
+
+def end_request():
+    """ Forget everything remembered for this thread. """
+    _local.store = None
+
+def memo_get(cache_obj, key):
+    """ Returns the remembered value at key for cache_obj, or None. """
+    store = _store()
+    if not store:
+        return None
+    entry = store.get(cache_obj.uid, {}).get(key, None)
+    if entry is None:
+        return None
+    cache_obj.request_hit_count += 1
+    return entry[1]
+
+def memo_set(cache_obj, key, arg_list, value):
+    """ Remember value at key for cache_obj, until the end of the request. """
+    store = _store()
+    if store is None:
+        return
+    store.setdefault(cache_obj.uid, {})[key] = (arg_list, value)
+
+def memo_invalidate(cache_obj, key_set):
+    """ Forget everything cache_obj remembers in key_set. """
+    store = _store()
+    if not store or cache_obj.uid not in store:
+        return
+    specified = [(i, marinade_dish(key_set[param])) for i, param in enumerate(cache_obj.params)
+                 if specifies_key(key_set, param)]
+    if not specified:
+        del store[cache_obj.uid]
+        return
+    entries = store[cache_obj.uid]
+    for key, (arg_list, value) in entries.items():
+        for i, marinaded in specified:
+            if marinade_dish(arg_list[i]) != marinaded:
+                break
+        else:
+            del entries[key]
@@ -0,0 +1,167 @@
+""" Hit, miss and recompute statistics for each cache, collected across processes. """
+__author__    = "Individual contributors (see AUTHORS file)"
+__date__      = "$DATE$"
+__rev__       = "$REV$"
+__license__   = "AGPL v.3"
+__copyright__ = """
+This file is part of the ESP Web Site
+Copyright (c) 2009 by the individual contributors
+  (see AUTHORS file)
+
+The ESP Web Site is free software; you can redistribute it and/or
+modify it under the terms of the GNU Affero General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public
+License along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+Contact information:
+MIT Educational Studies Program
+  84 Massachusetts Ave W20-467, Cambridge, MA 02139
+  Phone: 617-253-4882
+  Email: esp-webmasters@mit.edu
+Learning Unlimited, Inc.
+  527 Franklin St, Cambridge, MA 02139
+  Phone: 617-379-0178
+  Email: web-team@lists.learningu.org
+"""
+
+import atexit
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from esp.cache.registry import all_caches
+
+__all__ = ['record', 'record_recompute', 'record_value_size', 'flush', 'collected', 'reset', 'FIELDS']
+
+# Counters kept for each cache
+FIELDS = ('hits', 'misses', 'invalidations', 'recomputes', 'recompute_ms', 'values_sized', 'value_bytes')
+
+KEY_PREFIX = 'CACHE_TELEMETRY|'
+GENERATION_KEY = KEY_PREFIX + 'generation'
+TIMEOUT = 86400 * 7
+
+# Each process counts locally, and adds its counts to the shared counters in
+# the cache every settings.CACHE_TELEMETRY_INTERVAL seconds. The counts are
+# only approximate: increments can race with background threads, and a
+# process that dies takes its last few seconds of counts with it.
+_pending = {}
+_last_flush = time.time()
+
+def record(cache_obj, field, amount=1):
+    """ Count amount more of field for cache_obj. """
+    if not settings.CACHE_TELEMETRY:
+        return
+    counts = _pending.get(cache_obj.uid)
+    if counts is None:
+        counts = _pending[cache_obj.uid] = dict.fromkeys(FIELDS, 0)
+    counts[field] += amount
+    if time.time() - _last_flush > settings.CACHE_TELEMETRY_INTERVAL:
+        flush()
+
+def record_recompute(cache_obj, seconds):
+    """ Count a recompute of cache_obj that took seconds. """
+    if not settings.CACHE_TELEMETRY:
+        return
+    record(cache_obj, 'recomputes')
+    record(cache_obj, 'recompute_ms', int(seconds * 1000))
+
+# ArgCaches by name, for record_value_size()
+_by_name = {}
+
+def _cache_named(name):
+    cache_obj = _by_name.get(name)
+    if cache_obj is None and len(_by_name) != len(all_caches):
+        _by_name.clear()
+        for obj in all_caches.values():
+            _by_name[obj.name] = obj
+        cache_obj = _by_name.get(name)
+    return cache_obj
+
+def record_value_size(key, size):
+    """
+    Count a value of size bytes pickled for the cache key key.  The
+    memcached_multikey backend calls this with the size it pickled anyway,
+    so values aren't pickled again just to be measured.  Keys that aren't
+    an ArgCache's values are ignored.
+    """
+    if not settings.CACHE_TELEMETRY:
+        return
+    cache_obj = _cache_named(key.split('|', 1)[0])
+    if cache_obj is not None:
+        record(cache_obj, 'values_sized')
+        record(cache_obj, 'value_bytes', size)
+
+def _generation():
+    return cache.get(GENERATION_KEY) or 0
+
+def _key(generation, uid, field):
+    return '%s%d|%s|%s' % (KEY_PREFIX, generation, uid, field)
+
+def _since_key(generation):
+    return '%s%d|since' % (KEY_PREFIX, generation)
+
+def _incr(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Doesn't exist yet, unless someone beat us to it
+        if not cache.add(key, delta, TIMEOUT):
+            cache.incr(key, delta)
+
+def flush():
+    """ Add this process's counts to the shared counters. """
+    global _pending, _last_flush
+    pending, _pending = _pending, {}
+    _last_flush = time.time()
+    if not pending:
+        return
+
+    generation = _generation()
+    cache.add(_since_key(generation), time.time(), TIMEOUT)
+    for uid, counts in pending.items():
+        for field, delta in counts.items():
+            if delta:
+                _incr(_key(generation, uid, field), delta)
+
+atexit.register(flush)
+
+def reset():
+    """ Start counting from zero, in every process. """
+    global _pending
+    _pending = {}
+    if not cache.add(GENERATION_KEY, 1, TIMEOUT):
+        _incr(GENERATION_KEY, 1)
+
+def collected():
+    """
+    Returns (since, rows): when the shared counters were started, and a
+    dict for each registered cache with its counters and some averages.
+    """
+    generation = _generation()
+    uids = all_caches.keys()
+    keys = [_key(generation, uid, field) for uid in uids for field in FIELDS]
+    values = cache.get_many(keys + [_since_key(generation)])
+
+    rows = []
+    for uid in uids:
+        row = {'uid': uid, 'name': all_caches[uid].pretty_name}
+        for field in FIELDS:
+            row[field] = int(values.get(_key(generation, uid, field), 0))
+        lookups = row['hits'] + row['misses']
+        row['hit_rate'] = lookups and float(row['hits']) / lookups
+        row['avg_recompute_ms'] = row['recomputes'] and row['recompute_ms'] / row['recomputes']
+        row['avg_value_bytes'] = row['values_sized'] and row['value_bytes'] / row['values_sized']
+        rows.append(row)
+    rows.sort(key=lambda row: row['name'])
+
+    return values.get(_since_key(generation), None), rows
@@ -0,0 +1,344 @@
+from __future__ import with_statement
+
+import random
+import threading
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from esp.cache import registry, request_memo, telemetry
+from esp.cache.argcache import ArgCache, ArgCacheDecorator
+from esp.cache.invalidation import defer_invalidation, current_batch
+from esp.cache.marinade import marinade_dish
+
+def make_cache(name, params, cache=None):
+    """ Create a throwaway ArgCache after the caches have been locked. """
+    old_locked = registry._caches_locked
+    registry._caches_locked = False
+    try:
+        if cache is None:
+            return ArgCache('%s_%d' % (name, random.randint(0, 999999)), params)
+        # Same name every time, so that caches on different backends share keys
+        return ArgCache(name, params, cache=cache)
+    finally:
+        registry._caches_locked = old_locked
+
+def make_cached_function(func):
+    """ Create an ArgCacheDecorator for func after the caches have been locked. """
+    old_locked = registry._caches_locked
+    registry._caches_locked = False
+    try:
+        return ArgCacheDecorator(func)
+    finally:
+        registry._caches_locked = old_locked
+
+_expensive_calls = []
+def expensive(a):
+    _expensive_calls.append(a)
+    return 'value %s (%d)' % (a, len(_expensive_calls))
+
+def also_expensive(a):
+    _expensive_calls.append(a)
+    return 'value %s (%d)' % (a, len(_expensive_calls))
+
+class HashedTokenTest(TestCase):
+    def setUp(self):
+        self.cache_obj = make_cache('test_hashed', ('a', 'b'))
+        self.cache_obj.hash_tokens(slots=4096)
+        self.a_token = self.cache_obj.get_or_create_token(('a',))
+
+    def test_get_set(self):
+        """ Values round-trip, and are stored with a single digest. """
+        self.cache_obj.set([1, 2], 'foo')
+        self.assertEqual(self.cache_obj.get([1, 2]), 'foo')
+        self.assertEqual(self.cache_obj.get([2, 1]), None)
+        self.assertEqual(len(self.cache_obj.cache.get(self.cache_obj.key([1, 2]))), 2)
+
+    def test_delete_key_set(self):
+        """ Deleting a token only throws out the entries that depend on it. """
+        self.cache_obj.set([1, 2], 'foo')
+        self.cache_obj.set([3, 2], 'bar')
+        self.cache_obj.delete_key_set(a=1)
+        self.assertEqual(self.cache_obj.get([1, 2]), None)
+        if self.cache_obj._slot_key(self.a_token.key([1, 2])) != self.cache_obj._slot_key(self.a_token.key([3, 2])):
+            self.assertEqual(self.cache_obj.get([3, 2]), 'bar')
+
+    def test_lost_counter(self):
+        """ An entry whose slot counter is gone from the cache isn't trusted. """
+        self.cache_obj.set([1, 2], 'foo')
+        for skey in self.cache_obj._slot_keys([1, 2]):
+            self.cache_obj.cache.delete(skey)
+        self.cache_obj.delete_key_set(a=1)
+        self.assertEqual(self.cache_obj.get([1, 2]), None)
+        self.cache_obj.set([1, 2], 'foo')
+        self.assertEqual(self.cache_obj.get([1, 2]), 'foo')
+
+    def test_delete_all(self):
+        self.cache_obj.set([1, 2], 'foo')
+        self.cache_obj.set([3, 2], 'bar')
+        self.cache_obj.delete_all()
+        self.assertEqual(self.cache_obj.get([1, 2]), None)
+        self.assertEqual(self.cache_obj.get([3, 2]), None)
+
+class MultihostHashedTokenTest(TestCase):
+    """ Hashed tokens on the multihost backend, with two of them sharing locmem caches standing in for two web servers """
+    def setUp(self):
+        from django.core.cache.backends.base import BaseCache
+        from django.core.cache.backends.locmem import LocMemCache
+        from esp.utils.memcached_multihost import CacheClass
+        self.locals = [LocMemCache('hashed-host-%d' % i, {}) for i in range(2)]
+        self.hosts = []
+        for local, remote in [self.locals, reversed(self.locals)]:
+            host = CacheClass.__new__(CacheClass)
+            BaseCache.__init__(host, {})
+            host._setup_caches(local, [('remote', remote)], [])
+            self.hosts.append(host)
+        name = 'test_multihost_hashed_%d' % random.randint(0, 999999)
+        self.cache_objs = []
+        for host in self.hosts:
+            cache_obj = make_cache(name, ('a', 'b'), cache=host)
+            cache_obj.hash_tokens(slots=4096)
+            self.cache_objs.append(cache_obj)
+
+    def tearDown(self):
+        for local in self.locals:
+            local.clear()
+
+    def flush(self):
+        for host in self.hosts:
+            host.flush()
+
+    def test_delete_reaches_other_host(self):
+        """ A deletion on one server throws out the entry on the other. """
+        self.cache_objs[1].set([1, 2], 'foo')
+        self.flush()
+        self.assertEqual(self.cache_objs[1].get([1, 2]), 'foo')
+        self.cache_objs[0].delete_key_set(a=1)
+        self.flush()
+        self.assertEqual(self.cache_objs[1].get([1, 2]), None)
+
+    def test_lost_counter(self):
+        """ Deleting a token whose counter was evicted still invalidates on every server. """
+        self.cache_objs[1].set([1, 2], 'foo')
+        self.flush()
+        for skey in self.cache_objs[0]._slot_keys([1, 2]):
+            self.locals[0].delete(self.hosts[0].make_key(skey))
+        self.cache_objs[0].delete_key_set(a=1)
+        self.flush()
+        self.assertEqual(self.cache_objs[1].get([1, 2]), None)
+
+class BatchedLookupTest(TestCase):
+    def setUp(self):
+        self.cache_obj = make_cache('test_batched', ('a', 'b'))
+        self.cache_obj.get_or_create_token(('a',))
+
+    def test_get_many_args(self):
+        self.cache_obj.set_many_args([([1, 2], 'foo'), ([3, 2], 'bar')])
+        self.assertEqual(self.cache_obj.get_many_args([[1, 2], [3, 2], [5, 5]]), ['foo', 'bar', None])
+        self.cache_obj.delete_key_set(a=1)
+        self.assertEqual(self.cache_obj.get_many_args([[1, 2], [3, 2]]), [None, 'bar'])
+
+    def test_hashed_get_many_args(self):
+        self.cache_obj.hash_tokens()
+        self.cache_obj.set_many_args([([1, 2], 'foo'), ([3, 2], 'bar')])
+        self.assertEqual(self.cache_obj.get_many_args([[1, 2], [3, 2], [5, 5]]), ['foo', 'bar', None])
+        self.cache_obj.delete_all()
+        self.assertEqual(self.cache_obj.get_many_args([[1, 2], [3, 2]]), [None, None])
+
+class RequestMemoTest(TestCase):
+    def setUp(self):
+        self.cache_obj = make_cache('test_memo', ('a', 'b'))
+        self.cache_obj.get_or_create_token(('a',))
+        self.cache_obj.memoize_per_request()
+        request_memo.begin_request()
+
+    def tearDown(self):
+        request_memo.end_request()
+
+    def test_memo_hits(self):
+        self.cache_obj.set([1, 2], 'foo')
+        self.assertEqual(self.cache_obj.get([1, 2]), 'foo')
+        self.assertEqual(self.cache_obj.get_many_args([[1, 2]]), ['foo'])
+        self.assertEqual(self.cache_obj.request_hit_count, 2)
+
+    def test_memo_invalidation(self):
+        """ Deletions in this process are seen by the memo right away. """
+        self.cache_obj.set([1, 2], 'foo')
+        self.cache_obj.set([3, 2], 'bar')
+        self.cache_obj.delete_key_set(a=1)
+        self.assertEqual(self.cache_obj.get([1, 2]), None)
+        self.assertEqual(self.cache_obj.get([3, 2]), 'bar')
+        self.cache_obj.delete_all()
+        self.assertEqual(self.cache_obj.get([3, 2]), None)
+
+    def test_outside_request(self):
+        request_memo.end_request()
+        self.cache_obj.set([1, 2], 'foo')
+        self.assertEqual(self.cache_obj.get([1, 2]), 'foo')
+        self.assertEqual(self.cache_obj.request_hit_count, 0)
+
+class DeferredInvalidationTest(TestCase):
+    def setUp(self):
+        self.cache_obj = make_cache('test_deferred', ('a', 'b'))
+        self.cache_obj.get_or_create_token(('a',))
+        self.cache_obj.set_many_args([([1, 2], 'foo'), ([1, 3], 'bar'), ([4, 2], 'baz')])
+
+    def test_deferred(self):
+        """ Deletions wait for the end of the block, but this thread misses right away. """
+        with defer_invalidation():
+            self.cache_obj.delete_key_set(a=1)
+            self.assertEqual(self.cache_obj.get([1, 2]), None)
+            self.assertEqual(self.cache_obj.get_many_args([[1, 3], [4, 2]]), [None, 'baz'])
+            # still in the backend, for everybody else
+            self.assertNotEqual(self.cache_obj.cache.get(self.cache_obj.key([1, 2])), None)
+        self.assertEqual(current_batch(), None)
+        self.assertEqual(self.cache_obj.get_many_args([[1, 2], [1, 3], [4, 2]]), [None, None, 'baz'])
+
+    def test_collapsed(self):
+        """ Only the largest of overlapping deletions is kept. """
+        with defer_invalidation() as batch:
+            self.cache_obj.delete_key_set(a=1, b=2)
+            self.cache_obj.delete_key_set(a=1)
+            self.cache_obj.delete_key_set(a=1, b=3)
+            self.cache_obj.delete_key_set(a=1)
+            groups = batch.pending[self.cache_obj.uid][1]
+            self.assertEqual(sum([len(group) for group in groups.values()]), 1)
+            self.assertEqual(batch.collapsed_count, 1)
+
+    def test_nested(self):
+        with defer_invalidation():
+            with defer_invalidation():
+                self.cache_obj.delete_key_set(a=4)
+            self.assertNotEqual(self.cache_obj.cache.get(self.cache_obj.key([4, 2])), None)
+        self.assertEqual(self.cache_obj.get([4, 2]), None)
+        self.assertEqual(self.cache_obj.get([1, 2]), 'foo')
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.func = make_cached_function(expensive)
+        self.func.single_flight(lock_timeout=30, wait=0.2)
+        self.func.delete_all()
+        self.func.stale_hit_count = self.func.wait_hit_count = 0
+        self.lock_key = self.func.key([1]) + '|LOCK'
+        del _expensive_calls[:]
+
+    def test_stale(self):
+        """ While someone else is recomputing, we get the old value. """
+        self.assertEqual(self.func(1), 'value 1 (1)')
+        self.func.delete_all()
+        self.func.cache.add(self.lock_key, 1, 30)
+        self.assertEqual(self.func(1), 'value 1 (1)')
+        self.assertEqual(self.func.stale_hit_count, 1)
+        self.func.cache.delete(self.lock_key)
+        self.assertEqual(self.func(1), 'value 1 (2)')
+        self.assertEqual(self.func.cache.get(self.lock_key), None)
+
+    def test_give_up_waiting(self):
+        """ With nothing to fall back on, we wait, then compute it anyway. """
+        self.func.cache.add(self.lock_key, 1, 30)
+        self.assertEqual(self.func(1), 'value 1 (1)')
+        self.assertEqual(len(_expensive_calls), 1)
+        self.assertEqual(self.func.stale_hit_count + self.func.wait_hit_count, 0)
+        self.func.cache.delete(self.lock_key)
+
+class ServeStaleTest(TestCase):
+    def setUp(self):
+        self.func = make_cached_function(also_expensive)
+        self.func.serve_stale(grace=60)
+        self.func.delete_all()
+        self.func.stale_hit_count = self.func.background_refresh_count = 0
+        del _expensive_calls[:]
+
+    def wait_for_refresh(self):
+        for thread in threading.enumerate():
+            if thread.getName() == 'refresh %s' % self.func.name:
+                thread.join()
+
+    def test_serve_stale(self):
+        """ Invalidated values are served while they're refreshed in the background. """
+        self.assertEqual(self.func(1), 'value 1 (1)')
+        self.func.delete_all()
+        self.assertEqual(self.func(1), 'value 1 (1)')
+        self.assertEqual(self.func.stale_hit_count, 1)
+        self.wait_for_refresh()
+        self.assertEqual(self.func.background_refresh_count, 1)
+        self.assertEqual(self.func(1), 'value 1 (2)')
+        self.assertEqual(len(_expensive_calls), 2)
+        self.assertEqual(self.func.cache.get(self.func._lock_key([1])), None)
+
+    def test_someone_else_refreshing(self):
+        """ No background refresh starts while someone else holds the single-flight lock. """
+        self.assertEqual(self.func(3), 'value 3 (1)')
+        self.func.delete_all()
+        lock_key = self.func._lock_key([3])
+        self.func.cache.add(lock_key, 1, 60)
+        try:
+            self.assertEqual(self.func(3), 'value 3 (1)')
+            self.wait_for_refresh()
+            self.assertEqual(self.func.background_refresh_count, 0)
+            self.assertEqual(len(_expensive_calls), 1)
+        finally:
+            self.func.cache.delete(lock_key)
+            self.func.cache.delete(self.func.key([3]) + '|STALE')
+
+    def test_nothing_stale(self):
+        """ Without an old value, callers compute it themselves. """
+        self.assertEqual(self.func(2), 'value 2 (1)')
+        self.assertEqual(self.func.stale_hit_count, 0)
+
+class TelemetryTest(TestCase):
+    def setUp(self):
+        self.cache_obj = make_cache('test_telemetry', ('a', 'b'))
+        self.cache_obj.get_or_create_token(('a',))
+        telemetry.reset()
+
+    def test_collected(self):
+        """ Counts show up for everyone once they're flushed. """
+        self.cache_obj.get([1, 2])
+        self.cache_obj.set([1, 2], 'foo')
+        self.cache_obj.get([1, 2])
+        self.cache_obj.delete_key_set(a=1)
+        telemetry.flush()
+        since, rows = telemetry.collected()
+        self.assertNotEqual(since, None)
+        row = [row for row in rows if row['uid'] == self.cache_obj.uid][0]
+        self.assertEqual((row['hits'], row['misses'], row['invalidations']), (1, 1, 1))
+        self.assertEqual(row['hit_rate'], 0.5)
+
+        telemetry.reset()
+        since, rows = telemetry.collected()
+        row = [row for row in rows if row['uid'] == self.cache_obj.uid][0]
+        self.assertEqual(row['hits'], 0)
+
+    def test_value_size(self):
+        """ Sizes reported by the cache backend are counted against the cache owning the key. """
+        telemetry.record_value_size(self.cache_obj.key([1, 2]), 100)
+        telemetry.record_value_size(self.cache_obj.key([3, 4]), 300)
+        telemetry.record_value_size('TOKEN__' + self.cache_obj.key([1, 2]), 5000)
+        telemetry.flush()
+        since, rows = telemetry.collected()
+        row = [row for row in rows if row['uid'] == self.cache_obj.uid][0]
+        self.assertEqual((row['values_sized'], row['avg_value_bytes']), (2, 200))
+
+class FingerprintTest(TestCase):
+    def test_queryset(self):
+        """ QuerySets are fingerprinted without running them. """
+        qs = User.objects.filter(id__in=[1, 2, 3])
+        self.assertNumQueries(0, lambda: marinade_dish(qs, fingerprint=True))
+        self.assertEqual(marinade_dish(qs, fingerprint=True), marinade_dish(User.objects.filter(id__in=[1, 2, 3]), fingerprint=True))
+        self.assertNotEqual(marinade_dish(qs, fingerprint=True), marinade_dish(User.objects.filter(id__in=[1, 2]), fingerprint=True))
+        self.assertNotEqual(marinade_dish(User.objects.none(), fingerprint=True), None)
+
+    def test_long_list(self):
+        short_list = [1, 2, 3]
+        long_list = range(1000)
+        self.assertEqual(marinade_dish(short_list, fingerprint=True), marinade_dish(short_list))
+        self.assertEqual(len(marinade_dish(long_list, fingerprint=True)), 35)
+        self.assertNotEqual(marinade_dish(long_list, fingerprint=True), marinade_dish(range(1001), fingerprint=True))
+
+    def test_cache_key(self):
+        cache_obj = make_cache('test_fingerprint', ('a',))
+        cache_obj.fingerprint_keys()
+        cache_obj.set([range(1000)], 'foo')
+        self.assertEqual(cache_obj.get([range(1000)]), 'foo')
+        self.assertTrue(len(cache_obj.key([range(1000)])) < 100)
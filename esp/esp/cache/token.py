@@ -117,7 +117,7 @@ class Token(object):
         # Check if this is a single item...
         if has_wildcard(filt):
             raise ESPError("Tried to delete an argument set with a wildcard.")
-        self.cache.delete(self.key_filt(filt))
+        self.cache_obj.delete_token_key(self.key_filt(filt))
         # Send the signal...
         if send_signal:
             key_set = self.key_set_from_filt(filt)
@@ -2,5 +2,7 @@ from django.conf.urls.defaults import *
 
 urlpatterns = patterns('',
                         (r'^view_all/?$', 'esp.cache.views.view_all'),
+                        (r'^telemetry/?$', 'esp.cache.views.telemetry'),
+                        (r'^telemetry\.json$', 'esp.cache.views.telemetry_json'),
                         (r'^varnish_purge$', 'esp.cache.views.varnish_purge'),
                         )
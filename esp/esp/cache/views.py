@@ -33,17 +33,48 @@ Learning Unlimited, Inc.
   Email: web-team@lists.learningu.org
 """
 
+from datetime import datetime
+
+import simplejson
+
 from esp.cache.registry import all_caches
+from esp.cache.telemetry import collected, reset
 from esp.datatree.models import GetNode
 from esp.users.models import admin_required, UserBit, ESPUser
 from esp.web.util.main import render_to_response
 from esp.cache.varnish import purge_page
-from django.http import HttpResponse
+from django.core.cache import cache as django_cache
+from django.http import HttpResponse, HttpResponseRedirect
+
+def backend_report(method_name):
+    """ This process's stats from the cache backend, if it keeps the ones asked for. """
+    method = getattr(django_cache, method_name, None)
+    if method is None:
+        return []
+    return method()
 
 @admin_required
 def view_all(request):
     return render_to_response('cache/view_all.html', request, GetNode('Q/Web'), {'caches': sorted(all_caches.values(), key=lambda c: c.name)})
 
+@admin_required
+def telemetry(request):
+    """ Statistics for each cache, summed over every process. """
+    if request.method == 'POST' and request.POST.get('reset'):
+        reset()
+        return HttpResponseRedirect(request.path)
+    since, caches = collected()
+    if since is not None:
+        since = datetime.fromtimestamp(since)
+    return render_to_response('cache/telemetry.html', request, GetNode('Q/Web'), {'caches': caches, 'since': since, 'remote_caches': backend_report('remote_stats'), 'stored_sizes': backend_report('size_report'), 'local_tier': backend_report('local_stats')})
+
+@admin_required
+def telemetry_json(request):
+    since, caches = collected()
+    resp = HttpResponse(mimetype='application/json')
+    simplejson.dump({'since': since, 'caches': caches, 'remote_caches': backend_report('remote_stats'), 'stored_sizes': backend_report('size_report'), 'local_tier': backend_report('local_stats')}, resp)
+    return resp
+
 def varnish_purge(request):
     # Authenticate
     if (not request.user or not request.user.is_authenticated() or not ESPUser(request.user).isAdministrator()) and (not UserBit.objects.user_has_verb(request.user, GetNode('V/Administer/Edit/QSD'))):
@@ -35,6 +35,7 @@ Learning Unlimited, Inc.
   Phone: 617-379-0178
   Email: web-team@lists.learningu.org
 """
+import threading
 import time
 
 from django.conf import settings
@@ -49,7 +50,9 @@ from esp.db.fields import AjaxForeignKey
 from esp.datatree.sql.query_utils import *
 from esp.datatree.sql.set_isolation_level import commit_manually
 from esp.datatree.sql.manager import DataTreeManager
+from esp.datatree.uri_cache import uri_cache
 from esp.cache import cache_function
+from esp.utils.memoize import LRUDict
 
 __all__ = ('DataTree', 'GetNode', 'QTree', 'get_lowest_parent', 'StringToPerm', 'PermToString')
 
@@ -71,6 +74,8 @@ class DataTree(models.Model):
 
     # Parameters for the tree
     START_SIZE  = 2
+    # Free slots left in each node by DataTree.objects.create_many(spacing=...), if you want room to grow
+    SPARSE_SPACING = 16
     DELIMITER   = '/'
     ROOT_NODE   = None
     ROOT_NAME   = 'ROOT'
@@ -118,7 +123,9 @@ class DataTree(models.Model):
     def delete(self, recurse = False, superdelete = False):
         " Delete tree nodes. "
         if superdelete:
-            return super(DataTree, self).delete()
+            super(DataTree, self).delete()
+            uri_cache.bump()
+            return
 
         DataTree.objects.fix_tree_if_broken()
 
@@ -138,13 +145,17 @@ class DataTree(models.Model):
         # move all of the tree nodes to the left.
         DataTree.objects._change_ranges(self)
 
-        return super(DataTree, self).delete()
+        super(DataTree, self).delete()
+        uri_cache.bump()
 
 
     def save(self, create_root=False, uri_fix=False, old_save=False, start_size=None, *args, **kwargs):
         " This will save the tree, using the rules of a tree. "
         if old_save:
-            return models.Model.save(self, *args, **kwargs)
+            # Used to rewrite ranges, so other processes have to reload
+            models.Model.save(self, *args, **kwargs)
+            uri_cache.bump()
+            return
 
         if not self.id:
             obj = DataTree.objects.create(name=self.name, friendly_name=self.name, parent=self.parent, start_size=start_size, uri=self.uri)
@@ -161,6 +172,8 @@ class DataTree(models.Model):
                 self.uri_correct=False
 
         self.save_db(*self.SAFE_COLS)
+        if [getattr(old_node, col) for col in self.SAFE_COLS] != [getattr(self, col) for col in self.SAFE_COLS]:
+            uri_cache.bump()
         signals.post_save.send(sender=self.__class__, instance=self, created=False)
 
     def save_db(self, *cols, **kwargs):
@@ -255,6 +268,7 @@ class DataTree(models.Model):
             child.reinsert(top = False)
 
         transaction.commit()        
+        uri_cache.committed()
 
         if top:
             DataTree.unlock()
@@ -383,6 +397,32 @@ class DataTree(models.Model):
             anc = anc.distinct()
         return anc
 
+    # Nodes can't be moved to a new parent, so a node's ancestors never change,
+    # even though the ranges that describe them do.  Remember them for the life of the process.
+    _ancestor_ids = LRUDict(10000)
+    _ancestor_ids_lock = threading.Lock()
+
+    @staticmethod
+    def ancestor_ids(node):
+        " The ids of node and everything above it, as a frozenset. "
+        node_id = getattr(node, 'id', node)
+        DataTree._ancestor_ids_lock.acquire()
+        try:
+            ids = DataTree._ancestor_ids.get(node_id)
+        finally:
+            DataTree._ancestor_ids_lock.release()
+        if ids is None:
+            ids = frozenset(DataTree.objects.filter(QTree(above = node_id)).values_list('id', flat=True))
+            if not ids:
+                # No such node (yet)
+                return ids
+            DataTree._ancestor_ids_lock.acquire()
+            try:
+                DataTree._ancestor_ids[node_id] = ids
+            finally:
+                DataTree._ancestor_ids_lock.release()
+        return ids
+
     def sync_ranges(self):
         node = DataTree.objects.get(id = self.id)
         self.rangestart, self.rangeend = node.rangestart, node.rangeend
@@ -549,7 +589,16 @@ class DataTree(models.Model):
     def get_by_uri(uri, create=False):
         return DataTree.objects.get(uri=uri, create=create)
     get_by_uri.depend_on_model(lambda: DataTree)  # We can't depend on row because the URI of a node will change if its parent's name changes
-    get_by_uri = staticmethod(get_by_uri)
+    # The ArgCache keeps its name; get_by_uri checks this process's uri_cache first.
+    get_by_uri_cached = staticmethod(get_by_uri)
+
+    @staticmethod
+    def get_by_uri(uri, create=False):
+        node = uri_cache.get(uri)
+        if node is None:
+            node = DataTree.get_by_uri_cached(uri, create)
+            uri_cache.remember(uri, node)
+        return node
     
     @staticmethod
     def violating_dup_rangestart(QObject = False):
@@ -667,6 +716,7 @@ class DataTree(models.Model):
             DataTree.shift_many_ranges(ran[0], ran[0] - ran[1]-1, above_base = True, commit_wait = True)
             
         transaction.commit()
+        uri_cache.committed()
         DataTree.unlock()
         
 
@@ -744,12 +794,14 @@ class DataTree(models.Model):
                         "rangestart > (SELECT rangestart FROM %s WHERE id = %s)" + \
                         " AND rangeend <= (SELECT rangeend FROM %s WHERE id = %s)") % \
                            (db_tree, false, db_tree, self.id, db_tree, self.id))
+        uri_cache.bump()
 
         if not commit_wait:
             try:
                 transaction.commit()
             except transaction.TransactionManagementError:
                 pass # We're not actually in a transaction; so don't bother
+            uri_cache.committed()
 
     @classmethod
     def shift_many_ranges(cls, baserange, amount, above_base = True, commit_wait = False):
@@ -805,9 +857,11 @@ class DataTree(models.Model):
 
         for strsql in sql:
             cursor.execute(strsql)
+        uri_cache.bump()
             
         if not commit_wait:
             transaction.commit()
+            uri_cache.committed()
 
     ##################
     # EXCEPTIONS     #
@@ -954,4 +1008,5 @@ def install():
     genTemplate()
 
     transaction.commit()
+    uri_cache.committed()
     transaction.leave_transaction_management()
@@ -42,6 +42,7 @@ from esp.datatree.sql.query_utils import *
 from esp.datatree.sql.set_isolation_level import *
 from esp.datatree.sql.constants import *
 from esp.datatree.sql.transaction import *
+from esp.datatree.uri_cache import uri_cache
 
 __all__ = ('DataTreeManager',)
 
@@ -141,6 +142,7 @@ class DataTreeManager(models.Manager):
         id = self._insert_object(name, friendly_name, parent_id, uri, uri_correct, start_size, id=id, force_insert=True)
 
         transaction.commit()
+        uri_cache.committed()
 
         set_isolation_level(connection, 1)
         node = self.get(id = id)
@@ -150,6 +152,116 @@ class DataTreeManager(models.Manager):
 
         return node
 
+    @commit_manually
+    @serializable
+    def create_many(self, paths, parent=None, spacing=0):
+        """
+        Create many DataTree nodes at once, without shifting the tree for each one.
+
+        paths is a list of URIs relative to parent (the root by default), or of
+        (URI, friendly name) pairs.  Nodes that already exist are left alone;
+        each new subtree gets its range space reserved under its existing parent
+        in one go, and is inserted a level at a time.  spacing is the number of
+        free slots to leave inside every new node (and after each group of new
+        nodes), so that later single inserts fit without shifting anything.
+
+        Returns a dict from each path given to its node.
+        """
+        delimiter = self.model.DELIMITER
+        if parent is None:
+            parent = self.get_root(force_create = True)
+        elif not isinstance(parent, self.model):
+            parent = self.get(id=parent)
+
+        # A trie of the requested nodes: name -> [friendly name, children]
+        trie = {}
+        requested = []
+        for path in paths:
+            if isinstance(path, basestring):
+                path, friendly_name = path, None
+            else:
+                path, friendly_name = path
+            path = path.strip(delimiter)
+            requested.append(path)
+            level = trie
+            pieces = path.split(delimiter)
+            for i, name in enumerate(pieces):
+                entry = level.setdefault(name, [name, {}])
+                if i == len(pieces) - 1 and friendly_name is not None:
+                    entry[0] = friendly_name
+                level = entry[1]
+
+        # Walk down the existing part of the tree, collecting the new subtrees under each node
+        found = {'': parent.id}
+        new_subtrees = []       # (existing node id, its URI, prefix, {name: entry} of new children)
+        pending = [(parent.id, parent.uri, parent.uri_correct, '', trie)]
+        while pending:
+            node_id, node_uri, node_uri_correct, prefix, level = pending.pop()
+            existing = {}
+            for name, id, uri, uri_correct in self.filter(parent=node_id, name__in=level.keys()).values_list('name', 'id', 'uri', 'uri_correct'):
+                existing[name] = (id, uri, uri_correct)
+            new = {}
+            for name, entry in level.items():
+                path = prefix and delimiter.join((prefix, name)) or name
+                if name in existing:
+                    found[path] = existing[name][0]
+                    if entry[1]:
+                        pending.append(existing[name] + (path, entry[1]))
+                else:
+                    new[name] = entry
+            if new:
+                new_subtrees.append((node_id, node_uri, node_uri_correct, prefix, new))
+
+        def width(entry):
+            return max(sum([width(child) for child in entry[1].values()]) + spacing + 2, self.model.START_SIZE)
+
+        cursor = self.__get_cursor()
+        insert_sql = "INSERT INTO %s (name, friendly_name, parent_id, uri, uri_correct, lock_table, range_correct, rangestart, rangeend) VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)" % self.qt
+        for node_id, node_uri, uri_correct, prefix, new in new_subtrees:
+            # The one shift: make room for all of the new nodes under node_id
+            total = sum([width(entry) for entry in new.values()]) + spacing
+            self.new_ranges(node_id, total, get_ranges=False)
+            cursor.execute(sql__get_bounds % {'table': self.qt, 'query': "MAX(upper) + 1"},
+                           [node_id, 0, node_id, 0, node_id])
+            start = cursor.fetchone()[0]
+
+            # Lay out the ranges, then insert them a level at a time
+            level = []
+            for name, entry in sorted(new.items()):
+                level.append((node_id, node_uri, prefix, name, entry, start))
+                start += width(entry)
+            while level:
+                rows = []
+                for level_parent_id, level_parent_uri, level_prefix, name, entry, rangestart in level:
+                    uri = level_parent_uri and delimiter.join((level_parent_uri, name)) or name
+                    rows.append((name, entry[0], level_parent_id, uri, uri_correct, 0, True,
+                                 rangestart, rangestart + width(entry) - 1))
+                cursor.executemany(insert_sql, rows)
+
+                ids = {}
+                for level_parent_id in set([item[0] for item in level]):
+                    names = [item[3] for item in level if item[0] == level_parent_id]
+                    for name, id in self.filter(parent=level_parent_id, name__in=names).values_list('name', 'id'):
+                        ids[(level_parent_id, name)] = id
+
+                next_level = []
+                for level_parent_id, level_parent_uri, level_prefix, name, entry, rangestart in level:
+                    id = ids[(level_parent_id, name)]
+                    path = level_prefix and delimiter.join((level_prefix, name)) or name
+                    found[path] = id
+                    uri = level_parent_uri and delimiter.join((level_parent_uri, name)) or name
+                    child_start = rangestart + 1
+                    for child_name, child_entry in sorted(entry[1].items()):
+                        next_level.append((id, uri, path, child_name, child_entry, child_start))
+                        child_start += width(child_entry)
+                level = next_level
+
+        transaction.commit()
+        uri_cache.committed()
+
+        nodes = self.in_bulk([found[path] for path in requested])
+        return dict((path, nodes[found[path]]) for path in requested)
+
     def rebuild_tree(self):
         # TODO: Implement this.
         raise NotImplementedError("Need to do this ... ")
@@ -188,6 +300,7 @@ class DataTreeManager(models.Manager):
         cursor.execute(sql, [parent_id, 0, parent_id, 0, parent_id])
         result = cursor.fetchone()
         transaction.commit()
+        uri_cache.committed()
         return result[0], result[0] + size - 1
 
     def exists_violators(self, queryset=False, override=False):
@@ -402,6 +515,7 @@ WHERE
 
         cursor = self.__get_cursor()
         cursor.execute(sql, params)
+        uri_cache.bump()
 
     def _get_by_uri(self, uri, create=False, depth=0):
         delimiter = self.model.DELIMITER
@@ -35,6 +35,7 @@ Learning Unlimited, Inc.
   Phone: 617-379-0178
   Email: web-team@lists.learningu.org
 """
+import operator
 from copy import deepcopy
 from django.utils import tree
 
@@ -47,7 +48,7 @@ from django.core.exceptions import FieldError
 
 DataTree = None
 
-__all__ = ('QTree',)
+__all__ = ('QTree', 'merge_ranges', 'QTreeBelowAny')
 
 def _import_datatree():
     global DataTree
@@ -258,3 +259,115 @@ class SubWhereNode(object):
         # We have to implement our own relabel_aliases since this isn't a tuple object.
         if self.cols[0] in change_map:
             self.cols[0] = change_map[self.cols[0]]
+
+
+def merge_ranges(ranges):
+    """
+    Merge (rangestart, rangeend) pairs into the smallest sorted list of disjoint ones
+    covering the same points.  Ranges nested inside others disappear.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(item) for item in merged]
+
+# Above this many merged ranges, the ranges are passed to Postgres as arrays
+# rather than spelled out one OR at a time.
+UNNEST_THRESHOLD = 64
+
+def QTreeBelowAny(field, nodes):
+    """
+    The equivalent of OR-ing together QTree(**{field + '__below': node}) for every node,
+    but as small as it can be made: the nodes' ranges are looked up at once and
+    merged first, so a node below another one costs nothing.  For a long list of
+    ranges on Postgres, they're joined against as a pair of arrays.
+
+    field is the DataTree foreign key to filter on, or '' for DataTree itself.
+    """
+    _import_datatree()
+    prefix = field and field + LOOKUP_SEP or ''
+    ids = set([getattr(node, 'id', node) for node in nodes])
+    if not ids:
+        return Q(**{prefix + 'id': -1})
+    ranges = merge_ranges(DataTree.objects.filter(id__in=ids).values_list('rangestart', 'rangeend'))
+    if not ranges:
+        return Q(**{prefix + 'id': -1})
+
+    if len(ranges) <= UNNEST_THRESHOLD or 'postgresql' not in connection.settings_dict['ENGINE']:
+        return reduce(operator.or_, [Q(**{prefix + 'rangestart__gte': start, prefix + 'rangeend__lte': end})
+                                     for start, end in ranges])
+
+    return Q(QTreeBelowRanges(field, [start for start, end in ranges], [end for start, end in ranges]))
+
+
+class RangesWhereNode(SubWhereNode):
+    """ A SubWhereNode whose query names one table alias, given as
+    cols[0], against each of the other columns. """
+    def as_sql(self, qn, connection):
+        alias = qn(str(self.cols[0]))
+        query = self.query % tuple([item for col in self.cols[1:] for item in (alias, qn(str(col)))])
+        return query, self.params
+
+
+# Stands in for the ranges until the alias of the DataTree table is known
+RANGES_TOKEN = -10171
+RANGES_QUERY = u'EXISTS (SELECT 1 FROM (SELECT unnest(%%s::integer[]) AS rangestart, unnest(%%s::integer[]) AS rangeend) AS ranges ' \
+               u'WHERE %s.%s >= ranges.rangestart AND %s.%s <= ranges.rangeend)'
+
+class QTreeBelowRanges(Q):
+    """
+    Match the DataTree nodes (or the objects whose DataTree foreign key
+    points to one) that are below any of the ranges given as a pair of
+    lists, by joining against them as Postgres arrays.  Used by
+    QTreeBelowAny() for long lists of ranges.
+
+    Like QTree, this lets Django make the joins through a dummy filter,
+    then swaps its own SQL in for it; the node follows the table alias
+    when the query is relabeled, e.g. as a subquery.
+    """
+    def __init__(self, field, starts, ends):
+        # Kept in the children, which are all a Q keeps when copied
+        super(QTreeBelowRanges, self).__init__((field, list(starts), list(ends)))
+
+    def add_to_query(self, query, used_aliases):
+        for field, starts, ends in self.children:
+            prefix = field and field + LOOKUP_SEP or ''
+            query.add_q(Q(**{prefix + 'rangestart': RANGES_TOKEN}))
+            sql = RANGES_QUERY
+            if self.negated:
+                sql = u'NOT ' + sql
+            self._update_where(query.where, sql, [starts, ends])
+
+    def _update_where(self, where, sql, params):
+        if not hasattr(where, 'children'):
+            return
+        for i, child in enumerate(where.children):
+            if hasattr(child, 'as_sql'):
+                self._update_where(child, sql, params)
+                continue
+            constraint, lookup_type, value_annot, value = child
+            if value == RANGES_TOKEN and getattr(getattr(constraint, 'field', None), 'name', None) == 'rangestart':
+                where.children[i] = RangesWhereNode(sql, (constraint.alias, 'rangestart', 'rangeend'), params)
+
+    def _combine(self, other, conn):
+        # As for QTree, wrap this in a plain Q to combine it.
+        if not isinstance(other, Q):
+            raise TypeError(other)
+        obj = Q(deepcopy(self))
+        obj.add(other, conn)
+        return obj
+
+    def __invert__(self):
+        obj = deepcopy(self)
+        obj.negated = not self.negated
+        return obj
+
+    def __rand__(self, other):
+        return self._combine(other, self.AND)
+
+    def __ror__(self, other):
+        return self._combine(other, self.OR)
@@ -60,4 +60,106 @@ class DataTreeTest(TestCase, custom_cache):
 
     def test_random_words(self):    
         assert DataTree.randwordtest(limit=50, quiet=True)
-    
\ No newline at end of file
+    
+    def test_uri_cache(self):
+        """ Test that get_by_uri's in-process cache follows changes to the tree """
+        from esp.datatree.uri_cache import uri_cache
+
+        node = DataTree.get_by_uri("test/uri/cache/node", create=True)
+        hits = uri_cache.hits
+        same = DataTree.get_by_uri("test/uri/cache/node")
+        self.assertEqual(uri_cache.hits, hits + 1)
+        self.assertEqual((same.id, same.rangestart, same.rangeend), (node.id, node.rangestart, node.rangeend))
+
+        # Adding children moves the ranges around; the cached copy should keep up
+        for i in range(20):
+            DataTree.get_by_uri("test/uri/cache/node/child%d" % i, create=True)
+        moved = DataTree.objects.get(id=node.id)
+        same = DataTree.get_by_uri("test/uri/cache/node")
+        self.assertEqual((same.rangestart, same.rangeend), (moved.rangestart, moved.rangeend))
+
+        # Renamed nodes shouldn't be found under their old names
+        parent = DataTree.get_by_uri("test/uri/cache")
+        parent.name = "cache2"
+        parent.save()
+        self.assertRaises(DataTree.DoesNotExist, DataTree.get_by_uri, "test/uri/cache/node")
+        self.assertEqual(DataTree.get_by_uri("test/uri/cache2/node").id, node.id)
+
+        # Other processes only hear about a change once it's committed
+        from django.core.cache import cache
+        from esp.datatree.uri_cache import GENERATION_KEY
+        generation = cache.get(GENERATION_KEY)
+        uri_cache.bump()
+        self.assertEqual(cache.get(GENERATION_KEY), generation)
+        uri_cache.committed()
+        self.assertNotEqual(cache.get(GENERATION_KEY), generation)
+
+        # Saving a node without changing it doesn't tell them anything
+        node = DataTree.get_by_uri("test/uri/cache2/node")
+        uri_cache.committed()
+        generation = cache.get(GENERATION_KEY)
+        node.save()
+        uri_cache.committed()
+        self.assertEqual(cache.get(GENERATION_KEY), generation)
+
+        # Verbs are there from the start
+        verb = DataTree.get_by_uri("V/Flags/Registration/Enrolled", create=True)
+        uri_cache.bump()
+        uri_cache.committed()
+        uri_cache._checked.at = None
+        hits = uri_cache.hits
+        self.assertEqual(DataTree.get_by_uri("V/Flags/Registration/Enrolled").id, verb.id)
+        self.assertEqual(uri_cache.hits, hits + 1)
+
+    def test_create_many(self):
+        """ Test that DataTree.objects.create_many() builds a proper subtree """
+        base = DataTree.get_by_uri("test/create/many", create=True)
+        DataTree.get_by_uri("test/create/many/Existing", create=True)
+        paths = ["Existing/Child", ("New", "A new node")]
+        for i in range(10):
+            paths.append("New/Class%d" % i)
+            for j in range(3):
+                paths.append("New/Class%d/Section%d" % (i, j))
+        nodes = DataTree.objects.create_many(paths, parent=base, spacing=DataTree.SPARSE_SPACING)
+
+        self.assertEqual(len(nodes), len(paths))
+        self.assertEqual(nodes["New"].friendly_name, "A new node")
+        self.assertEqual(nodes["Existing/Child"].parent_id, DataTree.get_by_uri("test/create/many/Existing").id)
+        for path, node in nodes.items():
+            self.assertEqual(DataTree.get_by_uri("test/create/many/" + path).id, node.id)
+            parent = DataTree.objects.get(id=node.parent_id)
+            self.assertTrue(parent.rangestart < node.rangestart <= node.rangeend < parent.rangeend)
+        self.assertEqual(DataTree.objects.filter(uri__startswith="test/create/many/New/").count(), 40)
+
+        # Asking again doesn't make anything new
+        again = DataTree.objects.create_many(paths, parent=base)
+        self.assertEqual(set([node.id for node in again.values()]), set([node.id for node in nodes.values()]))
+
+        # There's room left for a single insert without moving anything
+        root_end = DataTree.root(force_create=True).rangeend
+        section = DataTree.get_by_uri("test/create/many/New/Class3/Section1/Extra", create=True)
+        self.assertEqual(DataTree.root(force_create=True).rangeend, root_end)
+        self.assertEqual(DataTree.objects.get(id=nodes["New"].id).rangeend, nodes["New"].rangeend)
+
+    def test_below_any(self):
+        """ Test that QTreeBelowAny() matches an OR of QTree(below=...) """
+        from django.db.models import Q
+        from esp.datatree.sql import query_utils
+        from esp.datatree.sql.query_utils import QTree, QTreeBelowAny, merge_ranges
+
+        self.assertEqual(merge_ranges([(10, 20), (1, 4), (12, 15), (5, 8), (30, 40), (35, 45)]), [(1, 8), (10, 20), (30, 45)])
+        self.assertEqual(merge_ranges([]), [])
+
+        nodes = [DataTree.get_by_uri("test/below/any/%d/%d" % (i, j), create=True) for i in range(5) for j in range(3)]
+        chosen = [nodes[0], nodes[0].parent, nodes[4], nodes[7], nodes[8], nodes[14]]
+        expected = set(DataTree.objects.filter(reduce(lambda a, b: a | b, [Q(QTree(below=node)) for node in chosen])).values_list('id', flat=True))
+        self.assertEqual(set(DataTree.objects.filter(QTreeBelowAny('', chosen)).values_list('id', flat=True)), expected)
+        self.assertEqual(DataTree.objects.filter(QTreeBelowAny('', [])).count(), 0)
+
+        # The same through the array join, where there is one
+        old_threshold = query_utils.UNNEST_THRESHOLD
+        query_utils.UNNEST_THRESHOLD = 1
+        try:
+            self.assertEqual(set(DataTree.objects.filter(QTreeBelowAny('', chosen)).values_list('id', flat=True)), expected)
+        finally:
+            query_utils.UNNEST_THRESHOLD = old_threshold
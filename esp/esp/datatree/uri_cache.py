@@ -0,0 +1,165 @@
+"""
+In-process cache of DataTree nodes by URI, in front of DataTree.get_by_uri.
+
+GetNode('V/Flags/Registration/Enrolled') and friends run on nearly every
+page, and even when get_by_uri's ArgCache has the node that's a memcached
+round trip, and a query whenever the ArgCache has just been invalidated
+(which is on every DataTree save).  This keeps up to DATATREE_URI_CACHE_SIZE
+rows per process, and fills itself with the whole V/ tree whenever it
+starts afresh, since the verbs are what get looked up by name.
+
+Coherence comes from a generation counter in the shared cache, bumped
+whenever a node's names or ranges change or a node is deleted.  Inside a
+transaction the bump waits until it's over, so no process can load the
+old rows under the new generation: the code that commits calls committed(),
+and otherwise it happens when the request finishes or, in scripts, at the
+next lookup outside the transaction.  Each process checks the counter once
+per request (or every MAX_AGE seconds outside of requests), so a process
+may use a node up to one request stale.
+
+Set DATATREE_URI_CACHE = False to turn it off.
+"""
+
+from __future__ import with_statement
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started, request_finished
+from django.db import transaction
+from esp.utils.memoize import LRUDict
+
+ENABLED = getattr(settings, 'DATATREE_URI_CACHE', True)
+MAX_ITEMS = getattr(settings, 'DATATREE_URI_CACHE_SIZE', 5000)
+MAX_AGE = 5
+
+GENERATION_KEY = 'DATATREE_URI_GENERATION'
+# The part of the tree loaded up front
+WARM_ROOT = 'V'
+
+class UriCache(object):
+    def __init__(self, max_items=MAX_ITEMS):
+        self.enabled = ENABLED
+        self._rows = LRUDict(max_items)
+        self._lock = threading.Lock()
+        self._generation = None
+        #   When this thread last checked the generation, and whether it
+        #   changed the tree in a transaction that hasn't finished
+        self._checked = threading.local()
+        self.hits = self.misses = self.flushes = 0
+        request_started.connect(self._request_started, weak=False)
+        request_finished.connect(self._request_finished, weak=False)
+
+    def _request_started(self, **kwargs):
+        self._checked.at = None
+
+    def _request_finished(self, **kwargs):
+        #   TransactionMiddleware has committed or rolled back by now
+        self.committed()
+
+    @staticmethod
+    def _model():
+        from esp.datatree.models import DataTree
+        return DataTree
+
+    @staticmethod
+    def _columns(model):
+        return [field.attname for field in model._meta.fields]
+
+    def _check_generation(self):
+        """ Start over if some process has changed the tree since we last looked """
+        if getattr(self._checked, 'pending', False) and not transaction.is_managed():
+            self.committed()
+        checked_at = getattr(self._checked, 'at', None)
+        now = time.time()
+        if checked_at is not None and now - checked_at < MAX_AGE:
+            return
+        self._checked.at = now
+        generation = cache.get(GENERATION_KEY)
+        if generation != self._generation or not len(self._rows):
+            if self._generation is not None:
+                self.flushes += 1
+            self.warm(generation)
+
+    def warm(self, generation=None):
+        """ Replace the cache contents with the WARM_ROOT subtree, in one query """
+        model = self._model()
+        columns = self._columns(model)
+        uri_index = columns.index('uri')
+        rows = model.objects.filter(uri__startswith=WARM_ROOT, uri_correct=True).values_list(*columns)
+        with self._lock:
+            self._rows.clear()
+            for row in rows:
+                uri = row[uri_index]
+                if uri == WARM_ROOT or uri.startswith(WARM_ROOT + model.DELIMITER):
+                    self._rows[uri] = row
+            self._generation = generation
+
+    def get(self, uri):
+        """ The node at uri, or None if it isn't cached """
+        if not self.enabled:
+            return None
+        self._check_generation()
+        if getattr(self._checked, 'pending', False):
+            #   This thread's changes aren't for the other threads to see yet
+            return None
+        model = self._model()
+        with self._lock:
+            row = self._rows.get(uri.strip(model.DELIMITER))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return model(*row)
+
+    def remember(self, uri, node):
+        if not self.enabled or not node.uri_correct or node.uri != uri.strip(node.DELIMITER):
+            return
+        if getattr(self._checked, 'pending', False):
+            return
+        row = tuple([getattr(node, column) for column in self._columns(node)])
+        with self._lock:
+            self._rows[node.uri] = row
+
+    def bump(self):
+        """
+        Tell every process, this one included, that the tree has changed.
+        Inside a transaction, the other processes are only told once it's committed.
+        """
+        with self._lock:
+            self._rows.clear()
+            self._generation = None
+        if transaction.is_managed():
+            self._checked.pending = True
+        else:
+            self._publish()
+
+    def committed(self):
+        """ Publish the changes this thread made to the tree, now that they're committed """
+        if getattr(self._checked, 'pending', False):
+            self._checked.pending = False
+            self._publish()
+
+    def _publish(self):
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            #   Start somewhere no process can have seen before, in case the counter was evicted
+            generation = int(time.time() * 1000)
+            if not cache.add(GENERATION_KEY, generation, timeout=0):
+                generation = cache.incr(GENERATION_KEY)
+        with self._lock:
+            self._rows.clear()
+            self._generation = generation
+
+    def stats(self):
+        return {
+            'items': len(self._rows),
+            'hits': self.hits,
+            'misses': self.misses,
+            'flushes': self.flushes,
+        }
+
+uri_cache = UriCache()
@@ -35,7 +35,7 @@ Learning Unlimited, Inc.
 from django.contrib import admin
 from esp.admin import admin_site
 
-from esp.dbmail.models import MessageVars, EmailList, PlainRedirect, MessageRequest, TextOfEmail
+from esp.dbmail.models import MessageVars, EmailList, PlainRedirect, MessageRequest, TextOfEmail, ListMembershipChange
 
 
 class MessageVarsAdmin(admin.ModelAdmin):
@@ -59,3 +59,9 @@ admin_site.register(MessageRequest, MessageRequestAdmin)
 class TextOfEmailAdmin(admin.ModelAdmin):
     pass
 admin_site.register(TextOfEmail, TextOfEmailAdmin)
+
+class ListMembershipChangeAdmin(admin.ModelAdmin):
+    list_display = ('list_name', 'address', 'action', 'created', 'attempts', 'next_attempt', 'done')
+    list_filter = ('action', 'done')
+    search_fields = ('list_name', 'address')
+admin_site.register(ListMembershipChange, ListMembershipChangeAdmin)
@@ -93,15 +93,27 @@ MessageRequest """
         user_msgs = { }
         textreqs = []
 
-        for emailreq in emailreqs:
-            # Default node is Q/Event, because we're not always associating events with nodes.  That should probably change.
+        # Default node is Q/Event, because we're not always associating events with nodes.  That should probably change.
+        def category(emailreq):
             if emailreq.msgreq.category == None:
-                node = GetNode('Q/Event')
+                return GetNode('Q/Event')
             else:
-                node = emailreq.msgreq.category
+                return emailreq.msgreq.category
+
+        # Look up who wants digests on each node all at once, rather than per recipient
+        emailreqs = list(emailreqs)
+        targets = {}
+        for emailreq in emailreqs:
+            targets.setdefault(category(emailreq).id, set()).add(emailreq.target)
+        wants_digest = {}
+        for node_id, node_targets in targets.iteritems():
+            wants_digest[node_id] = UserBit.objects.bulk_user_has_perms(node_targets, node_id, GetNode('V/Digest'))
+
+        for emailreq in emailreqs:
+            node = category(emailreq)
 
             # If the user wants digests on the specified node, queue this message for digest
-            if UserBit.UserHasPerms(emailreq.target, node, GetNode('V/Digest')):
+            if wants_digest[node.id][emailreq.target.id]:
                 # Only queue if we're dealing with digests right now
                 if self.force_digest:
                     if not user_msgs.has_key(emailreq.target):
@@ -444,6 +444,32 @@ class PlainRedirect(models.Model):
         ordering=('original',)
 
 
+class ListMembershipChange(models.Model):
+    """ A change to the membership of a Mailman list, queued by
+    esp.mailman.queue_list_member() and friends so that registration
+    doesn't wait on Mailman.  esp.mailman.sync_list_members() makes them. """
+
+    ADD = 'add'
+    REMOVE = 'remove'
+    ACTION_CHOICES = ((ADD, 'Add'), (REMOVE, 'Remove'))
+
+    list_name = models.CharField(max_length=255)
+    address = models.CharField(max_length=1024)  # As add_members takes it: foo@bar.com or "Name <foo@bar.com>"
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES)
+    created = models.DateTimeField(default=datetime.now)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=datetime.now, db_index=True)
+    claimed_until = models.DateTimeField(null=True, default=None)  # Like MessageRequest.processed_by
+    done = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    def __unicode__(self):
+        return '%s %s on %s' % (self.action, self.address, self.list_name)
+
+    class Meta:
+        ordering = ('id',)
+
+
 # Adapted from http://www.djangosnippets.org/snippets/735/
 class CustomSMTPBackend(SMTPEmailBackend):
     """ Simple override of Django's default backend to allow a Return-Path to be specified """
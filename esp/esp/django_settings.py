@@ -143,6 +143,11 @@ LANGUAGE_CODE = 'en-us'
 # Default cache timeout in seconds
 DEFAULT_CACHE_TIMEOUT = 86400
 
+# Whether to collect cache statistics across processes (see /cache/telemetry),
+# and how often in seconds each process adds its counts to the shared ones
+CACHE_TELEMETRY = True
+CACHE_TELEMETRY_INTERVAL = 60
+
 SITE_ID = 1
 
 TEMPLATE_LOADERS = (
@@ -158,6 +163,7 @@ TEMPLATE_LOADERS = (
 # Set MIDDLEWARE_LOCAL in local_settings.py to configure this
 MIDDLEWARE_GLOBAL = [
     ( 100, 'esp.middleware.threadlocalrequest.ThreadLocals'),
+    ( 110, 'esp.cache.middleware.RequestMemoMiddleware'),
    #( 100, 'django.middleware.http.SetRemoteAddrFromForwardedFor'),
    #( 200, 'esp.queue.middleware.QueueMiddleware'),
     ( 300, 'esp.middleware.FixIEMiddleware'),
@@ -170,7 +176,7 @@ MIDDLEWARE_GLOBAL = [
     (1050, 'django.middleware.csrf.CsrfViewMiddleware'),
     (1100, 'django.middleware.doc.XViewMiddleware'),
     #(1150, 'sslauth.middleware.SSLAuthMiddleware'),
-    (1200, 'django.middleware.gzip.GZipMiddleware'),
+    (1200, 'esp.middleware.gzipmiddleware.GZipMiddleware'),
     (1300, 'esp.middleware.PrettyErrorEmailMiddleware'),
     (1400, 'esp.middleware.StripWhitespaceMiddleware'),
     (1500, 'django.middleware.transaction.TransactionMiddleware'),
@@ -1,12 +1,15 @@
 from __future__ import with_statement
 
 import os
+from collections import defaultdict
+from datetime import datetime, timedelta
 from subprocess import call, Popen, PIPE
 from esp.settings import USE_MAILMAN, PROJECT_ROOT
 from esp.utils.decorators import enable_with_setting
 from esp.users.models import ESPUser, User
 from tempfile import NamedTemporaryFile
 from django.contrib.auth.models import User
+from django.db import connection, transaction
 from django.db.models import Q
 
 
@@ -17,6 +20,20 @@ else:
     MAILMAN_PASSWORD = ''
     MM_PATH = "/usr/sbin/"
 
+## Tuning for the queue of list membership changes; see sync_list_members()
+SYNC_BATCH_SIZE = 500
+SYNC_CLAIM_SECONDS = 300
+SYNC_BACKOFF_SECONDS = 60
+SYNC_MAX_BACKOFF_SECONDS = 6 * 3600
+SYNC_MAX_ATTEMPTS = 10
+
+class MailmanError(Exception):
+    pass
+
+class NoSuchListError(MailmanError):
+    """ Mailman doesn't have the list; trying again won't help """
+    pass
+
 ## Functions for Mailman interop
 
 @enable_with_setting(USE_MAILMAN)
@@ -155,6 +172,153 @@ def remove_list_member(list, member):
 
     return Popen([MM_PATH + "remove_members", "--file=-", list], stdin=PIPE, stdout=PIPE, stderr=PIPE).communicate(str(member))
 
+def _member_addresses(member):
+    """ The addresses in 'member', taken as add_list_member() takes it """
+    if isinstance(member, User):
+        return [member.email]
+    if hasattr(member, "filter"):
+        return [x.email for x in member]
+    if isinstance(member, basestring):
+        return [member]
+    return list(member)
+
+def _queue_change(action, list, member):
+    return queue_list_changes([(action, list, member)])
+
+def queue_list_changes(changes):
+    """
+    Queue many list membership changes with one INSERT.  'changes' is a
+    list of (action, list, member) tuples, where action is 'add' or
+    'remove' and member is anything add_list_member() takes.
+    """
+    #   Checked here rather than with enable_with_setting, so that scripts can turn it on
+    if not USE_MAILMAN:
+        return False
+    from esp.dbmail.models import ListMembershipChange
+    now = datetime.now()
+    params = []
+    for action, list_name, member in changes:
+        for address in _member_addresses(member):
+            params += [list_name, address, action, now, now]
+    if params:
+        cursor = connection.cursor()
+        cursor.execute('INSERT INTO "%s" ("list_name", "address", "action", "created", "attempts", "next_attempt", "last_error") VALUES ' % ListMembershipChange._meta.db_table
+                       + ', '.join(["(%s, %s, %s, %s, 0, %s, '')"] * (len(params) / 5)), params)
+        transaction.commit_unless_managed()
+    return True
+
+def queue_list_member(list, member):
+    """
+    Like add_list_member(), but queues the change for sync_list_members()
+    instead of running Mailman now.  The change is saved in the current
+    transaction, so it's only made if that commits.
+    """
+    from esp.dbmail.models import ListMembershipChange
+    return _queue_change(ListMembershipChange.ADD, list, member)
+
+def queue_remove_list_member(list, member):
+    """ Like remove_list_member(), but queued; see queue_list_member(). """
+    from esp.dbmail.models import ListMembershipChange
+    return _queue_change(ListMembershipChange.REMOVE, list, member)
+
+_member_scripts = {
+    'add': ("add_members", "--regular-members-file=-"),
+    'remove': ("remove_members", "--file=-"),
+}
+
+def _run_member_script(action, list, addresses):
+    """ Add or remove all of these addresses with one Mailman command; raises MailmanError if it fails,
+    or NoSuchListError if the list doesn't exist """
+    script, file_arg = _member_scripts[action]
+    data = "\n".join(addresses)
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    try:
+        process = Popen([MM_PATH + script, file_arg, list], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        output = process.communicate(data)
+    except OSError, e:
+        raise MailmanError("Couldn't run %s: %s" % (script, e))
+    if process.returncode != 0:
+        if output[1].startswith('No such list'):
+            raise NoSuchListError(output[1].strip())
+        raise MailmanError("%s %s exited with status %d: %s" % (script, list, process.returncode, output[1] or output[0]))
+    return output
+
+def _supersede_changes(ids):
+    """ Mark done every unfinished change to the lists and addresses of
+    these changes that a newer change to the same address replaces. """
+    from esp.dbmail.models import ListMembershipChange
+    table = ListMembershipChange._meta.db_table
+    cursor = connection.cursor()
+    cursor.execute('UPDATE "%(table)s" SET "done" = %%s, "claimed_until" = NULL, "last_error" = %%s '
+                   'WHERE "done" IS NULL '
+                   'AND ("list_name", LOWER("address")) IN (SELECT "list_name", LOWER("address") FROM "%(table)s" WHERE "id" IN %%s) '
+                   'AND EXISTS (SELECT 1 FROM "%(table)s" AS "newer" WHERE "newer"."list_name" = "%(table)s"."list_name" '
+                   'AND LOWER("newer"."address") = LOWER("%(table)s"."address") AND "newer"."id" > "%(table)s"."id")' % {'table': table},
+                   [datetime.now(), 'Superseded by a later change', tuple(ids)])
+
+@transaction.autocommit
+def sync_list_members(batch_size=SYNC_BATCH_SIZE):
+    """
+    Make a batch of the queued list membership changes, running Mailman once
+    per list for all of that list's adds and once for all of its removes.
+    When an address has several changes, the latest one wins: older ones,
+    whether pending, waiting for a retry or given up on, are marked done
+    without being made, in this batch or any other.
+
+    Changes to lists that don't exist, like the lists of most classes, are
+    marked done with the error.  If Mailman fails for a list some other way,
+    that list's changes are retried later, waiting twice as long each time,
+    and given up on after SYNC_MAX_ATTEMPTS tries; they stay in the table
+    with their last error.
+
+    Returns the number of changes claimed, so callers can loop until it's 0.
+    """
+    if not USE_MAILMAN:
+        return 0
+    from esp.dbmail.models import ListMembershipChange
+
+    #   Claim a batch, the way process_messages() does
+    now = datetime.now()
+    pending = ListMembershipChange.objects.filter(done__isnull=True, next_attempt__lte=now, attempts__lt=SYNC_MAX_ATTEMPTS)
+    pending = pending.filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now))
+    ids = list(pending.values_list('id', flat=True)[:batch_size])
+    claim = now + timedelta(seconds=SYNC_CLAIM_SECONDS)
+    pending.filter(id__in=ids).update(claimed_until=claim)
+    if ids:
+        _supersede_changes(ids)
+    changes = ListMembershipChange.objects.filter(id__in=ids, claimed_until=claim)
+
+    by_list = defaultdict(list)
+    for change in changes:
+        by_list[change.list_name].append(change)
+
+    for list_name, list_changes in by_list.iteritems():
+        latest = {}
+        for change in list_changes:
+            latest[change.address.lower()] = change
+        removes = [x.address for x in latest.itervalues() if x.action == ListMembershipChange.REMOVE]
+        adds = [x.address for x in latest.itervalues() if x.action == ListMembershipChange.ADD]
+        try:
+            if removes:
+                _run_member_script('remove', list_name, removes)
+            if adds:
+                _run_member_script('add', list_name, adds)
+        except NoSuchListError, e:
+            ListMembershipChange.objects.filter(id__in=[x.id for x in list_changes]).update(done=datetime.now(), claimed_until=None, last_error=unicode(e))
+        except MailmanError, e:
+            for change in list_changes:
+                backoff = min(SYNC_BACKOFF_SECONDS * 2 ** change.attempts, SYNC_MAX_BACKOFF_SECONDS)
+                change.attempts += 1
+                change.next_attempt = datetime.now() + timedelta(seconds=backoff)
+                change.claimed_until = None
+                change.last_error = unicode(e)
+                change.save()
+        else:
+            ListMembershipChange.objects.filter(id__in=[x.id for x in list_changes]).update(done=datetime.now(), claimed_until=None)
+
+    return len(ids)
+
 @enable_with_setting(USE_MAILMAN)
 def list_contents(lst):
     """ Return the list of e-mail addresses on the specified mailing list """
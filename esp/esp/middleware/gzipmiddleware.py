@@ -0,0 +1,13 @@
+from django.middleware.gzip import GZipMiddleware as DjangoGZipMiddleware
+
+class GZipMiddleware(DjangoGZipMiddleware):
+    """
+    Django's GZipMiddleware, except that it leaves streaming responses
+    (see esp.utils.json_stream) alone: they compress themselves when the
+    client allows it, and reading their content here would build the
+    whole body in memory.
+    """
+    def process_response(self, request, response):
+        if getattr(response, 'streaming', False):
+            return response
+        return super(GZipMiddleware, self).process_response(request, response)
@@ -162,10 +162,23 @@ admin_site.register(RegistrationType, Admin_RegistrationType)
 def expire_student_registrations(modeladmin, request, queryset):
     for reg in queryset:
         reg.expire()
+    #   Changes made here don't go through reserve_seat() and release_seat()
+    ClassSection.reconcile_seats(set(queryset.values_list('section', flat=True)))
 class StudentRegistrationAdmin(admin.ModelAdmin):
     list_display = ('id', 'section', 'user', 'relationship', 'start_date', 'end_date', )
     actions = [ expire_student_registrations, ]
     search_fields = ['user__last_name', 'user__first_name', 'user__email', 'id', 'section__id']
+
+    def save_model(self, request, obj, form, change):
+        old_section_id = None
+        if change:
+            old_section_id = StudentRegistration.objects.filter(id=obj.id).values_list('section', flat=True)[0]
+        super(StudentRegistrationAdmin, self).save_model(request, obj, form, change)
+        ClassSection.reconcile_seats(set([obj.section_id, old_section_id]) - set([None]))
+
+    def delete_model(self, request, obj):
+        super(StudentRegistrationAdmin, self).delete_model(request, obj)
+        ClassSection.reconcile_seats([obj.section_id])
 admin_site.register(StudentRegistration, StudentRegistrationAdmin)
 
 def sec_classrooms(obj):
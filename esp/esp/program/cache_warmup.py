@@ -0,0 +1,232 @@
+""" Filling a program's caches before registration opens. """
+__author__    = "Individual contributors (see AUTHORS file)"
+__date__      = "$DATE$"
+__rev__       = "$REV$"
+__license__   = "AGPL v.3"
+__copyright__ = """
+This file is part of the ESP Web Site
+Copyright (c) 2009 by the individual contributors
+  (see AUTHORS file)
+
+The ESP Web Site is free software; you can redistribute it and/or
+modify it under the terms of the GNU Affero General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public
+License along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+Contact information:
+MIT Educational Studies Program
+  84 Massachusetts Ave W20-467, Cambridge, MA 02139
+  Phone: 617-253-4882
+  Email: esp-webmasters@mit.edu
+Learning Unlimited, Inc.
+  527 Franklin St, Cambridge, MA 02139
+  Phone: 617-379-0178
+  Email: web-team@lists.learningu.org
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+__all__ = ['warm_program_caches', 'last_report', 'request_warmup', 'warmup_requested', 'run_requested_warmups', 'WARMERS']
+
+# The last report for each program, so the admin page can show it
+REPORT_KEY = 'CACHE_WARMUP__%d'
+REPORT_TIMEOUT = 86400 * 7
+
+# Set while a warm-up runs, and renewed as each task finishes, so that a
+# run that dies stops blocking new ones after RUNNING_TIMEOUT seconds
+RUNNING_KEY = 'CACHE_WARMUP_RUNNING__%d'
+RUNNING_TIMEOUT = 600
+
+# Tag on a program whose warm-up has been asked for from the admin page
+REQUEST_TAG = 'cache_warmup_requested'
+
+# Number of objects handled by each task
+CHUNK_SIZE = 25
+
+def _chunks(items):
+    items = list(items)
+    return [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+
+#   Each warmer is given a program and a chunk of the items listed for it,
+#   and fills the caches named by its label for those items.
+
+def _catalog_items(prog):
+    return [None]
+def _warm_catalog(prog, items):
+    from esp.program.models import ClassSubject
+    ClassSubject.objects.catalog(prog)
+
+def _module_items(prog):
+    return [None] + list(prog.program_modules.values_list('module_type', flat=True).distinct())
+def _warm_modules(prog, items):
+    for tl in items:
+        prog.getModules_cached(tl)
+        prog.getModuleViews(tl=tl)
+
+def _class_items(prog):
+    return prog.classes().values_list('id', flat=True)
+def _warm_classes(prog, items):
+    from esp.program.models import ClassSubject
+    from esp.program.templatetags.class_render import render_class_direct
+    for cls in ClassSubject.objects.filter(id__in=items):
+        render_class_direct(cls)
+        cls.title()
+        cls.teachers()
+
+def _section_items(prog):
+    return prog.sections().values_list('id', flat=True)
+def _warm_sections(prog, items):
+    from esp.program.models import ClassSection
+    for sec in ClassSection.objects.filter(id__in=items):
+        sec._get_capacity()
+        sec.num_students()
+
+def _qsd_items(prog):
+    from esp.qsd.models import QuasiStaticData
+    anchor = prog.anchor
+    return QuasiStaticData.objects.filter(path__rangestart__gte=anchor.rangestart, path__rangeend__lte=anchor.rangeend).values_list('path', 'name').distinct()
+def _warm_qsd(prog, items):
+    from esp.datatree.models import DataTree
+    from esp.qsd.models import QuasiStaticData
+    for path_id, name in items:
+        qsd = QuasiStaticData.objects.get_by_path__name(DataTree.objects.get(id=path_id), name)
+        if qsd is not None:
+            qsd.html()
+
+# Cached views on program modules that take just the program
+MODULE_VIEW_CACHES = ('ajax_sections_cached', 'ajax_schedule_assignments_cached', 'ajax_resources_cached', 'catalog_status_cached')
+def _warm_module_views(prog, items):
+    for module in prog.getModules_cached():
+        for name in MODULE_VIEW_CACHES:
+            if hasattr(module, name):
+                getattr(module, name)(prog)
+
+def _warm_student_counts(prog, items):
+    prog.student_counts_by_section_id()
+
+# (label, items, warmer), in stages: everything in one stage runs in
+# parallel, and each stage waits for the one before it.
+WARMERS = [
+    [('ClassSubject.objects.catalog', _catalog_items, _warm_catalog),
+     ('Program.getModules_cached / getModuleViews', _module_items, _warm_modules)],
+    [('render_class_direct / render_class_core', _class_items, _warm_classes),
+     ('ClassSection._get_capacity / num_students', _section_items, _warm_sections),
+     ('QuasiStaticData.html', _qsd_items, _warm_qsd),
+     ('module views (ajax_sections_cached, ...)', _catalog_items, _warm_module_views)],
+    [('Program.student_counts_by_section_id', _catalog_items, _warm_student_counts)],
+]
+_warmers_by_label = dict([(label, warmer) for stage in WARMERS for label, items, warmer in stage])
+
+def _run_task(task):
+    """ Runs one task, in whatever process; returns (label, count, seconds, error). """
+    from esp.program.models import Program
+    label, program_id, items = task
+    start = time.time()
+    try:
+        _warmers_by_label[label](Program.objects.get(id=program_id), items)
+        error = None
+    except Exception, e:
+        error = '%s: %s' % (e.__class__.__name__, e)
+    return (label, len(items), time.time() - start, error)
+
+def warm_program_caches(prog, processes=4):
+    """
+    Fill the caches for every class, section, QSD page and module view
+    of prog, using `processes` worker processes (or just this one, if 1).
+
+    Returns a report: a list of dicts with the label, number of items,
+    total seconds spent and any errors for each warmer, plus the
+    wall-clock time of the whole run. The report is also saved for
+    last_report().
+    """
+    start = time.time()
+    running = {'running': True, 'started': start}
+    cache.set(RUNNING_KEY % prog.id, running, RUNNING_TIMEOUT)
+
+    pool = None
+    if processes > 1:
+        import multiprocessing
+        # Don't share our database and cache connections with the workers
+        connection.close()
+        cache.close()
+        pool = multiprocessing.Pool(processes)
+
+    rows = {}
+    try:
+        for stage in WARMERS:
+            tasks = []
+            for label, items, warmer in stage:
+                rows[label] = {'label': label, 'items': 0, 'seconds': 0.0, 'errors': []}
+                for chunk in _chunks(items(prog)):
+                    tasks.append((label, prog.id, chunk))
+            if pool:
+                results = pool.imap_unordered(_run_task, tasks)
+            else:
+                results = (_run_task(task) for task in tasks)
+            for label, count, seconds, error in results:
+                rows[label]['items'] += count
+                rows[label]['seconds'] += seconds
+                if error:
+                    rows[label]['errors'].append(error)
+                cache.set(RUNNING_KEY % prog.id, running, RUNNING_TIMEOUT)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        cache.delete(RUNNING_KEY % prog.id)
+
+    report = {
+        'running': False,
+        'started': start,
+        'seconds': time.time() - start,
+        'processes': processes,
+        'rows': [rows[label] for stage in WARMERS for label, items, warmer in stage],
+    }
+    cache.set(REPORT_KEY % prog.id, report, REPORT_TIMEOUT)
+    return report
+
+def last_report(prog):
+    """ Returns the report of the last warm-up of prog's caches, or of the
+    one running now ({'running': True, 'started': ...}), or None. """
+    return cache.get(RUNNING_KEY % prog.id) or cache.get(REPORT_KEY % prog.id)
+
+def request_warmup(prog):
+    """ Ask for prog's caches to be warmed up by run_requested_warmups(). """
+    from esp.tagdict.models import Tag
+    Tag.setTag(REQUEST_TAG, target=prog)
+
+def warmup_requested(prog):
+    """ Is a warm-up of prog's caches waiting to be run? """
+    from esp.tagdict.models import Tag
+    return bool(Tag.getTag(REQUEST_TAG, target=prog))
+
+def run_requested_warmups(processes=4):
+    """ Warm up the caches of each program that request_warmup() was
+    called for.  Run from cache_warmup_cron.py; returns the programs. """
+    from django.contrib.contenttypes.models import ContentType
+    from esp.program.models import Program
+    from esp.tagdict.models import Tag
+    programs = []
+    requests = Tag.objects.filter(key=REQUEST_TAG, content_type=ContentType.objects.get_for_model(Program))
+    for program_id in requests.values_list('object_id', flat=True):
+        try:
+            prog = Program.objects.get(id=program_id)
+        except Program.DoesNotExist:
+            continue
+        #   Take the request first, so that it can be made again while this runs
+        Tag.unSetTag(REQUEST_TAG, target=prog)
+        warm_program_caches(prog, processes)
+        programs.append(prog)
+    return programs
@@ -0,0 +1,165 @@
+
+__author__    = "Individual contributors (see AUTHORS file)"
+__date__      = "$DATE$"
+__rev__       = "$REV$"
+__license__   = "AGPL v.3"
+__copyright__ = """
+This file is part of the ESP Web Site
+Copyright (c) 2012 by the individual contributors
+  (see AUTHORS file)
+
+The ESP Web Site is free software; you can redistribute it and/or
+modify it under the terms of the GNU Affero General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public
+License along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+Contact information:
+MIT Educational Studies Program
+  84 Massachusetts Ave W20-467, Cambridge, MA 02139
+  Phone: 617-253-4882
+  Email: esp-webmasters@mit.edu
+Learning Unlimited, Inc.
+  527 Franklin St, Cambridge, MA 02139
+  Phone: 617-379-0178
+  Email: web-team@lists.learningu.org
+"""
+
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import signals
+
+import esp.mailman as mailman
+from esp.cache.invalidation import commit_on_success_deferred
+from esp.middleware.threadlocalrequest import get_current_request
+from esp.program.models import ClassSection, StudentRegistration, RegistrationType
+from esp.program.models.app_ import StudentAppQuestion
+from esp.users.models import ESPUser
+
+class LotteryPreferenceController(object):
+    """
+    Saves a student's lottery preferences (flagged, prioritized and
+    interested sections) as StudentRegistrations, in a fixed number of
+    queries however many sections change.  This is the bulk version of
+    calling preregister_student() and unpreregister_student() per section.
+    """
+
+    def __init__(self, program):
+        self.program = program
+
+    @commit_on_success_deferred
+    def set_preferences(self, user, preferences):
+        """
+        Make the student's registrations match preferences, a dict from
+        RegistrationType to the ids of the sections that should have it:
+        expire the ones that aren't wanted any more and create the missing
+        ones.  Registration types that aren't in preferences are left alone,
+        as are registrations that are already right, which keep their start
+        dates.  Returns the ids of any sections that aren't in this program;
+        those are skipped.
+        """
+        now = datetime.now()
+        user = ESPUser(user)
+        wanted = set()
+        for rt, section_ids in preferences.iteritems():
+            wanted |= set([(int(section_id), rt.id) for section_id in section_ids])
+        requested_ids = set([x[0] for x in wanted])
+        valid_ids = set(ClassSection.objects.filter(id__in=requested_ids, parent_class__parent_program=self.program).values_list('id', flat=True))
+        rejected = sorted(requested_ids - valid_ids)
+        wanted = set([x for x in wanted if x[0] in valid_ids])
+
+        #   Diff the preferences against the current registrations
+        existing = StudentRegistration.valid_objects().filter(user=user, relationship__in=[rt.id for rt in preferences],
+                                                              section__parent_class__parent_program=self.program)
+        kept = set()
+        expired = []
+        start_dates = {}
+        for reg_id, section_id, rt_id, start_date in existing.values_list('id', 'section', 'relationship', 'start_date'):
+            if (section_id, rt_id) in wanted and (section_id, rt_id) not in kept:
+                kept.add((section_id, rt_id))
+            else:
+                expired.append((reg_id, section_id, rt_id))
+                start_dates[reg_id] = start_date
+        created = list(wanted - kept)
+        if not expired and not created:
+            return rejected
+
+        end_date = StudentRegistration._meta.get_field('end_date').get_default()
+        inserted = []
+        if expired:
+            StudentRegistration.objects.filter(id__in=[x[0] for x in expired]).update(end_date=now)
+        if created:
+            rows = list(created)
+            #   As in preregister_student(), note registrations made through onsite registration
+            request = get_current_request()
+            if request and request.user and isinstance(request.user, ESPUser) and request.user.is_morphed(request):
+                onsite_type, c = RegistrationType.objects.get_or_create(name='OnSite/ChangedClasses', category='student')
+                rows += [(section_id, onsite_type.id) for section_id, rt_id in created]
+            params = []
+            for section_id, rt_id in rows:
+                params += [section_id, user.id, rt_id, now, end_date]
+            cursor = connection.cursor()
+            cursor.execute('INSERT INTO "program_studentregistration" ("section_id", "user_id", "relationship_id", "start_date", "end_date") VALUES '
+                           + ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+                           + ' RETURNING "id", "section_id", "relationship_id"', params)
+            inserted = cursor.fetchall()
+
+        added_ids = set([x[0] for x in created])
+        dropped_ids = set([x[1] for x in expired]) - set([x[0] for x in wanted])
+        changes = set([x[1:] for x in expired] + created)
+        sections = dict([(s.id, s) for s in ClassSection.objects.filter(id__in=[x[0] for x in changes]).select_related('parent_class', 'parent_class__category')])
+
+
+        #   Compensate for the lack of signals on update() and the INSERT, with the
+        #   registrations as they now are; the caches are invalidated when we return.
+        for reg_id, section_id, rt_id in expired:
+            reg = StudentRegistration(id=reg_id, user=user, section=sections[section_id], relationship_id=rt_id, start_date=start_dates[reg_id], end_date=now)
+            signals.post_save.send(sender=StudentRegistration, instance=reg, created=False)
+        for reg_id, section_id, rt_id in inserted:
+            reg = StudentRegistration(id=reg_id, user=user, section=sections[section_id], relationship_id=rt_id, start_date=now, end_date=end_date)
+            signals.post_save.send(sender=StudentRegistration, instance=reg, created=True)
+
+        #   Nor do the enrollments go through reserve_seat(), so recount those sections
+        enrolled_type = RegistrationType.get_map(include=['Enrolled'], category='student')['Enrolled']
+        enrolled_ids = [section_id for section_id, rt_id in changes if rt_id == enrolled_type.id]
+        if enrolled_ids:
+            ClassSection.reconcile_seats(enrolled_ids)
+
+        #   The class mailing lists, as preregister_student() and unpreregister_student() update them
+        if mailman.USE_MAILMAN:
+            list_changes = []
+            for section_id in added_ids:
+                list_changes += [('add', '%s-students' % sections[section_id].emailcode(), user.email),
+                                 ('add', '%s-students' % sections[section_id].parent_class.emailcode(), user.email)]
+            for section_id in dropped_ids:
+                list_changes += [('remove', '%s-students' % sections[section_id].emailcode(), user.email),
+                                 ('remove', '%s-students' % sections[section_id].parent_class.emailcode(), user.email)]
+            if added_ids:
+                list_changes.append(('add', '%s_%s-students' % (self.program.anchor.parent.name, self.program.anchor.name), user.email))
+            mailman.queue_list_changes(list_changes)
+
+        #   And the student's application questions
+        app = user.getApplication(self.program, create=False)
+        if app:
+            if dropped_ids:
+                class_ids = [sections[section_id].parent_class_id for section_id in dropped_ids]
+                blank_responses = app.responses.filter(question__subject__in=class_ids, response='')
+                for q in StudentAppQuestion.objects.filter(studentappresponse__in=blank_responses):
+                    app.questions.remove(q)
+                blank_responses.delete()
+            if added_ids and self.program.isUsingStudentApps():
+                app.set_questions()
+                if app.questions.count() > 0:
+                    app.done = False
+                    app.save()
+
+        return rejected
@@ -47,7 +47,7 @@ from django.db.models.query import QuerySet
 from django.contrib.localflavor.us.models import PhoneNumberField
 from esp.db.fields import AjaxForeignKey
 from esp.middleware import ESPError, AjaxError
-from esp.cache import cache_function
+from esp.cache import cache_function, wildcard
 from esp.tagdict.models import Tag
 from esp.settings import DEFAULT_HOST
 
@@ -440,29 +440,7 @@ class Program(models.Model, CustomFormsLinkModel):
         
     def student_counts_by_section_id(self):
         from esp.program.models.class_ import sections_in_program_by_id
-        section_ids = sections_in_program_by_id(self)
-        
-        class_cachekey = "class_size_counter_%d"
-        counts = cache.get_many([class_cachekey % x for x in section_ids])
-
-        clean_counts = {}
-        missing_secs = set()
-
-        for section_id in section_ids:
-            clean_count = counts.get(class_cachekey % section_id, None)
-            if not clean_count:
-                missing_secs.add(section_id)
-            clean_counts[section_id] = clean_count
-
-        if len(missing_secs) != 0:
-            initial_catalog_queryset = ClassSubject.objects.filter(sections__in=missing_secs)
-            catalog = ClassSubject.objects.catalog(self, initial_queryset = initial_catalog_queryset)
-            for subject in catalog:
-                for section in subject.get_sections():
-                    if int(section.id) in missing_secs:
-                        clean_counts[section.id] = section.num_students()  ## Also repopulates the cache.  Magic!
-
-        return clean_counts
+        return ClassSection.seat_counts(sections_in_program_by_id(self))
 
     def getLists(self, QObjects=False):
         from esp.users.models import ESPUser
@@ -706,6 +684,29 @@ class Program(models.Model, CustomFormsLinkModel):
             return list(self.getTimeSlots(exclude_types=[]))
     getTimeSlotList.depend_on_model(lambda: Event)
 
+    #   Schedules are also kept as bitsets of timeslots, so that checking for
+    #   conflicts is a bitwise AND.  Bit i is the i-th of all of the program's
+    #   timeslots, ordered as in getTimeSlotList() with ties broken by id.
+    @cache_function
+    def timeslot_bit_index(self):
+        timeslots = sorted(self.getTimeSlotList(exclude_compulsory=False), key=lambda t: (t.start, t.id))
+        return dict([(t.id, i) for i, t in enumerate(timeslots)])
+    timeslot_bit_index.memoize_per_request()
+    timeslot_bit_index.depend_on_cache(lambda: Program.getTimeSlotList, lambda self=wildcard, **kwargs: {'self': self})
+
+    def timeslot_bits(self, timeslot_ids):
+        """ The bitset of these timeslots, or None if some of them aren't this program's. """
+        index = self.timeslot_bit_index()
+        bits = 0
+        for timeslot_id in timeslot_ids:
+            if timeslot_id not in index:
+                return None
+            bits |= 1 << index[timeslot_id]
+        return bits
+
+    def timeslot_ids_from_bits(self, bits):
+        return [timeslot_id for timeslot_id, i in self.timeslot_bit_index().iteritems() if bits & (1 << i)]
+
     def total_duration(self):
         """ Returns the total length of the events in this program, as a timedelta object. """
         ts_list = Event.collapse(list(self.getTimeSlots()), tol=timedelta(minutes=15))
@@ -1633,28 +1634,53 @@ class ScheduleMap:
         It can be generated and cached for a user, then modified
         (by adding/removing values) to quickly model the effect of a particular
         schedule change.
+        
+        The occupied timeslots are also kept in bits, as a bitset (see
+        Program.timeslot_bits()).  The map can be built from the bitset, which
+        by default is the user's cached one, so that an empty schedule doesn't
+        need the user's sections at all.  bits is None if the schedule has
+        timeslots from outside the program.
     """
-    def __init__(self, user, program):
+    def __init__(self, user, program, bits=None):
         if type(user) is not ESPUser:
             user = ESPUser(user)
         self.program = program
         self.user = user
-        self.populate()
+        self.populate(bits)
+
+    @classmethod
+    def from_bits(cls, user, program, bits):
+        return cls(user, program, bits)
 
-    def populate(self):
+    def populate(self, bits=None):
         result = {}
         for t in self.program.getTimeSlotList(exclude_compulsory=True):
             result[t.id] = []
-        sl = self.user.getEnrolledSectionsFromProgram(self.program)
-        for s in sl:
-            for m in s._timeslot_ids:
-                result[m].append(s)
+        if bits is None:
+            bits = self.user.getEnrolledTimeslotBits(self.program)
+        if bits is None:
+            occupied = None
+        else:
+            occupied = set(self.program.timeslot_ids_from_bits(bits))
+        if occupied is None or occupied:
+            sl = self.user.getEnrolledSectionsFromProgram(self.program)
+            for s in sl:
+                for m in s._timeslot_ids:
+                    if occupied is None or m in occupied:
+                        result[m].append(s)
         self.map = result
+        self.bits = bits
         return self.map
 
     def add_section(self, sec):
         for t in sec.timeslot_ids():
             self.map[t].append(sec)
+        if self.bits is not None:
+            sec_bits = sec.timeslot_bits()
+            if sec_bits is None:
+                self.bits = None
+            else:
+                self.bits |= sec_bits
 
     def __marinade__(self):
         import hashlib
@@ -1852,6 +1878,7 @@ class RegistrationType(models.Model):
     def get_cached(name, category):
         rt, created = RegistrationType.objects.get_or_create(name=name, defaults = {'category': category})
         return rt
+    get_cached.memoize_per_request()
     get_cached.depend_on_model(lambda: RegistrationType)
     get_cached = staticmethod(get_cached)
 
@@ -1869,6 +1896,7 @@ class RegistrationType(models.Model):
         for item in RegistrationType.objects.all():
             result[item.name] = item
         return result
+    get_map.memoize_per_request()
     get_map.depend_on_model(lambda: RegistrationType)
     get_map = staticmethod(get_map)
 
@@ -250,3 +250,10 @@ class StudentApplication(models.Model):
         app_label = 'program'
         db_table = 'program_junctionstudentapp'    
 
+
+def _snapshot_question_changed(sender, instance, **kwargs):
+    from esp.program.models.class_ import ClassCatalogSnapshot
+    ClassCatalogSnapshot.objects.refresh([instance.subject_id], create=False)
+
+models.signals.post_save.connect(_snapshot_question_changed, sender=StudentAppQuestion)
+models.signals.post_delete.connect(_snapshot_question_changed, sender=StudentAppQuestion)
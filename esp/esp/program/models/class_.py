@@ -37,7 +37,7 @@ import time
 from collections import defaultdict
 
 # django Util
-from django.db import models
+from django.db import models, connection, transaction
 from django.db.models import get_model
 from django.db.models.query import Q
 from django.db.models import signals
@@ -51,9 +51,9 @@ from esp.db.models.prepared import ProcedureManager
 from esp.db.fields import AjaxForeignKey
 from esp.db.cache import GenericCacheHelper
 from esp.utils.property import PropertyDict
-from esp.utils.fields import JSONField
+from esp.utils.fields import JSONField, CounterField
 from esp.tagdict.models import Tag
-from esp.mailman import add_list_member, remove_list_member
+from esp.mailman import queue_list_member, queue_remove_list_member
 
 # django models
 from django.contrib.auth.models import User
@@ -70,7 +70,6 @@ from esp.program.models          import Program, StudentRegistration, Registrati
 from esp.program.models import BooleanExpression, ScheduleMap, ScheduleConstraint, ScheduleTestOccupied, ScheduleTestCategory, ScheduleTestSectionList
 from esp.resources.models        import ResourceType, Resource, ResourceRequest, ResourceAssignment
 from esp.cache                   import cache_function
-from esp.utils.derivedfield      import DerivedField
 
 from django.core.cache import cache  ## Yep, we do have to do some raw cache-management for performance.  Try to minimize it, though.
 #from pylibmc import NotFound as CacheNotFound
@@ -79,7 +78,7 @@ from esp.middleware.threadlocalrequest import get_current_request
 
 from esp.customforms.linkfields import CustomFormsLinkModel
 
-__all__ = ['ClassSection', 'ClassSubject', 'ProgramCheckItem', 'ClassManager', 'ClassCategories', 'ClassImplication', 'ClassSizeRange']
+__all__ = ['ClassSection', 'ClassSubject', 'ProgramCheckItem', 'ClassManager', 'ClassCategories', 'ClassImplication', 'ClassSizeRange', 'ClassCatalogSnapshot']
 
 class ClassSizeRange(models.Model):
     from esp.program.models import Program
@@ -178,11 +177,10 @@ class ClassManager(ProcedureManager):
 
         In addition to just giving you the classes, it also
         queries for the category's title (cls.category_txt)
-        and the total # of media.
+        and the total # of media, from ClassCatalogSnapshot.
         """
         now = datetime.datetime.now()
         
-        enrolled_type = RegistrationType.get_map(include=['Enrolled'], category='student')['Enrolled']
         teaching_node=GetNode("V/Flags/Registration/Teacher")
 
         if initial_queryset:
@@ -202,20 +200,8 @@ class ClassManager(ProcedureManager):
         if ts is not None:
             classes = classes.filter(sections__meeting_times=ts)
         
-        select = SortedDict([( '_num_students', 'SELECT COUNT(DISTINCT "program_studentregistration"."user_id") FROM "program_studentregistration", "program_classsection" WHERE ("program_studentregistration"."relationship_id" = %s AND "program_studentregistration"."section_id" = "program_classsection"."id" AND "program_classsection"."parent_class_id" = "program_class"."id" AND "program_studentregistration"."start_date" <= %s AND "program_studentregistration"."end_date" >= %s)'),
-                             ('teacher_ids', 'SELECT list(DISTINCT "users_userbit"."user_id") FROM "users_userbit" WHERE ("users_userbit"."verb_id" = %s AND "users_userbit"."qsc_id" = "program_class"."anchor_id" AND "users_userbit"."enddate" >= %s AND "users_userbit"."startdate" <= %s)'),
-                             ('media_count', 'SELECT COUNT(*) FROM "qsdmedia_media" WHERE ("qsdmedia_media"."anchor_id" = "program_class"."anchor_id")'),
-                             ('_index_qsd', 'SELECT list("qsd_quasistaticdata"."id") FROM "qsd_quasistaticdata" WHERE ("qsd_quasistaticdata"."path_id" = "program_class"."anchor_id" AND "qsd_quasistaticdata"."name" = \'learn:index\')'),
-                             ('_studentapps_count', 'SELECT COUNT(*) FROM "program_studentappquestion" WHERE ("program_studentappquestion"."subject_id" = "program_class"."id")')])
-                             
-        select_params = [ enrolled_type.id,
-                          now,
-                          now,
-                          teaching_node.id,
-                          now,
-                          now,
-                         ]
-        classes = classes.extra(select=select, select_params=select_params)
+        #   The per-class statistics come from the catalog snapshot
+        classes = ClassCatalogSnapshot.objects.extra_for(classes)
         
         #   Allow customized orderings for the catalog.
         #   These are the default ordering fields in descending order of priority.
@@ -233,7 +219,14 @@ class ClassManager(ProcedureManager):
         classes = classes.order_by(*order_args)
         
         classes = classes.distinct()
-        classes = list(classes)
+        class_list = list(classes)
+
+        #   Snapshots that are missing or out of date are refreshed, and then read again
+        stale_ids = ClassCatalogSnapshot.objects.stale(class_list, now)
+        if stale_ids:
+            ClassCatalogSnapshot.objects.refresh(stale_ids)
+            class_list = list(classes.all())
+        classes = class_list
         
         #   Filter out duplicates by ID.  This is necessary because Django's ORM
         #   adds the related fields (e.g. sections__meeting_times) to the SQL
@@ -284,7 +277,7 @@ class ClassManager(ProcedureManager):
             p = Program.objects.select_related('anchor').get(id=classes[0].parent_program_id)
             
         for c in classes:
-            c._teachers = [teachers_by_id[int(x)] for x in c.teacher_ids.split(',')] if c.teacher_ids != '' else []
+            c._teachers = [teachers_by_id[int(x)] for x in c.teacher_ids.split(',')] if c.teacher_ids else []
             c._teachers.sort(cmp=lambda t1, t2: cmp(t1.last_name, t2.last_name))
             c._sections = sections_by_parent_id[c.id]
             for s in c._sections:
@@ -294,16 +287,19 @@ class ClassManager(ProcedureManager):
                                  # they show up for all instances.
             
         return classes
+    catalog_cached.hash_tokens()
+    catalog_cached.fingerprint_keys()
+    catalog_cached.serve_stale()
     catalog_cached.depend_on_model(lambda: ClassSubject)
     catalog_cached.depend_on_model(lambda: ClassSection)
     catalog_cached.depend_on_model(lambda: QSDMedia)
     catalog_cached.depend_on_model(lambda: Tag)
-    catalog_cached.depend_on_row(lambda: UserBit, lambda bit: {},
-                                 lambda bit: bit.applies_to_verb('V/Flags/Registration/Teacher'))
+    catalog_cached.depend_on_subtree(lambda: UserBit, lambda bit: bit.qsc, 'program', lambda: Program,
+                                     lambda bit: bit.applies_to_verb('V/Flags/Registration/Teacher'))
     #catalog_cached.depend_on_row(lambda: UserBit, lambda bit: {},
     #                             lambda bit: bit.applies_to_verb('V/Flags/Registration/Enrolled')) # This will expire a *lot*, and the value that it saves can be gotten from cache (with effort) instead of from SQL.  Should go do that.
-    catalog_cached.depend_on_row(lambda: QuasiStaticData, lambda page: {},
-                                 lambda page: ("learn:index" == page.name) and ("Q/Programs/" in page.path.get_uri()) and ("/Classes/" in page.path.get_uri())) # Slightly dirty hack; has assumptions about the tree structure of where index.html pages for QSD will be stored
+    catalog_cached.depend_on_subtree(lambda: QuasiStaticData, lambda page: page.path, 'program', lambda: Program,
+                                     lambda page: ("learn:index" == page.name) and ("Q/Programs/" in page.path.get_uri()) and ("/Classes/" in page.path.get_uri())) # Slightly dirty hack; has assumptions about the tree structure of where index.html pages for QSD will be stored
     
 
     cache = ClassCacheHelper
@@ -467,6 +463,7 @@ class ClassSection(models.Model):
         else:
             return int(ans)
 
+    _get_capacity.hash_tokens()
     _get_capacity.depend_on_m2m(lambda:ClassSection, 'meeting_times', lambda sec, event: {'self': sec})
     _get_capacity.depend_on_row(lambda:ClassSection, lambda r: {'self': r})
     _get_capacity.depend_on_model(lambda:ClassSubject)
@@ -893,6 +890,10 @@ class ClassSection(models.Model):
         return self.meeting_times.all().values_list('id', flat=True)
     timeslot_ids.depend_on_m2m(lambda: ClassSection, 'meeting_times', lambda instance, object: {'self': instance})
 
+    def timeslot_bits(self):
+        """ This section's timeslots as a bitset; see Program.timeslot_bits(). """
+        return self.parent_program.timeslot_bits(self.timeslot_ids())
+
     def cannotAdd(self, user, checkFull=True, use_cache=True):
         """ Go through and give an error message if this user cannot add this section to their schedule. """
         # Test any scheduling constraints
@@ -910,28 +911,41 @@ class ClassSection(models.Model):
         
         scrmi = self.parent_program.getModuleExtension('StudentClassRegModuleInfo')
         if not scrmi.use_priority:
-            verbs = ['Enrolled']
-            section_list = user.getEnrolledSectionsFromProgram(self.parent_program)
+            #   The cached class ids and bitset stand in for the student's sections
+            section_list = None
+            if self.parent_class_id in user.getEnrolledClassIds(self.parent_program):
+                return 'You are already signed up for a section of this class!'
+            schedule_bits = user.getEnrolledTimeslotBits(self.parent_program)
         else:
             verbs = [scrmi.signup_verb.name]
             # Disallow joining a no-app class that conflicts with an app class
             # For HSSP Harvard Spring 2010
             #if self.parent_class.studentappquestion_set.count() == 0:
             #    verbs += ['/Applied']
-            section_list = user.getSections(self.parent_program, verbs=verbs)
-        
+            section_list = list(user.getSections(self.parent_program, verbs=verbs))
+            for sec in section_list:
+                if sec.parent_class_id == self.parent_class_id:
+                    return 'You are already signed up for a section of this class!'
+            schedule_bits = self.parent_program.timeslot_bits([tid for sec in section_list for tid in sec.timeslot_ids()])
+
         # check to see if there's a conflict:
-        my_timeslots = self.timeslot_ids()
-        for sec in section_list:
-            if sec.parent_class == self.parent_class:
-                return 'You are already signed up for a section of this class!'
-            if hasattr(sec, '_timeslot_ids'):
-                timeslot_ids = sec._timeslot_ids
-            else:
-                timeslot_ids = sec.timeslot_ids()
-            for tid in timeslot_ids:
-                if tid in my_timeslots:
-                    return 'This section conflicts with your schedule--check out the other sections!'
+        my_bits = self.timeslot_bits()
+        if my_bits is not None and schedule_bits is not None:
+            if my_bits & schedule_bits:
+                return 'This section conflicts with your schedule--check out the other sections!'
+        else:
+            #   Some of these timeslots aren't the program's, so compare them one by one
+            if section_list is None:
+                section_list = user.getEnrolledSectionsFromProgram(self.parent_program)
+            my_timeslots = self.timeslot_ids()
+            for sec in section_list:
+                if hasattr(sec, '_timeslot_ids'):
+                    timeslot_ids = sec._timeslot_ids
+                else:
+                    timeslot_ids = sec.timeslot_ids()
+                for tid in timeslot_ids:
+                    if tid in my_timeslots:
+                        return 'This section conflicts with your schedule--check out the other sections!'
                     
         # check to see if registration has been closed for this section
         if not self.isRegOpen():
@@ -1038,7 +1052,98 @@ class ClassSection(models.Model):
         return self.num_students(use_cache=False)
     count_enrolled_students.depend_on_row(lambda: StudentRegistration, lambda reg: {'self': reg.section})
 
-    enrolled_students = DerivedField(models.IntegerField, count_enrolled_students)(null=False, default=0)
+    #   The seat counter: how many students are enrolled, kept up to date
+    #   atomically by reserve_seat() and release_seat(), and otherwise left
+    #   alone by save().  Paths that enroll students some other way (bulk
+    #   and admin changes) call reconcile_seats(), which also repairs drift.
+    enrolled_students = CounterField(null=False, default=0)
+
+    def reserve_seat(self, capacity=None):
+        """
+        Take a seat in this section if fewer than capacity students are
+        enrolled (or regardless, if capacity is None).  The conditional
+        UPDATE makes concurrent enrollments queue up on the section's row,
+        so the section can't be overfilled.  Returns whether a seat was taken.
+
+        This doesn't commit: the caller saves the registration taking the
+        seat in the same transaction, and rolls back both if that fails.
+        """
+        sql = 'UPDATE "program_classsection" SET "enrolled_students" = "enrolled_students" + 1 WHERE "id" = %s'
+        params = [self.id]
+        if capacity is not None:
+            #   As in isFull(), an empty section with no capacity isn't full
+            sql += ' AND "enrolled_students" < %s'
+            params.append(max(capacity, 1))
+        cursor = connection.cursor()
+        cursor.execute(sql + ' RETURNING "enrolled_students"', params)
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        self.enrolled_students = row[0]
+        return True
+
+    def release_seat(self):
+        """ Give back a seat taken with reserve_seat(). """
+        cursor = connection.cursor()
+        cursor.execute('UPDATE "program_classsection" SET "enrolled_students" = "enrolled_students" - 1 WHERE "id" = %s AND "enrolled_students" > 0 RETURNING "enrolled_students"', [self.id])
+        row = cursor.fetchone()
+        transaction.commit_unless_managed()
+        if row is not None:
+            self.enrolled_students = row[0]
+
+    @staticmethod
+    def seat_counts(section_ids):
+        """ The seat counters of these sections, by id, read from the
+        enrolled_students column so that they're never ahead of it. """
+        section_ids = [int(id) for id in section_ids]
+        if not section_ids:
+            return {}
+        return dict(ClassSection.objects.filter(id__in=section_ids).values_list('id', 'enrolled_students'))
+
+    def enrolled_count(self):
+        return ClassSection.seat_counts([self.id]).get(self.id, 0)
+
+    @staticmethod
+    def reconcile_seats(section_ids=None, program=None):
+        """
+        Recount the seat counters of these sections (or of every section in
+        the program, or everywhere) from their StudentRegistrations.
+        Returns {section id: (old, new)} for the sections whose counter had
+        drifted.
+
+        An enrollment in flight while this runs can leave its section's
+        count one low, so the periodic job runs when registration is quiet.
+        """
+        now = datetime.datetime.now()
+        enrolled_type = RegistrationType.get_map(include=['Enrolled'], category='student')['Enrolled']
+        if section_ids is not None:
+            section_ids = [int(x) for x in section_ids]
+            if not section_ids:
+                return {}
+            scope = '"s2"."id" IN (%s)' % ', '.join(['%s'] * len(section_ids))
+            scope_params = section_ids
+        elif program is not None:
+            scope = '"s2"."parent_class_id" IN (SELECT "id" FROM "program_class" WHERE "parent_program_id" = %s)'
+            scope_params = [program.id]
+        else:
+            scope = '1 = 1'
+            scope_params = []
+
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE "program_classsection" SET "enrolled_students" = "counts"."n"
+            FROM (SELECT "s2"."id", "s2"."enrolled_students" AS "old", COUNT(DISTINCT "r"."user_id") AS "n"
+                    FROM "program_classsection" "s2"
+                    LEFT JOIN "program_studentregistration" "r"
+                      ON ("r"."section_id" = "s2"."id" AND "r"."relationship_id" = %s AND "r"."start_date" <= %s AND "r"."end_date" >= %s)
+                   WHERE """ + scope + """
+                   GROUP BY "s2"."id", "s2"."enrolled_students") "counts"
+            WHERE "program_classsection"."id" = "counts"."id" AND "program_classsection"."enrolled_students" <> "counts"."n"
+            RETURNING "program_classsection"."id", "counts"."old", "program_classsection"."enrolled_students"
+            """, [enrolled_type.id, now, now] + scope_params)
+        drifted = dict([(row[0], (row[1], row[2])) for row in cursor.fetchall()])
+        transaction.commit_unless_managed()
+        return drifted
 
     def cancel(self, email_students=True, explanation=None):
         from esp.settings import INSTITUTION_NAME, ORGANIZATION_SHORT_NAME, DEFAULT_EMAIL_ADDRESSES
@@ -1080,6 +1185,7 @@ class ClassSection(models.Model):
         #   Compensate for the lack of a signal on update().
         for reg in qs:
             signals.post_save.send(sender=StudentRegistration, instance=reg)
+        ClassSection.reconcile_seats([self.id])
 
     @staticmethod
     def idcmp(one, other):
@@ -1117,10 +1223,12 @@ class ClassSection(models.Model):
             return reduce(lambda x,y: x+y, [r.num_students for r in ir]) 
             
     def isFull(self, ignore_changes=False):
-        if (self.num_students() == self._get_capacity(ignore_changes) == 0):
+        num_students = self.enrolled_students
+        capacity = self._get_capacity(ignore_changes)
+        if (num_students == capacity == 0):
             return False
         else:
-            return (self.num_students() >= self._get_capacity(ignore_changes))
+            return (num_students >= capacity)
             
     def time_blocks(self):
         return self.friendly_times(raw=True)
@@ -1211,17 +1319,19 @@ class ClassSection(models.Model):
         #   Stop all active or pending registrations
         if prereg_verb:
             qs = StudentRegistration.objects.filter(relationship__name=prereg_verb, section=self, user=user, end_date__gte=now)
-            qs.update(end_date=now)
-            #   print 'Expired %s' % qs
         else:
             qs = StudentRegistration.objects.filter(section=self, user=user, end_date__gte=now)
-            qs.update(end_date=now)
-            #   print 'Expired %s' % qs
+        releases_seat = qs.filter(relationship__name='Enrolled', start_date__lte=now).exists()
+        qs.update(end_date=now)
+        #   print 'Expired %s' % qs
+        if releases_seat:
+            self.release_seat()
             
         #   Explicitly fire the signals for saving a StudentRegistration in order to update caches
         #   since it doesn't get sent by update() above
         if qs.exists():
-            signals.post_save.send(sender=StudentRegistration, instance=qs[0])
+            reg = qs[0]
+            signals.post_save.send(sender=StudentRegistration, instance=reg)
             
         #   If the student had blank application question responses for this class, remove them.
         app = ESPUser(user).getApplication(self.parent_program, create=False)
@@ -1235,7 +1345,7 @@ class ClassSection(models.Model):
         # Remove the student from any existing class mailing lists
         list_names = ["%s-%s" % (self.emailcode(), "students"), "%s-%s" % (self.parent_class.emailcode(), "students")]
         for list_name in list_names:
-            remove_list_member(list_name, user.email)
+            queue_remove_list_member(list_name, user.email)
 
     
     from esp.program.models import StudentRegistration, RegistrationType
@@ -1256,10 +1366,21 @@ class ClassSection(models.Model):
             rt = RegistrationType.get_cached(name=prereg_verb, category='student')
             qs = self.registrations.filter(id=user.id, studentregistration__start_date__lte=now, studentregistration__end_date__gte=now, studentregistration__relationship=rt)
             if fast_force_create or not qs.exists():
+                #   Enrolling takes a seat, atomically, in case the section filled up since isFull()
+                takes_seat = (prereg_verb == 'Enrolled' and not fast_force_create)
+                if takes_seat and not self.reserve_seat(None if overridefull else self._get_capacity()):
+                    return False
                 sr = StudentRegistration(user=user, section=self, relationship=rt)
-                sr.save()
+                try:
+                    sr.save()
+                except:
+                    #   Don't leave the seat taken without the registration
+                    transaction.rollback_unless_managed()
+                    raise
                 #   print 'Created %s' % sr
                 if fast_force_create:
+                    if prereg_verb == 'Enrolled':
+                        ClassSection.reconcile_seats([self.id])
                     ## That's the bare minimum to reg someone; we're done!
                     return True
             
@@ -1287,8 +1408,8 @@ class ClassSection(models.Model):
             #   Add the student to the class mailing lists, if they exist
             list_names = ["%s-%s" % (self.emailcode(), "students"), "%s-%s" % (self.parent_class.emailcode(), "students")]
             for list_name in list_names:
-                add_list_member(list_name, user.email)
-            add_list_member("%s_%s-students" % (self.parent_program.anchor.parent.name, self.parent_program.anchor.name), user.email)
+                queue_list_member(list_name, user.email)
+            queue_list_member("%s_%s-students" % (self.parent_program.anchor.parent.name, self.parent_program.anchor.name), user.email)
 
             return True
         else:
@@ -1578,7 +1699,7 @@ class ClassSubject(models.Model, CustomFormsLinkModel):
     def got_index_qsd(self):
         """ Returns if this class has an associated index.html QSD. """
         if hasattr(self, "_index_qsd"):
-            return (self._index_qsd != '')
+            return bool(self._index_qsd)
         
         if QuasiStaticData.objects.filter(path = self.anchor, name = "learn:index")[:1]:
             return True
@@ -2221,6 +2342,188 @@ class ClassCategories(models.Model):
     class Admin:
         pass
 
+class ClassCatalogSnapshotManager(models.Manager):
+    #   The attribute the catalog sets on each class, and the snapshot column it comes from
+    COLUMNS = SortedDict([('_num_students', 'num_students'),
+                          ('teacher_ids', 'teacher_ids'),
+                          ('media_count', 'media_count'),
+                          ('_index_qsd', 'index_qsd'),
+                          ('_studentapps_count', 'studentapps_count'),
+                          ('_snapshot_expires', 'expires')])
+
+    def stats_select(self):
+        """ The correlated subqueries that compute the catalog statistics of
+        each program_class row, keyed like COLUMNS, and their parameters.
+        The id lists are NULL, rather than empty, when there are none. """
+        now = datetime.datetime.now()
+        enrolled_type = RegistrationType.get_map(include=['Enrolled'], category='student')['Enrolled']
+        teaching_node = GetNode("V/Flags/Registration/Teacher")
+
+        select = SortedDict([( '_num_students', 'SELECT COUNT(DISTINCT "program_studentregistration"."user_id") FROM "program_studentregistration", "program_classsection" WHERE ("program_studentregistration"."relationship_id" = %s AND "program_studentregistration"."section_id" = "program_classsection"."id" AND "program_classsection"."parent_class_id" = "program_class"."id" AND "program_studentregistration"."start_date" <= %s AND "program_studentregistration"."end_date" >= %s)'),
+                             ('teacher_ids', 'SELECT NULLIF(list(DISTINCT "users_userbit"."user_id"), \'\') FROM "users_userbit" WHERE ("users_userbit"."verb_id" = %s AND "users_userbit"."qsc_id" = "program_class"."anchor_id" AND "users_userbit"."enddate" >= %s AND "users_userbit"."startdate" <= %s)'),
+                             ('media_count', 'SELECT COUNT(*) FROM "qsdmedia_media" WHERE ("qsdmedia_media"."anchor_id" = "program_class"."anchor_id")'),
+                             ('_index_qsd', 'SELECT NULLIF(list("qsd_quasistaticdata"."id"), \'\') FROM "qsd_quasistaticdata" WHERE ("qsd_quasistaticdata"."path_id" = "program_class"."anchor_id" AND "qsd_quasistaticdata"."name" = \'learn:index\')'),
+                             ('_studentapps_count', 'SELECT COUNT(*) FROM "program_studentappquestion" WHERE ("program_studentappquestion"."subject_id" = "program_class"."id")'),
+                             #   The enrollment and teacher counts above change by themselves when a
+                             #   registration or bit starts or ends, so note the next time that happens
+                             ('_snapshot_expires', 'SELECT LEAST((SELECT MIN("program_studentregistration"."start_date") FROM "program_studentregistration", "program_classsection" WHERE ("program_studentregistration"."relationship_id" = %s AND "program_studentregistration"."section_id" = "program_classsection"."id" AND "program_classsection"."parent_class_id" = "program_class"."id" AND "program_studentregistration"."start_date" > %s)), '
+                                                          '(SELECT MIN("program_studentregistration"."end_date") FROM "program_studentregistration", "program_classsection" WHERE ("program_studentregistration"."relationship_id" = %s AND "program_studentregistration"."section_id" = "program_classsection"."id" AND "program_classsection"."parent_class_id" = "program_class"."id" AND "program_studentregistration"."end_date" >= %s)), '
+                                                          '(SELECT MIN("users_userbit"."startdate") FROM "users_userbit" WHERE ("users_userbit"."verb_id" = %s AND "users_userbit"."qsc_id" = "program_class"."anchor_id" AND "users_userbit"."startdate" > %s)), '
+                                                          '(SELECT MIN("users_userbit"."enddate") FROM "users_userbit" WHERE ("users_userbit"."verb_id" = %s AND "users_userbit"."qsc_id" = "program_class"."anchor_id" AND "users_userbit"."enddate" >= %s)))')])
+                             
+        select_params = [ enrolled_type.id,
+                          now,
+                          now,
+                          teaching_node.id,
+                          now,
+                          now,
+                          enrolled_type.id,
+                          now,
+                          enrolled_type.id,
+                          now,
+                          teaching_node.id,
+                          now,
+                          teaching_node.id,
+                          now,
+                         ]
+        return select, select_params
+
+    def refresh(self, class_ids, create=True):
+        """ Recompute the snapshots of just these classes.  Missing snapshots
+        are created unless create is False, which the signal handlers use
+        since they may run while a class is being deleted. """
+        class_ids = set([int(x) for x in class_ids if x is not None])
+        if not class_ids:
+            return
+
+        existing = set(self.filter(subject__in=class_ids).values_list('subject', flat=True))
+        if not create:
+            class_ids &= existing
+            if not class_ids:
+                return
+
+        select, select_params = self.stats_select()
+        rows = ClassSubject.objects.filter(id__in=class_ids).extra(select=select, select_params=select_params).values_list('id', 'parent_program', *select.keys())
+
+        now = datetime.datetime.now()
+        updates = []
+        inserts = []
+        for row in rows:
+            values = list(row[1:]) + [now]
+            if row[0] in existing:
+                updates.append(values + [row[0]])
+            else:
+                inserts.append([row[0]] + values)
+
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        columns = [qn(column) for column in ['program_id'] + self.COLUMNS.values() + ['updated']]
+        cursor = connection.cursor()
+        if updates:
+            cursor.executemany('UPDATE %s SET %s WHERE %s = %%s' % (table, ', '.join(['%s = %%s' % column for column in columns]), qn('subject_id')), updates)
+        if inserts:
+            cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join([qn('subject_id')] + columns), ', '.join(['%s'] * (len(columns) + 1))), inserts)
+        transaction.commit_unless_managed()
+
+    def fill(self, classes):
+        """ Create the snapshots missing for any class in a ClassSubject queryset. """
+        self.refresh(classes.filter(catalog_snapshot__isnull=True).values_list('id', flat=True))
+
+    def extra_for(self, classes):
+        """ Join the snapshots into a ClassSubject queryset, setting the same
+        attributes (and allowing the same orderings) as stats_select() would.
+        Classes without a snapshot get NULLs; see stale(). """
+        qn = connection.ops.quote_name
+        classes = classes._clone()
+        query = classes.query
+        #   LEFT OUTER JOIN, so that classes without a snapshot are still returned
+        alias = query.join((query.get_initial_alias(), self.model._meta.db_table, ClassSubject._meta.pk.column, 'subject_id'), promote=True)
+        select = SortedDict([(name, '%s.%s' % (qn(alias), qn(column))) for name, column in self.COLUMNS.items()])
+        select['_snapshot_updated'] = '%s.%s' % (qn(alias), qn('updated'))
+        return classes.extra(select=select)
+
+    def expire(self, section_id):
+        """ Mark the snapshot of a section's class as out of date, so that
+        the catalog refreshes it (along with any others) when next read. """
+        now = datetime.datetime.now()
+        cursor = connection.cursor()
+        cursor.execute('UPDATE "program_classcatalogsnapshot" SET "expires" = %s WHERE "subject_id" = (SELECT "parent_class_id" FROM "program_classsection" WHERE "id" = %s) AND ("expires" IS NULL OR "expires" > %s)', [now, section_id, now])
+        transaction.commit_unless_managed()
+
+    def stale(self, classes, now=None):
+        """ The ids of the classes, read through extra_for(), whose snapshot is
+        missing or has reached the next start or end of a registration or
+        teacher bit that it counts. """
+        if now is None:
+            now = datetime.datetime.now()
+        return [cls.id for cls in classes if cls._snapshot_updated is None or (cls._snapshot_expires is not None and cls._snapshot_expires <= now)]
+
+class ClassCatalogSnapshot(models.Model):
+    """ The statistics the catalog shows for a class (enrollment, teachers,
+    documents, index page and application questions), precomputed so that
+    the catalog can read them for the whole program in one query.
+
+    Kept up to date by the signal handlers below, which refresh only the
+    classes affected by each change.  Enrollments only mark the class's
+    snapshot as expired, since there are many of them; the catalog then
+    refreshes all of the expired snapshots at once. """
+
+    subject = models.OneToOneField(ClassSubject, primary_key=True, related_name='catalog_snapshot')
+    program = models.ForeignKey(Program)
+    num_students = models.IntegerField(default=0)
+    teacher_ids = models.TextField(null=True, blank=True)
+    media_count = models.IntegerField(default=0)
+    index_qsd = models.TextField(null=True, blank=True)
+    studentapps_count = models.IntegerField(default=0)
+    expires = models.DateTimeField(null=True, blank=True)   # When a registration or teacher bit next starts or ends
+    updated = models.DateTimeField(default=datetime.datetime.now)
+
+    objects = ClassCatalogSnapshotManager()
+
+    class Meta:
+        app_label = 'program'
+        db_table = 'program_classcatalogsnapshot'
+
+    def __unicode__(self):
+        return u'Catalog snapshot for %s' % self.subject_id
+
+def _snapshot_class_changed(sender, instance, **kwargs):
+    ClassCatalogSnapshot.objects.refresh([instance.id])
+
+def _snapshot_section_deleted(sender, instance, **kwargs):
+    ClassCatalogSnapshot.objects.refresh([instance.parent_class_id], create=False)
+
+def _snapshot_registration_changed(sender, instance, **kwargs):
+    #   Only enrollments are counted in the snapshot
+    if instance.relationship_id != RegistrationType.get_map(include=['Enrolled'], category='student')['Enrolled'].id:
+        return
+    ClassCatalogSnapshot.objects.expire(instance.section_id)
+
+def _snapshot_anchor_changed(anchor_id):
+    ClassCatalogSnapshot.objects.refresh(ClassSubject.objects.filter(anchor=anchor_id).values_list('id', flat=True), create=False)
+
+def _snapshot_userbit_changed(sender, instance, **kwargs):
+    if instance.verb_id == GetNode("V/Flags/Registration/Teacher").id:
+        _snapshot_anchor_changed(instance.qsc_id)
+
+def _snapshot_media_changed(sender, instance, **kwargs):
+    _snapshot_anchor_changed(instance.anchor_id)
+
+def _snapshot_qsd_changed(sender, instance, **kwargs):
+    if instance.name == 'learn:index':
+        _snapshot_anchor_changed(instance.path_id)
+
+signals.post_save.connect(_snapshot_class_changed, sender=ClassSubject)
+signals.post_delete.connect(_snapshot_section_deleted, sender=ClassSection)
+signals.post_save.connect(_snapshot_registration_changed, sender=StudentRegistration)
+signals.post_delete.connect(_snapshot_registration_changed, sender=StudentRegistration)
+signals.post_save.connect(_snapshot_userbit_changed, sender=UserBit)
+signals.post_delete.connect(_snapshot_userbit_changed, sender=UserBit)
+signals.post_save.connect(_snapshot_media_changed, sender=QSDMedia)
+signals.post_delete.connect(_snapshot_media_changed, sender=QSDMedia)
+signals.post_save.connect(_snapshot_qsd_changed, sender=QuasiStaticData)
+signals.post_delete.connect(_snapshot_qsd_changed, sender=QuasiStaticData)
+
 def open_class_category():
     return ClassCategories.objects.get_or_create(category='Walk-in Seminar', symbol='W', seq=0)[0]
 
@@ -34,6 +34,7 @@ Learning Unlimited, Inc.
 """
 from esp.program.modules.base import ProgramModuleObj, needs_teacher, needs_student, needs_admin, usercheck_usetl, CoreModule, main_call, aux_call
 from esp.program.modules import module_ext
+from esp.program.cache_warmup import last_report, request_warmup, warmup_requested
 from esp.web.util        import render_to_response
 from django.contrib.auth.decorators import login_required
 from esp.datatree.models import *
@@ -46,6 +47,7 @@ from esp.utils.widgets import DateTimeWidget
 from esp.middleware import ESPError
 from esp.datatree.forms import AjaxTreeField
 
+from django.http import HttpResponseRedirect
 from datetime import datetime
 
 class EditUserbitForm(forms.Form):
@@ -225,6 +227,22 @@ class AdminCore(ProgramModuleObj, CoreModule):
         
     #   Alias for deadline management
     deadlines = deadline_management
+
+    @aux_call
+    @needs_admin
+    def warm_caches(self, request, tl, one, two, module, extra, prog):
+        """ Fill the program's caches in the background, e.g. before registration opens. """
+        report = last_report(prog)
+        queued = warmup_requested(prog)
+        if request.method == 'POST' and not queued and not (report and report['running']):
+            #   This takes a while, so leave it for cache_warmup_cron.py
+            request_warmup(prog)
+            return HttpResponseRedirect(request.path)
+
+        context = {'report': report, 'queued': queued}
+        if report:
+            context['started'] = datetime.fromtimestamp(report['started'])
+        return render_to_response(self.baseDir()+'warm_caches.html', request, (prog, tl), context)
         
     def isStep(self):
         return True
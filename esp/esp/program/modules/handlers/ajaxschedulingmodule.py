@@ -49,6 +49,7 @@ from datetime                    import timedelta
 from django.utils                import simplejson
 from collections                 import defaultdict
 from esp.cache                   import cache_function
+from esp.utils.json_stream       import CachedJSON, cached_json_response
 from uuid                        import uuid4 as get_uuid
 
 class AJAXSchedulingModule(ProgramModuleObj):
@@ -85,10 +86,22 @@ class AJAXSchedulingModule(ProgramModuleObj):
     @aux_call
     @needs_admin
     def ajax_sections(self, request, tl, one, two, module, extra, prog):
-        return self.ajax_sections_cached(prog)
+        return cached_json_response(request, self.ajax_sections_cached, (prog,), lambda: self.ajax_sections_data(prog))
 
     @cache_function
     def ajax_sections_cached(self, prog):
+        return CachedJSON.from_data(self.ajax_sections_data(prog))
+    ajax_sections_cached.get_or_create_token(('prog',))
+    ajax_sections_cached.single_flight()
+    ajax_sections_cached.depend_on_model(lambda: ClassSubject)
+    ajax_sections_cached.depend_on_model(lambda: ClassSection)
+    ajax_sections_cached.depend_on_model(lambda: ClassSizeRange)
+    ajax_sections_cached.depend_on_model(lambda: ResourceRequest)
+    ajax_sections_cached.depend_on_subtree(lambda: UserBit, lambda bit: bit.qsc, 'prog', lambda: Program,
+                                           lambda bit: bit.applies_to_verb('V/Flags/Registration/Teacher'))
+
+    def ajax_sections_data(self, prog):
+        """ The sections for the scheduler, as a generator of rows to be encoded one at a time """
         sections = prog.sections().select_related()
 
         rrequests = ResourceRequest.objects.filter(target__in = sections)
@@ -98,13 +111,13 @@ class AJAXSchedulingModule(ProgramModuleObj):
             rrequest_dict[r.target_id].append((r.res_type_id, r.desired_value))
 
 
-        teacher_bits = UserBit.valid_objects().filter(verb=GetNode('V/Flags/Registration/Teacher'), qsc__in = (s.parent_class.anchor_id for s in sections), user__isnull=False).values("qsc_id", "user_id").distinct()
+        teacher_bits = UserBit.valid_objects().filter(verb=GetNode('V/Flags/Registration/Teacher'), qsc__in = sections.values('parent_class__anchor'), user__isnull=False).values("qsc_id", "user_id").distinct()
 
         teacher_dict = defaultdict(list)
         for b in teacher_bits:
             teacher_dict[b["qsc_id"]].append(b["user_id"])
         
-        sections_dicts = [
+        return (
             {   'id': s.id,
                 'class_id': s.parent_class_id,
                 'emailcode': s.emailcode(),
@@ -124,17 +137,7 @@ class AJAXSchedulingModule(ProgramModuleObj):
                 'grades': [s.parent_class.grade_min, s.parent_class.grade_max],
                 'prereqs': s.parent_class.prereqs,
                 'comments': s.parent_class.message_for_directors,
-            } for s in sections ]
-
-        response = HttpResponse(content_type="application/json")
-        simplejson.dump(sections_dicts, response)
-        return response
-    ajax_sections_cached.get_or_create_token(('prog',))
-    ajax_sections_cached.depend_on_model(lambda: ClassSubject)
-    ajax_sections_cached.depend_on_model(lambda: ClassSection)
-    ajax_sections_cached.depend_on_model(lambda: ClassSizeRange)
-    ajax_sections_cached.depend_on_model(lambda: ResourceRequest)
-    ajax_sections_cached.depend_on_model(lambda: UserBit)
+            } for s in sections.iterator() )
         
 
     @aux_call
@@ -273,25 +276,25 @@ class AJAXSchedulingModule(ProgramModuleObj):
     @aux_call
     @needs_admin
     def ajax_schedule_assignments(self, request, tl, one, two, module, extra, prog):
-        return self.ajax_schedule_assignments_cached(prog)
+        return cached_json_response(request, self.ajax_schedule_assignments_cached, (prog,), lambda: self.ajax_schedule_assignments_data(prog))
 
     @cache_function
     def ajax_schedule_assignments_cached(self, prog):
+        return CachedJSON.from_data(self.ajax_schedule_assignments_data(prog))
+    ajax_schedule_assignments_cached.get_or_create_token(('prog',))
+    ajax_schedule_assignments_cached.serve_stale()
+    ajax_schedule_assignments_cached.depend_on_model(lambda: ResourceAssignment)
+
+    def ajax_schedule_assignments_data(self, prog):
         resource_assignments = ResourceAssignment.objects.filter(target__parent_class__parent_program=prog, resource__res_type__name="Classroom").select_related('resource')
 
-        resassign_dicts = [
+        return (
             { 'uid': r.id,
               'resource_id': r.resource.name,
               'resource_time_id': r.resource.event_id,
               'classsection_id': r.target_id,
               'classsubject_id': r.target_subj_id
-              } for r in resource_assignments ]
-
-        response = HttpResponse(content_type="application/json")
-        simplejson.dump(resassign_dicts, response)
-        return response
-    ajax_schedule_assignments_cached.get_or_create_token(('prog',))
-    ajax_schedule_assignments_cached.depend_on_model(lambda: ResourceAssignment)
+              } for r in resource_assignments.iterator() )
 
     @aux_call
     @needs_admin
@@ -388,7 +391,7 @@ class AJAXSchedulingModule(ProgramModuleObj):
     ajax_schedule_last_changed_cached.depend_on_model(lambda: Resource)
     ajax_schedule_last_changed_cached.depend_on_model(lambda: ResourceRequest)
     ajax_schedule_last_changed_cached.depend_on_model(lambda: Event)
-    ajax_schedule_last_changed_cached.depend_on_model(lambda: UserBit)
+    ajax_schedule_last_changed_cached.depend_on_subtree(lambda: UserBit, lambda bit: bit.qsc, 'prog', lambda: Program)
     ajax_schedule_last_changed_cached.depend_on_model(lambda: ClassSection)
     ajax_schedule_last_changed_cached.depend_on_model(lambda: ClassSubject)
     ajax_schedule_last_changed_cached.depend_on_model(lambda: UserAvailability)
@@ -35,10 +35,11 @@ Learning Unlimited, Inc.
 
 from datetime import datetime, timedelta
 from esp.program.modules.base import ProgramModuleObj, needs_onsite, main_call, aux_call
-from esp.program.models import ClassSubject, ClassSection, StudentRegistration, ScheduleMap
+from esp.program.models import Program, ClassSubject, ClassSection, StudentRegistration, ScheduleMap, ClassSizeRange, ClassCategories
 from esp.web.util import render_to_response
 from esp.cal.models import Event
 from esp.cache import cache_function
+from esp.utils.json_stream import CachedJSON, cached_json_response
 from esp.users.models import ESPUser, UserBit
 from esp.resources.models import ResourceAssignment
 from esp.datatree.models import *
@@ -89,17 +90,32 @@ class OnSiteClassList(ProgramModuleObj):
     @aux_call
     @needs_onsite
     def catalog_status(self, request, tl, one, two, module, extra, prog):
-        resp = HttpResponse(mimetype='application/json')
-        #   Fetch a reduced version of the catalog to save time
-        data = {
+        return cached_json_response(request, self.catalog_status_cached, (prog,), lambda: self.catalog_status_data(prog))
+
+    @cache_function
+    def catalog_status_cached(self, prog):
+        return CachedJSON.from_data(self.catalog_status_data(prog))
+    catalog_status_cached.get_or_create_token(('prog',))
+    catalog_status_cached.serve_stale()
+    catalog_status_cached.depend_on_model(lambda: ClassSubject)
+    catalog_status_cached.depend_on_model(lambda: ClassSection)
+    catalog_status_cached.depend_on_cache(lambda: ClassSection.count_enrolled_students, lambda **kwargs: {})
+    catalog_status_cached.depend_on_model(lambda: ClassSizeRange)
+    catalog_status_cached.depend_on_model(lambda: ClassCategories)
+    catalog_status_cached.depend_on_m2m(lambda: Program, 'class_categories', lambda prog, category: {'prog': prog})
+    catalog_status_cached.depend_on_model(lambda: Event)
+    catalog_status_cached.depend_on_subtree(lambda: UserBit, lambda bit: bit.qsc, 'prog', lambda: Program,
+                                            lambda bit: bit.applies_to_verb('V/Flags/Registration/Teacher'))
+
+    def catalog_status_data(self, prog):
+        #   Fetch a reduced version of the catalog to save time; the querysets are encoded a row at a time
+        return {
             #   Todo: section current capacity ? (see ClassSection.get_capacity())
-            'classes': list(ClassSubject.objects.filter(parent_program=prog, status__gt=0).extra({'teacher_names': """SELECT array_to_string(array_agg(auth_user.first_name || ' ' || auth_user.last_name), ', ') FROM users_userbit, auth_user, datatree_datatree WHERE users_userbit.user_id = auth_user.id AND	users_userbit.qsc_id = program_class.anchor_id 	AND	users_userbit.verb_id = datatree_datatree.id AND datatree_datatree.uri = 'V/Flags/Registration/Teacher'""", 'class_size_max_optimal': """SELECT	program_classsizerange.range_max FROM program_classsizerange WHERE program_classsizerange.id = optimal_class_size_range_id"""}).values('id', 'class_size_max', 'class_size_max_optimal', 'class_info', 'grade_min', 'grade_max', 'anchor__name', 'anchor__friendly_name', 'teacher_names', 'category__symbol')),
-            'sections': list(ClassSection.objects.filter(parent_class__parent_program=prog, status__gt=0).extra({'event_ids':  """SELECT list("cal_event"."id") FROM "cal_event", "program_classsection_meeting_times" WHERE ("program_classsection_meeting_times"."event_id" = "cal_event"."id" AND "program_classsection_meeting_times"."classsection_id" = "program_classsection"."id")"""}).values('id', 'max_class_capacity', 'parent_class__id', 'anchor__name', 'enrolled_students', 'event_ids')),
-            'timeslots': list(prog.getTimeSlots().extra({'label': """to_char("start", 'Dy HH:MI -- ') || to_char("end", 'HH:MI AM')"""}).values_list('id', 'label')),
-            'categories': list(prog.class_categories.all().order_by('-symbol').values('id', 'symbol', 'category')),
+            'classes': ClassSubject.objects.filter(parent_program=prog, status__gt=0).extra({'teacher_names': """SELECT array_to_string(array_agg(auth_user.first_name || ' ' || auth_user.last_name), ', ') FROM users_userbit, auth_user, datatree_datatree WHERE users_userbit.user_id = auth_user.id AND	users_userbit.qsc_id = program_class.anchor_id 	AND	users_userbit.verb_id = datatree_datatree.id AND datatree_datatree.uri = 'V/Flags/Registration/Teacher'""", 'class_size_max_optimal': """SELECT	program_classsizerange.range_max FROM program_classsizerange WHERE program_classsizerange.id = optimal_class_size_range_id"""}).values('id', 'class_size_max', 'class_size_max_optimal', 'class_info', 'grade_min', 'grade_max', 'anchor__name', 'anchor__friendly_name', 'teacher_names', 'category__symbol'),
+            'sections': ClassSection.objects.filter(parent_class__parent_program=prog, status__gt=0).extra({'event_ids':  """SELECT list("cal_event"."id") FROM "cal_event", "program_classsection_meeting_times" WHERE ("program_classsection_meeting_times"."event_id" = "cal_event"."id" AND "program_classsection_meeting_times"."classsection_id" = "program_classsection"."id")"""}).values('id', 'max_class_capacity', 'parent_class__id', 'anchor__name', 'enrolled_students', 'event_ids'),
+            'timeslots': prog.getTimeSlots().extra({'label': """to_char("start", 'Dy HH:MI -- ') || to_char("end", 'HH:MI AM')"""}).values_list('id', 'label'),
+            'categories': prog.class_categories.all().order_by('-symbol').values('id', 'symbol', 'category'),
         }
-        simplejson.dump(data, resp)
-        return resp
     
     @aux_call
     @needs_onsite
@@ -50,6 +50,7 @@ from django.http import HttpResponse
 from django.views.decorators.cache import cache_control
 from django.views.decorators.vary import vary_on_cookie
 from esp.utils.no_autocookie import disable_csrf_cookie_update
+from esp.utils.json_stream import json_response
 from esp.cal.models import Event, EventType
 from esp.program.templatetags.class_render import render_class_direct
 from django.core.cache import cache
@@ -612,12 +613,15 @@ class StudentClassRegModule(ProgramModuleObj, module_ext.StudentClassRegModuleIn
       </p>
 """
 
+        #   Fetch all of the rendered classes from the cache at once
+        class_htmls = render_class_direct.map([(cls,) for cls in classes])
+
         class_category_id = None
-        for cls in classes:
+        for cls, class_html in zip(classes, class_htmls):
             if cls.category.id != class_category_id:
                 class_category_id = cls.category.id
                 class_blobs.append(category_header_str % (class_category_id, cls.category.category))
-            class_blobs.append(render_class_direct(cls))
+            class_blobs.append(class_html)
             class_blobs.append('<br />')
         context['class_descs'] = ''.join(class_blobs)
 
@@ -651,11 +655,7 @@ class StudentClassRegModule(ProgramModuleObj, module_ext.StudentClassRegModuleIn
         # using .extra() to select all the category text simultaneously
         classes = ClassSubject.objects.catalog(self.program)        
         
-        resp = HttpResponse(mimetype='application/json')
-        
-        simplejson.dump(list(classes), resp, default=json_encode)
-        
-        return resp
+        return json_response(request, classes, default=json_encode)
 
 
     @cache_control(public=True, max_age=3600)
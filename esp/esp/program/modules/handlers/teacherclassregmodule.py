@@ -275,6 +275,9 @@ class TeacherClassRegModule(ProgramModuleObj, module_ext.ClassRegModuleInfo):
                             new_reg = StudentRegistration(user=student, relationship=rel, section=sec)
                             new_reg.save()
                         
+                #   The enrollments above don't go through reserve_seat()
+                ClassSection.reconcile_seats([sec.id])
+
         #   Jazz up this information a little
         for student in students_list:
             student.bits = sec.getRegVerbs(student)
@@ -90,12 +90,6 @@ def prepare_program(program, data):
 def commit_program(prog, datatrees, userbits, modules, costs = (0, 0)):
     #   This function implements the changes suggested by prepare_program, by actually
     #   creating the necessary datatrees and userbits.
-    def gen_tree_node(tup):
-        new_node = DataTree.get_by_uri(tup[0], create=True)
-        new_node.friendly_name = tup[1]
-        new_node.save()
-        return new_node
-    
     def gen_userbit(tup):
         new_ub = UserBit()
         new_ub.verb = DataTree.get_by_uri(tup[0], create=True)
@@ -114,8 +108,13 @@ def commit_program(prog, datatrees, userbits, modules, costs = (0, 0)):
         new_ub.save()
         return new_ub
         
-    for dt_tup in datatrees:
-        gen_tree_node(dt_tup)
+    #   Create the whole program tree in one go, with room for the classes to come
+    nodes = DataTree.objects.create_many(datatrees, spacing=DataTree.SPARSE_SPACING)
+    for uri, friendly_name in datatrees:
+        node = nodes[uri.strip(DataTree.DELIMITER)]
+        if node.friendly_name != friendly_name:
+            node.friendly_name = friendly_name
+            node.save()
     
     for ub_tup in userbits:
         gen_userbit(ub_tup)
@@ -1051,4 +1051,341 @@ class MeetingTimesTest(ProgramFrameworkTest):
         self.assertSetEquals(section.get_meeting_times(), [ts2])
         section.meeting_times.remove(ts2)
         self.assertSetEquals(section.get_meeting_times(), [])
-        
\ No newline at end of file
+        
+class CacheWarmupTest(ProgramFrameworkTest):
+    def runTest(self):
+        from esp.program.cache_warmup import warm_program_caches, last_report, request_warmup, warmup_requested, run_requested_warmups
+        from esp.program.models import ClassSubject
+
+        report = warm_program_caches(self.program, processes=1)
+        for row in report['rows']:
+            self.assertEqual(row['errors'], [], 'Error warming %s: %s' % (row['label'], row['errors']))
+        self.assertEqual(last_report(self.program)['seconds'], report['seconds'])
+
+        #   The catalog should now come straight out of the cache
+        self.assertNotEqual(ClassSubject.objects.catalog_cached(self.program, cache_only=True), None)
+
+        #   Warm-ups asked for from the admin page are run, once, by the cron job
+        request_warmup(self.program)
+        self.assertTrue(warmup_requested(self.program))
+        self.assertEqual(run_requested_warmups(processes=1), [self.program])
+        self.assertFalse(warmup_requested(self.program))
+        self.assertFalse(last_report(self.program)['running'])
+        self.assertEqual(run_requested_warmups(processes=1), [])
+
+class SubtreeDependencyTest(ProgramFrameworkTest):
+    def runTest(self):
+        from esp.cache import registry
+        from esp.cache.argcache import ArgCache
+        from esp.program.models import Program
+
+        #   A throwaway cache keyed by program, depending on nearby UserBits
+        old_locked = registry._caches_locked
+        registry._caches_locked = False
+        try:
+            cache_obj = ArgCache('test_subtree_%d' % random.randint(0, 999999), ('program',))
+        finally:
+            registry._caches_locked = old_locked
+        cache_obj.depend_on_subtree(lambda: UserBit, lambda bit: bit.qsc, 'program', lambda: Program)
+        cache_obj.run_all_delayed()
+
+        verb = GetNode('V/Flags/Registration/Teacher')
+        cache_obj.set([self.program], 'foo')
+
+        #   A bit somewhere else in the tree leaves it alone...
+        UserBit.objects.create(user=self.teachers[0], verb=verb, qsc=GetNode('Q/Web/SubtreeDependencyTest'))
+        self.assertEqual(cache_obj.get([self.program]), 'foo')
+
+        #   ... but a bit under the program's anchor evicts it
+        UserBit.objects.create(user=self.teachers[0], verb=verb, qsc=self.program.classes()[0].anchor)
+        self.assertEqual(cache_obj.get([self.program]), None)
+
+class CatalogSnapshotTest(ProgramFrameworkTest):
+    def runTest(self):
+        from esp.program.models import ClassSubject, ClassCatalogSnapshot, StudentRegistration, RegistrationType
+        from datetime import datetime, timedelta
+
+        classes = ClassSubject.objects.filter(parent_program=self.program)
+        ClassCatalogSnapshot.objects.fill(classes)
+        self.assertEqual(ClassCatalogSnapshot.objects.filter(program=self.program).count(), classes.count())
+
+        #   The snapshot agrees with computing the statistics directly
+        select, select_params = ClassCatalogSnapshot.objects.stats_select()
+        direct = dict([(row[0], row[1:]) for row in classes.extra(select=select, select_params=select_params).values_list('id', *select.keys())])
+        for row in ClassCatalogSnapshot.objects.extra_for(classes).values_list('id', *select.keys()):
+            self.assertEqual(row[1:], direct[row[0]])
+
+        #   Classes without teachers or an index page have NULL id lists
+        for snapshot in ClassCatalogSnapshot.objects.filter(program=self.program):
+            self.assertNotEqual(snapshot.teacher_ids, '')
+            self.assertNotEqual(snapshot.index_qsd, '')
+
+        #   Enrolling a student expires that class's snapshot, and only that class's
+        section = self.program.sections()[0]
+        cls = section.parent_class
+        other = classes.exclude(id=cls.id)[0]
+        other_snapshot = ClassCatalogSnapshot.objects.get(subject=other)
+        enrolled = RegistrationType.objects.get_or_create(name='Enrolled', category='student')[0]
+        reg = StudentRegistration.objects.create(user=self.students[0], section=section, relationship=enrolled)
+        self.assertEqual(ClassCatalogSnapshot.objects.stale(ClassCatalogSnapshot.objects.extra_for(classes)), [cls.id])
+        self.assertEqual(ClassCatalogSnapshot.objects.get(subject=other).expires, other_snapshot.expires)
+
+        #   The catalog refreshes it and reads the snapshot
+        catalog = ClassSubject.objects.catalog_cached(self.program, force_all=True, use_cache=False)
+        self.assertEqual([c._num_students for c in catalog if c.id == cls.id], [1])
+        self.assertEqual(ClassCatalogSnapshot.objects.get(subject=cls).num_students, 1)
+        self.assertEqual(ClassCatalogSnapshot.objects.get(subject=other).updated, other_snapshot.updated)
+
+        reg.delete()
+        ClassSubject.objects.catalog_cached(self.program, force_all=True, use_cache=False)
+        self.assertEqual(ClassCatalogSnapshot.objects.get(subject=cls).num_students, 0)
+
+        #   A registration that starts later isn't counted yet, but is noted as the snapshot's expiry
+        start = datetime.now() + timedelta(hours=1)
+        reg = StudentRegistration.objects.create(user=self.students[0], section=section, relationship=enrolled, start_date=start)
+        ClassCatalogSnapshot.objects.refresh([cls.id])
+        snapshot = ClassCatalogSnapshot.objects.get(subject=cls)
+        self.assertEqual((snapshot.num_students, snapshot.expires), (0, start))
+
+        #   Once that time passes, with no signal sent, the catalog refreshes the snapshot
+        StudentRegistration.objects.filter(id=reg.id).update(start_date=datetime.now() - timedelta(minutes=1))
+        ClassCatalogSnapshot.objects.filter(subject=cls).update(expires=datetime.now() - timedelta(minutes=1))
+        catalog = ClassSubject.objects.catalog_cached(self.program, force_all=True, use_cache=False)
+        self.assertEqual([c._num_students for c in catalog if c.id == cls.id], [1])
+        self.assertEqual(ClassCatalogSnapshot.objects.get(subject=cls).num_students, 1)
+
+        #   Classes without a snapshot still show up, and get one
+        ClassCatalogSnapshot.objects.filter(subject=other).delete()
+        catalog = ClassSubject.objects.catalog_cached(self.program, force_all=True, use_cache=False)
+        self.assertTrue(other.id in [c.id for c in catalog])
+        self.assertTrue(ClassCatalogSnapshot.objects.filter(subject=other).exists())
+
+
+class SeatCounterTest(ProgramFrameworkTest):
+    def runTest(self):
+        from esp.program.models import ClassSection
+
+        section = self.program.sections()[0]
+        section.parent_class.class_size_max = 2
+        section.parent_class.save()
+        section.max_class_capacity = 2
+        section.save()
+        capacity = section._get_capacity()
+        self.assertEqual(section.enrolled_count(), 0)
+
+        #   Enrollment stops at the capacity, and the counter follows the registrations
+        for student in self.students[:capacity]:
+            self.assertTrue(section.preregister_student(student))
+        self.assertFalse(section.preregister_student(self.students[capacity]))
+        self.assertFalse(section.reserve_seat(capacity))
+        section = ClassSection.objects.get(id=section.id)
+        self.assertEqual(section.enrolled_students, capacity)
+        self.assertEqual(section.enrolled_count(), section.num_students())
+        self.assertTrue(section.isFull())
+        self.assertEqual(self.program.student_counts_by_section_id()[section.id], capacity)
+
+        section.unpreregister_student(self.students[0])
+        self.assertEqual(section.enrolled_count(), capacity - 1)
+        self.assertFalse(section.isFull())
+
+        #   Enrollments that skip reserve_seat() recount the section themselves
+        self.assertTrue(section.preregister_student(self.students[0], prereg_verb='Enrolled', fast_force_create=True))
+        self.assertEqual(section.enrolled_count(), capacity)
+        section.unpreregister_student(self.students[0])
+        self.assertEqual(section.enrolled_count(), capacity - 1)
+
+        #   Saving a copy loaded before an enrollment doesn't write back its old count
+        stale = ClassSection.objects.get(id=section.id)
+        self.assertTrue(section.preregister_student(self.students[0]))
+        stale.save()
+        self.assertEqual(section.enrolled_count(), capacity)
+        section.unpreregister_student(self.students[0])
+
+        #   Reconciliation repairs a corrupted counter
+        ClassSection.objects.filter(id=section.id).update(enrolled_students=17)
+        self.assertEqual(ClassSection.reconcile_seats(program=self.program), {section.id: (17, capacity - 1)})
+        self.assertEqual(ClassSection.objects.get(id=section.id).enrolled_students, capacity - 1)
+        self.assertEqual(section.enrolled_count(), capacity - 1)
+        self.assertEqual(ClassSection.reconcile_seats(program=self.program), {})
+
+
+class MailingListQueueTest(ProgramFrameworkTest):
+    def runTest(self):
+        import os, shutil, tempfile
+        import esp.mailman as mailman
+        from esp.dbmail.models import ListMembershipChange
+
+        #   Stand in for Mailman with scripts that log what they're asked to do
+        fake_dir = tempfile.mkdtemp()
+        log = os.path.join(fake_dir, 'log')
+        def fake_mailman(status, error=''):
+            for script in ('add_members', 'remove_members'):
+                path = os.path.join(fake_dir, script)
+                f = open(path, 'w')
+                f.write('#!/bin/sh\necho "%s $2" >> %s\ncat >> %s\necho >> %s\nprintf "%s" >&2\nexit %d\n' % (script, log, log, log, error, status))
+                f.close()
+                os.chmod(path, 0755)
+        fake_mailman(0)
+        old_settings = (mailman.USE_MAILMAN, mailman.MM_PATH)
+        mailman.USE_MAILMAN, mailman.MM_PATH = True, fake_dir + '/'
+        try:
+            section = self.program.sections()[0]
+            student = self.students[0]
+            student.email = 'student0@example.com'
+            student.save()
+
+            #   Registration only queues the changes
+            section.preregister_student(student, overridefull=True)
+            section.unpreregister_student(student)
+            section.preregister_student(student, overridefull=True)
+            self.assertFalse(os.path.exists(log))
+            self.assertEqual(ListMembershipChange.objects.filter(done__isnull=True).count(), 8)
+
+            #   Only the latest change to each address is made; a failed sync is retried later
+            fake_mailman(1)
+            self.assertEqual(mailman.sync_list_members(), 8)
+            self.assertEqual(ListMembershipChange.objects.filter(done__isnull=False, last_error__startswith='Superseded').count(), 5)
+            self.assertEqual(ListMembershipChange.objects.filter(done__isnull=True, attempts=1, next_attempt__gt=datetime.datetime.now()).count(), 3)
+            self.assertEqual(mailman.sync_list_members(), 0)
+
+            #   Each list gets one command, for the latest change to each address
+            ListMembershipChange.objects.update(next_attempt=datetime.datetime.now())
+            os.unlink(log)
+            fake_mailman(0)
+            self.assertEqual(mailman.sync_list_members(), 3)
+            self.assertEqual(ListMembershipChange.objects.filter(done__isnull=True).count(), 0)
+            commands = [line for line in open(log).read().split('\n') if line.endswith('-students')]
+            self.assertEqual(len(commands), 3)
+            self.assertTrue(all(line.startswith('add_members') for line in commands))
+            self.assertEqual(open(log).read().count(student.email), 3)
+
+            #   A failed add waiting for its retry is dropped once a later remove is made
+            fake_mailman(1)
+            mailman.queue_list_member('queuetest', student.email)
+            self.assertEqual(mailman.sync_list_members(), 1)
+            os.unlink(log)
+            fake_mailman(0)
+            mailman.queue_remove_list_member('queuetest', student.email.upper())
+            self.assertEqual(mailman.sync_list_members(), 1)
+            ListMembershipChange.objects.update(next_attempt=datetime.datetime.now())
+            self.assertEqual(mailman.sync_list_members(), 0)
+            self.assertEqual(ListMembershipChange.objects.filter(done__isnull=True).count(), 0)
+            self.assertFalse('add_members queuetest' in open(log).read())
+
+            #   Changes to a list that doesn't exist aren't retried
+            fake_mailman(1, 'No such list: missingtest')
+            mailman.queue_list_member('missingtest', student.email)
+            self.assertEqual(mailman.sync_list_members(), 1)
+            self.assertEqual(ListMembershipChange.objects.filter(done__isnull=True).count(), 0)
+            self.assertEqual(ListMembershipChange.objects.get(list_name='missingtest').last_error, 'No such list: missingtest')
+        finally:
+            mailman.USE_MAILMAN, mailman.MM_PATH = old_settings
+            shutil.rmtree(fake_dir)
+
+
+class LotteryPreferenceTest(ProgramFrameworkTest):
+    def runTest(self):
+        from django.db import connection
+        from django.db.models import signals
+        from esp.program.controllers.lottery import LotteryPreferenceController
+        from esp.program.models import StudentRegistration, RegistrationType
+
+        controller = LotteryPreferenceController(self.program)
+        student = self.students[0]
+        sections = list(self.program.sections().order_by('id'))
+        section_ids = [s.id for s in sections]
+        priority = RegistrationType.objects.get_or_create(name='Priority/1', category='student')[0]
+        interested = RegistrationType.objects.get_or_create(name='Interested', category='student')[0]
+
+        def current():
+            return set(StudentRegistration.valid_objects().filter(user=student).values_list('section', 'relationship__name'))
+
+        def set_preferences(preferences):
+            """ Returns the number of queries it took """
+            old_debug_cursor = connection.use_debug_cursor
+            connection.use_debug_cursor = True
+            start = len(connection.queries)
+            try:
+                self.assertEqual(controller.set_preferences(student, preferences), [])
+            finally:
+                connection.use_debug_cursor = old_debug_cursor
+            return len(connection.queries) - start
+
+        #   Flag some sections and be interested in all of them
+        self.assertEqual(sections[0].students_dict(), {})
+        set_preferences({priority: section_ids[:5], interested: section_ids})
+        self.assertEqual(current(), set([(id, 'Priority/1') for id in section_ids[:5]] + [(id, 'Interested') for id in section_ids]))
+        self.assertEqual(set(sections[0].students_dict().keys()), set(['Interested', 'Priority/1']))
+
+        #   Changing every section takes as many queries as changing one
+        kept_reg = StudentRegistration.valid_objects().get(user=student, section=section_ids[0], relationship=interested)
+        many_queries = set_preferences({priority: section_ids[5:], interested: section_ids[:1]})
+        self.assertEqual(current(), set([(id, 'Priority/1') for id in section_ids[5:]] + [(section_ids[0], 'Interested')]))
+        self.assertTrue(StudentRegistration.valid_objects().filter(id=kept_reg.id).exists())
+        one_query = set_preferences({priority: section_ids[6:], interested: section_ids[:2]})
+        self.assertEqual(current(), set([(id, 'Priority/1') for id in section_ids[6:]] + [(id, 'Interested') for id in section_ids[:2]]))
+        self.assertEqual(many_queries, one_query)
+        self.assertTrue(many_queries <= 10)
+
+        #   The registrations the signals are sent for have their real ids
+        sent = []
+        def receiver(sender, instance, **kwargs):
+            sent.append(instance.id)
+        signals.post_save.connect(receiver, sender=StudentRegistration)
+        try:
+            set_preferences({priority: section_ids[7:], interested: section_ids[:3]})
+        finally:
+            signals.post_save.disconnect(receiver, sender=StudentRegistration)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(set(StudentRegistration.objects.filter(id__in=sent).values_list('section', 'relationship__name')),
+                         set([(section_ids[6], 'Priority/1'), (section_ids[2], 'Interested')]))
+
+        #   Unmentioned types are left alone, and unknown sections are reported
+        self.assertEqual(controller.set_preferences(student, {interested: [-1]}), [-1])
+        self.assertEqual(current(), set([(id, 'Priority/1') for id in section_ids[7:]]))
+        self.assertEqual(sections[0].students_dict(), {})
+
+
+class TimeslotBitsTest(ProgramFrameworkTest):
+    """ Check the bitset versions of students' schedules against their
+        timeslots, and that they're kept up to date.
+    """
+    def runTest(self):
+        from esp.program.models import ScheduleMap
+
+        conflict_text = 'This section conflicts with your schedule--check out the other sections!'
+        student = self.students[0]
+        program = self.program
+        (section_list, timeslot_list) = randomized_attrs(program)
+        timeslot_list.sort(key=lambda t: t.start)
+        section1 = section_list[0]
+        section_list[0].assign_start_time(timeslot_list[0])
+        section_list[1].assign_start_time(timeslot_list[0])
+        section_list[2].assign_start_time(timeslot_list[-1])
+        self.assertEqual(student.getEnrolledTimeslotBits(program), 0)
+        self.assertEqual(ScheduleMap.from_bits(student, program, 0).map, ScheduleMap(student, program).map)
+
+        #   Enroll the student; the bitset has their section's timeslots
+        section1.preregister_student(student)
+        bits = student.getEnrolledTimeslotBits(program)
+        self.assertEqual(bits, section1.timeslot_bits())
+        self.assertEqual(set(program.timeslot_ids_from_bits(bits)), set(section1.timeslot_ids()))
+        sm = ScheduleMap(student, program)
+        self.assertEqual(sm.bits, bits)
+        for tid in section1.timeslot_ids():
+            self.assertEqual(sm.map[tid], [section1])
+
+        #   Conflicts found with the bitsets are the ones found with the timeslots
+        for sec in section_list[1:]:
+            if sec.parent_class_id == section1.parent_class_id:
+                continue
+            expected = bool(set(sec.timeslot_ids()) & set(section1.timeslot_ids()))
+            self.assertEqual(sec.cannotAdd(student) == conflict_text, expected)
+        self.assertTrue(section1.parent_class_id in student.getEnrolledClassIds(program))
+        self.assertEqual(program.timeslot_bit_index(), program.timeslot_bit_index(use_cache=False))
+
+        #   Rescheduling the section updates the cached bitset
+        section1.assign_start_time(timeslot_list[-1])
+        self.assertEqual(set(program.timeslot_ids_from_bits(student.getEnrolledTimeslotBits(program))), set(section1.timeslot_ids()))
+        section1.unpreregister_student(student)
+        self.assertEqual(student.getEnrolledTimeslotBits(program), 0)
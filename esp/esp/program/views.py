@@ -57,6 +57,7 @@ from esp.program.models import Program, TeacherBio, RegistrationType, ClassSecti
 from esp.program.forms import ProgramCreationForm, StatisticsQueryForm
 from esp.program.setup import prepare_program, commit_program
 from esp.program.controllers.confirmation import ConfirmationEmailController
+from esp.program.controllers.lottery import LotteryPreferenceController
 from esp.accounting_docs.models import Document
 from esp.middleware import ESPError
 from esp.accounting_core.models import LineItemType, CompletedTransactionException
@@ -109,6 +110,11 @@ def lottery_student_reg_simple(request, program = None):
     return render_to_response('program/modules/lotterystudentregmodule/student_reg_simple.html', request, None, {})
 
 
+def _section_emailcodes(section_ids):
+    """ The emailcodes of the sections that exist, so errors can say which class they were about. """
+    sections = ClassSection.objects.filter(id__in=section_ids).select_related('parent_class', 'parent_class__category')
+    return dict([(s.id, s.emailcode()) for s in sections])
+
 #@transaction.commit_manually
 @login_required
 def lsr_submit(request, program = None): 
@@ -157,10 +163,7 @@ def lsr_submit(request, program = None):
     flagworthy_sections = ClassSection.objects.filter(id__in=flag_related_sections-already_flagged_secids).select_related('anchor').annotate(first_block=Min('meeting_times__start'))
     
     sections_by_block = defaultdict(list)
-    sections_by_id = {}   
     for s in list(flagworthy_sections) + list(already_flagged_sections):
-        sections_by_id[int(s.id)] = s
-        print s.first_block
         if int(s.id) not in classes_not_flagged:
             sections_by_block[s.first_block].append(s)
 
@@ -168,28 +171,15 @@ def lsr_submit(request, program = None):
         if len(val) > 1:
             errors.append({"text": "Can't flag two classes at the same time!", "cls_sections": [x.id for x in val], "block": val[0].firstBlockEvent().id, "flagged": True})
 
+    #   Write all of the changes at once; leave the flags alone if they conflict
+    preferences = {reg_interested: classes_interest}
     if len(errors) == 0:
-        for s_id in (already_flagged_secids - classes_flagged):
-            sections_by_id[s_id].unpreregister_student(request.user, prereg_verb=reg_priority.name)
-        for s_id in classes_flagged - already_flagged_secids:
-            if not sections_by_id[s_id].preregister_student(request.user, prereg_verb=reg_priority.name, overridefull=True):
-                errors.append({"text": "Unable to add flagged class", "cls_sections": [s_id], "emailcode": sections_by_id[s_id].emailcode(), "block": None, "flagged": True})
-
-    already_interested_sections = request.user.getSections(program=program, verbs=[reg_interested])
-    already_interested_secids = set(int(x.id) for x in already_interested_sections)
-    interest_related_sections = classes_interest | classes_no_interest
-    sections = ClassSection.objects.filter(id__in = (interest_related_sections - flag_related_sections - already_flagged_secids - already_interested_secids)).select_related('anchor')
-
-    ## No need to reset sections_by_id
-    for s in list(sections) + list(already_interested_sections):
-        sections_by_id[int(s.id)] = s
-
-    for s_id in (already_interested_secids - classes_interest):
-        sections_by_id[s_id].unpreregister_student(request.user, prereg_verb=reg_interested.name)
-    for s_id in classes_interest - already_interested_secids:
-        print s_id
-        if not sections_by_id[s_id].preregister_student(request.user, prereg_verb=reg_interested.name, overridefull=True):
-            errors.append({"text": "Unable to add interested class", "cls_sections": [s_id], "emailcode": sections_by_id[s_id].emailcode(), "block": None, "flagged": False})
+        preferences[reg_priority] = classes_flagged
+    rejected = LotteryPreferenceController(program).set_preferences(request.user, preferences)
+    emailcodes = _section_emailcodes(rejected)
+    for s_id in rejected:
+        flagged = (s_id in classes_flagged and len(errors) == 0)
+        errors.append({"text": flagged and "Unable to add flagged class" or "Unable to add interested class", "cls_sections": [s_id], "emailcode": emailcodes.get(s_id), "block": None, "flagged": flagged})
 
     if len(errors) != 0:
         s = StringIO()
@@ -230,31 +220,13 @@ def lsr_submit_HSSP(request, program, priority_limit, data):  # temporary functi
     reg_priority = [(None,None)] + [RegistrationType.objects.get_or_create(name="Priority/"+str(i), category="student") for i in range(1,priority_limit+1)]
     reg_priority = [reg_priority[i][0] for i in range(0, priority_limit+1)] 
     
-    allStudentRegistrations = StudentRegistration.valid_objects().filter(section__parent_class__parent_program=program, user=request.user)
-    oldRegistrations = [] #[[] for i in range(0, priority_limit+1)] # 1-indexed for priority registrations, the 0-index is for interested registrations
-    
-    for i in range(1, priority_limit+1):
-        oldRegistrations += [(oldRegistration, i) for oldRegistration in list(allStudentRegistrations.filter(relationship=reg_priority[i]).select_related(depth=3))]
-    
-    for (oldRegistration, priority) in oldRegistrations:
-        if oldRegistration.section.id not in classes_flagged[0]:
-            oldRegistration.expire()
-            continue
-        for i in range(1, priority_limit + 1):
-            if oldRegistration.section.id in classes_flagged[i]:
-                if i != priority:
-                    oldRegistration.expire()
-                elif i == priority:
-                    classes_flagged[i].remove(oldRegistration.section.id)
-                    classes_flagged[0].remove(oldRegistration.section.id)
-                break
-    
-    flagworthy_sections = [None] + [ClassSection.objects.filter(id__in=classes_flagged[i]).select_related('anchor').select_related(depth=2).annotate(first_block=Min('meeting_times__start')) for i in range(1, priority_limit + 1)]
+    preferences = dict([(reg_priority[i], classes_flagged[i]) for i in range(1, priority_limit+1)])
+    rejected = LotteryPreferenceController(program).set_preferences(request.user, preferences)
+    emailcodes = _section_emailcodes(rejected)
     
-    for i in range(1, priority_limit + 1):
-        for s in list(flagworthy_sections[i]):
-            if not s.preregister_student(request.user, prereg_verb=reg_priority[i].name, overridefull=True):
-                errors.append({"text": "Unable to add flagged class", "cls_sections": [s.id], "emailcode": s.emailcode(), "block": s.first_block, "flagged": True, "priority": i, "doubled_priority": False})
+    for section_id in rejected:
+        priority, block_id = data[str(section_id)]
+        errors.append({"text": "Unable to add flagged class", "cls_sections": [section_id], "emailcode": emailcodes.get(section_id), "block": int(block_id), "flagged": True, "priority": int(priority), "doubled_priority": False})
 
     if len(errors) != 0:
         s = StringIO()
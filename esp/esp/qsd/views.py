@@ -85,11 +85,8 @@ def handle_ajax_mover(method):
         tree_nodes = DataTree.get_only_parents(DataTree.objects.filter(navbar__in = entries))
 
         edit_verb = GetNode(EDIT_PERM)
-        for node in tree_nodes:
-            if not UserBit.UserHasPerms(request.user,
-                            node,
-                            edit_verb):
-                return method(request, *args, **kwargs)
+        if not all(UserBit.objects.bulk_has_perms_on(request.user, tree_nodes, edit_verb).values()):
+            return method(request, *args, **kwargs)
 
         # now we've properly assessed the person knows what
         # they're doing. We actually do the stuff we wanted.
@@ -76,6 +76,8 @@ DEFAULT_HOST = SITE_INFO[1]
 
 #CACHE_BACKEND = "esp.utils.memcached_multikey://174.129.184.116:11211/?timeout=%d" % DEFAULT_CACHE_TIMEOUT
 CACHE_BACKEND = "esp.utils.memcached_multikey://127.0.0.1:11211/?timeout=%d" % DEFAULT_CACHE_TIMEOUT
+#   Keeps the hottest lookups in each process as well; see esp/utils/memcached_twotier.py
+#CACHE_BACKEND = "esp.utils.memcached_twotier://127.0.0.1:11211/?timeout=%d" % DEFAULT_CACHE_TIMEOUT
 
 MIDDLEWARE_CLASSES = tuple([pair[1] for pair in sorted(MIDDLEWARE_GLOBAL + MIDDLEWARE_LOCAL)])
 
@@ -48,6 +48,7 @@ class Tag(models.Model):
                 return cls.objects.get(key=key, content_type__isnull=True, object_id__isnull=True).value
         except cls.DoesNotExist:
             return default
+    getTag.memoize_per_request()
     getTag.depend_on_row(lambda: Tag, lambda tag: {'key': tag.key, 'target': tag.target})
     getTag = classmethod(getTag)
 
@@ -618,6 +618,40 @@ class ESPUser(User, AnonymousUser):
     getEnrolledSectionsFromProgram.depend_on_row(get_sr_model, lambda reg: {'self': reg.user})
     getEnrolledSectionsFromProgram.depend_on_cache(get_tsid_function, lambda self=wildcard, **kwargs: {})
 
+    #   Cached in place of a None from Program.timeslot_bits(), which the cache can't hold
+    NO_TIMESLOT_BITS = -1
+
+    @cache_function
+    def getEnrolledTimeslotBits_cached(self, program):
+        timeslot_ids = set()
+        for sec in self.getEnrolledSectionsFromProgram(program):
+            timeslot_ids.update(sec._timeslot_ids)
+        bits = program.timeslot_bits(timeslot_ids)
+        if bits is None:
+            return ESPUser.NO_TIMESLOT_BITS
+        return bits
+    def get_timeslot_list_function():
+        from esp.program.models import Program
+        return Program.getTimeSlotList
+    getEnrolledTimeslotBits_cached.get_or_create_token(('program',))
+    getEnrolledTimeslotBits_cached.depend_on_row(get_sr_model, lambda reg: {'self': reg.user})
+    getEnrolledTimeslotBits_cached.depend_on_cache(get_tsid_function, lambda self=wildcard, **kwargs: {})
+    getEnrolledTimeslotBits_cached.depend_on_cache(get_timeslot_list_function, lambda self=wildcard, **kwargs: {'program': self})
+
+    def getEnrolledTimeslotBits(self, program):
+        """ The timeslots of this user's enrolled sections as a bitset, for
+        quick conflict checks; see Program.timeslot_bits(). """
+        bits = self.getEnrolledTimeslotBits_cached(program)
+        if bits == ESPUser.NO_TIMESLOT_BITS:
+            return None
+        return bits
+
+    @cache_function
+    def getEnrolledClassIds(self, program):
+        """ The ids of the classes this user is enrolled in a section of. """
+        return list(set([sec.parent_class_id for sec in self.getEnrolledSectionsFromProgram(program)]))
+    getEnrolledClassIds.depend_on_row(get_sr_model, lambda reg: {'self': reg.user})
+
     def getEnrolledSectionsAll(self):
         return self.getSections(None, verbs=['Enrolled'])
 
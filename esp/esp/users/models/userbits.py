@@ -1,10 +1,12 @@
 # system dependencies
 from django.core.cache import cache
-from django.db import models
+from django.core.signals import request_started, request_finished
+from django.db import models, connection, transaction
 from django.contrib.auth.models import User, AnonymousUser
 import datetime
 import random
 import string
+import threading
 import time
 
 # esp dependencies
@@ -17,13 +19,138 @@ from esp.users.models import ESPUser
 from esp.datatree.models import *
 
 import operator
-from esp.datatree.sql.query_utils import QTree
+from esp.datatree.sql.query_utils import QTree, QTreeBelowAny
+
+qn = connection.ops.quote_name
 
 
 __all__ = ['UserBit','UserBitImplication']
 
 ascii_set = string.lowercase + string.uppercase + string.digits + '/=\:;.<>'
 
+def _user_id(user):
+    """ The id to index a user's permissions under; None for anonymous and missing users. """
+    if isinstance(user, (int, long)):
+        if user < 0:
+            return None
+        return user
+    return getattr(user, 'id', None)
+
+# Permission indexes already fetched during this request, by user id.
+# Only kept between request_started and request_finished, like
+# memoize_per_request(), so scripts always go back to the cache.
+_index_memo = threading.local()
+
+def _begin_index_memo(**kwargs):
+    _index_memo.indexes = {}
+
+def _end_index_memo(**kwargs):
+    _index_memo.indexes = None
+
+request_started.connect(_begin_index_memo)
+request_finished.connect(_end_index_memo)
+
+def _forget_indexes(user_id=None):
+    """ Drop the memoized index for user_id, or all of them if user_id is None. """
+    indexes = getattr(_index_memo, 'indexes', None)
+    if indexes:
+        if user_id is None:
+            indexes.clear()
+        else:
+            indexes.pop(user_id, None)
+
+class PermissionIndex(object):
+    """
+    Everything needed to answer permission questions about one user in memory:
+    the user's unexpired bits, including the ones UserBitImplications created,
+    or the public (user=NULL) ones for user_id=None.  The public index is
+    cached once and merged() into each user's when they are read.
+
+    Nodes are compared through DataTree.ancestor_ids() rather than their
+    ranges, since the ranges shift whenever the tree grows and the index
+    can outlive that.
+    """
+
+    def __init__(self, user_id, now):
+        self.user_id = user_id
+        self.built = now
+        self.valid_until = datetime.datetime.max
+
+        if user_id is None:
+            users = Q(user__isnull=True)
+        else:
+            users = Q(user=user_id)
+        rows = UserBit.objects.filter(users, enddate__gt=now).values_list(
+            'id', 'user_id', 'qsc_id', 'verb_id', 'startdate', 'enddate', 'recursive')
+
+        self.bits = []
+        self.exact = set()        # (verb_id, qsc_id) of every bit
+        self.recursive = {}       # verb_id -> qsc_ids of recursive bits
+        self.own_verbs = set()    # Nodes of the user's own bits, for user_has_TYPE
+        self.own_qscs = set()
+        for row in rows:
+            bit_id, bit_user_id, qsc_id, verb_id, startdate, enddate, recursive = row
+            if startdate > now:
+                # Not yet; the index has to be rebuilt when it starts
+                self.valid_until = min(self.valid_until, startdate)
+                continue
+            self.valid_until = min(self.valid_until, enddate)
+            self.bits.append(row)
+            self.exact.add((verb_id, qsc_id))
+            if recursive:
+                self.recursive.setdefault(verb_id, set()).add(qsc_id)
+            if bit_user_id is not None:
+                self.own_verbs.add(verb_id)
+                self.own_qscs.add(qsc_id)
+
+    def is_current(self, now):
+        return self.built <= now < self.valid_until
+
+    def merged(self, other):
+        """ A new index with the bits of both this one and other """
+        index = PermissionIndex.__new__(PermissionIndex)
+        index.user_id = self.user_id if self.user_id is not None else other.user_id
+        index.built = max(self.built, other.built)
+        index.valid_until = min(self.valid_until, other.valid_until)
+        index.bits = self.bits + other.bits
+        index.exact = self.exact | other.exact
+        index.recursive = dict(self.recursive)
+        for verb_id, qsc_ids in other.recursive.iteritems():
+            index.recursive[verb_id] = index.recursive.get(verb_id, set()) | qsc_ids
+        index.own_verbs = self.own_verbs | other.own_verbs
+        index.own_qscs = self.own_qscs | other.own_qscs
+        return index
+
+    def has_perms(self, qsc_id, verb_id, recursive_required=False):
+        """ Same answer as the userbit__user_has_perms procedure """
+        if not recursive_required and (verb_id, qsc_id) in self.exact:
+            return True
+        qsc_ancestors = DataTree.ancestor_ids(qsc_id)
+        for ancestor_id in DataTree.ancestor_ids(verb_id):
+            qsc_ids = self.recursive.get(ancestor_id)
+            if qsc_ids and qsc_ids & qsc_ancestors:
+                return True
+        return False
+
+    def has_node(self, node_id, node_type='qsc'):
+        """ Does the user have a bit of their own on node_id or anything above it? """
+        own = (node_type == 'verb') and self.own_verbs or self.own_qscs
+        return bool(own & DataTree.ancestor_ids(node_id))
+
+    def bits_for_verb(self, verb_id, qsc_root_id=None):
+        """ Same bits as the userbit__bits_get_qsc(_root) procedures """
+        verb_ancestors = DataTree.ancestor_ids(verb_id)
+        bits = []
+        for bit_id, bit_user_id, qsc_id, bit_verb_id, startdate, enddate, recursive in self.bits:
+            if bit_verb_id != verb_id and not (recursive and bit_verb_id in verb_ancestors):
+                continue
+            if qsc_root_id is not None and qsc_root_id not in DataTree.ancestor_ids(qsc_id):
+                continue
+            bits.append(UserBit(id=bit_id, user_id=bit_user_id, qsc_id=qsc_id, verb_id=bit_verb_id,
+                                startdate=startdate, enddate=enddate, recursive=recursive))
+        return bits
+
+
 class UserBitManager(ProcedureManager):
 
     """
@@ -98,12 +225,27 @@ class UserBitManager(ProcedureManager):
             current_key = cache.get(user_key)
             return current_key or new_key
 
+        def get_index_key(self):
+            """
+            Returns the key of the user's PermissionIndex (the public one for
+            no user).  It doesn't depend on the global key, since a user's
+            index only holds their own bits.
+            """
+            user_id = _user_id(self.user)
+            if user_id is None:
+                return 'UserBit_index_public'
+            return 'UserBit_index_%s' % user_id
+
         def update(self):
             """ Purges all userbit-related cache. """
             if self.user or (hasattr(self.user, 'id') and self.user.id is not None):
                 cache.delete(self.get_key_to_get_user_key())
+                cache.delete(self.get_index_key())
+                _forget_indexes(_user_id(self.user))
             else:
                 self.delete_global_key()
+                cache.delete(self.get_index_key())
+                _forget_indexes()
 
 
         def _prefix_user_key(self, key):
@@ -123,11 +265,40 @@ class UserBitManager(ProcedureManager):
 
     cache = UserBitCache
 
+    def _cached_index(self, user_id, now):
+        """ The PermissionIndex of just user_id's bits (the public ones for None), from the cache or the database. """
+        key = self.cache(user_id).get_index_key()
+        index = cache.get(key)
+        if index is None or not index.is_current(now):
+            index = PermissionIndex(user_id, now)
+            cache.set(key, index, self.cache.cache_time)
+        return index
+
+    def permission_index(self, user):
+        """
+        Returns the PermissionIndex for user, from this request, the cache or the database.
+        The user's own bits and the public ones are cached separately, so that
+        changing a public bit doesn't invalidate every user's index, and merged here.
+        """
+        user_id = _user_id(user)
+        now = datetime.datetime.now()
+        indexes = getattr(_index_memo, 'indexes', None)
+        index = indexes and indexes.get(user_id)
+        if index is None or not index.is_current(now):
+            index = self._cached_index(None, now)
+            if user_id is not None:
+                index = self._cached_index(user_id, now).merged(index)
+            if indexes is not None:
+                indexes[user_id] = index
+        return index
+
     def user_has_TYPE(self, user, node, node_type='qsc'):
         """
         Returns true if the user has the verb anywhere. False otherwise.
         """
         node_id = getattr(node, 'id', node)
+        if _user_id(user) is not None:
+            return self.permission_index(user).has_node(node_id, node_type)
         col_filter = '%s__above' % node_type
         cache_key  = 'has_%s__%s' % (node_type, node_id)
 
@@ -171,6 +342,9 @@ class UserBitManager(ProcedureManager):
         If 'qsc_root' is specified, only return qsc structures at or below the specified node.
         """
 
+        if node_type == 'qsc' and now is None and end_of_now is None:
+            return self.permission_index(user).bits_for_verb(node.id, getattr(node_root, 'id', node_root))
+
         user_cache_id = 'bit_get_%s__%s,%s,%s,%s' % (node_type, node.id, now, end_of_now,
                                                      node_root)
 
@@ -232,14 +406,16 @@ class UserBitManager(ProcedureManager):
 
         q_list = self.bits_get_qsc( user, verb )
         #q_list = self.filter(id__in=(x.id for x in q_list)).select_related('qsc')
-        query_list = []
-        for bit in q_list:
-            if bit.recursive:
-                query_list.append(QTree(anchor__below=bit.qsc_id))
-            else:
-                query_list.append(Q(anchor=bit.qsc_id))
-
-        query = Model.objects.filter(reduce(operator.or_, query_list, Q(id=-1))).distinct()
+        # One merged set of ranges for the recursive bits, rather than a QTree apiece
+        below_ids = set([bit.qsc_id for bit in q_list if bit.recursive])
+        exact_ids = set([bit.qsc_id for bit in q_list if not bit.recursive]) - below_ids
+        query_list = [Q(id=-1)]
+        if below_ids:
+            query_list.append(QTreeBelowAny('anchor', below_ids))
+        if exact_ids:
+            query_list.append(Q(anchor__in=exact_ids))
+
+        query = Model.objects.filter(reduce(operator.or_, query_list)).distinct()
         if qsc is not None:
             query = query.filter(QTree(anchor__below = qsc))
 
@@ -248,6 +424,16 @@ class UserBitManager(ProcedureManager):
 	# Operation Complete!
 	return query
 
+    @staticmethod
+    def _node_id(node):
+        """ The id of a DataTree node given as a node, id or URI; None if there's no such node """
+        if isinstance(node, basestring):
+            try:
+                return DataTree.get_by_uri(node).id
+            except DataTree.NoSuchNodeException:
+                return None
+        return getattr(node, 'id', node)
+
     def UserHasPerms(self, user, qsc, verb, now = None, recursive_required = False):
         """ Given a user, a permission, and a subject, return True if the user, or all users,
         has been Granted [subject] on [permission]; False otherwise """
@@ -257,14 +443,19 @@ class UserBitManager(ProcedureManager):
         # axiak 5/26/07: This is very different now.
         # axiak 6/9/07:  It even uses plpgsql functions.
 
+        # The in-memory index covers the usual question, about right now;
+        # the procedure is kept for questions about other times.
+        if now is None:
+            qsc_id = self._node_id(qsc)
+            verb_id = self._node_id(verb)
+            if qsc_id is None or verb_id is None:
+                return False
+            return self.permission_index(user).has_perms(qsc_id, verb_id, recursive_required)
+
         ##########################
         # Set caching parameters #
         ##########################
-        if now == None:
-            now = datetime.datetime.now()
-            now_id = "None"
-        else:
-            now_id = "-".join(str(i) for i in datetime.datetime.now().timetuple())
+        now_id = "-".join(str(i) for i in datetime.datetime.now().timetuple())
 
         if isinstance(qsc, basestring):
             qsc_cache = 'S' + qsc
@@ -330,6 +521,75 @@ class UserBitManager(ProcedureManager):
 
         return retVal
 
+    def _bulk_perms(self, user_ids, qsc_ids, verb, now, recursive_required):
+        """
+        The (user_id, qsc_id) pairs, from user_ids and qsc_ids, for which the user
+        has been granted verb on the qsc.  A user_id of None means every user.
+        One query: the userbit__user_has_perms procedure, joined against all of
+        the qscs at once.
+        """
+        if not user_ids or not qsc_ids:
+            return set()
+        verb_id = self._node_id(verb)
+        if verb_id is None:
+            return set()
+        if now is None:
+            now = datetime.datetime.now()
+
+        db_userbit = qn(UserBit._meta.db_table)
+        db_tree = qn(DataTree._meta.db_table)
+        real_user_ids = [user_id for user_id in user_ids if user_id is not None]
+        if real_user_ids:
+            user_clause = "(ub.user_id IS NULL OR ub.user_id IN (%s))" % ", ".join(["%s"] * len(real_user_ids))
+        else:
+            user_clause = "ub.user_id IS NULL"
+        match_clause = ("(ub.recursive = %s AND "
+                        "bit_verb.rangestart <= verb.rangestart AND bit_verb.rangeend >= verb.rangeend AND "
+                        "bit_qsc.rangestart <= qsc.rangestart AND bit_qsc.rangeend >= qsc.rangeend)")
+        if not recursive_required:
+            match_clause = "(%s OR (ub.verb_id = verb.id AND ub.qsc_id = qsc.id))" % match_clause
+
+        sql = ("SELECT DISTINCT ub.user_id, qsc.id FROM %s AS ub "
+               "INNER JOIN %s AS bit_verb ON ub.verb_id = bit_verb.id "
+               "INNER JOIN %s AS bit_qsc ON ub.qsc_id = bit_qsc.id "
+               "INNER JOIN %s AS verb ON verb.id = %%s "
+               "INNER JOIN %s AS qsc ON qsc.id IN (%s) "
+               "WHERE %s AND ub.startdate <= %%s AND ub.enddate > %%s AND %s") % \
+               (db_userbit, db_tree, db_tree, db_tree, db_tree, ", ".join(["%s"] * len(qsc_ids)),
+                user_clause, match_clause)
+        params = [verb_id] + list(qsc_ids) + real_user_ids + [now, now, True]
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return set(cursor.fetchall())
+
+    def bulk_user_has_perms(self, users, qsc, verb, now = None, recursive_required = False):
+        """
+        UserHasPerms for many users at once, in one query.
+        Returns a dict from each user's id to True or False.
+        """
+        user_ids = set([_user_id(user) for user in users])
+        qsc_id = self._node_id(qsc)
+        if qsc_id is None:
+            return dict((user_id, False) for user_id in user_ids)
+
+        granted = set([user_id for user_id, granted_qsc_id in self._bulk_perms(user_ids, [qsc_id], verb, now, recursive_required)])
+        if None in granted:
+            # A bit for everyone
+            return dict((user_id, True) for user_id in user_ids)
+        return dict((user_id, user_id in granted) for user_id in user_ids)
+
+    def bulk_has_perms_on(self, user, qscs, verb, now = None, recursive_required = False):
+        """
+        UserHasPerms for one user on many qscs at once, in one query.
+        Returns a dict from each qsc's id to True or False.
+        """
+        qsc_ids = set([self._node_id(qsc) for qsc in qscs])
+        qsc_ids.discard(None)
+
+        granted = set([qsc_id for user_id, qsc_id in self._bulk_perms([_user_id(user)], list(qsc_ids), verb, now, recursive_required)])
+        return dict((qsc_id, qsc_id in granted) for qsc_id in qsc_ids)
+
 
 class UserBit(models.Model):
 
@@ -561,6 +821,13 @@ class UserBit(models.Model):
 # UserBitImplications do scary things #
 #######################################
 
+# Where UserBitImplication.applyAllImplications() got to: the oldest transaction
+# (as a Postgres txid) still running when it last started, and when that was.
+# Any bit written or updated since has an xmin at least that.
+IMPLICATIONS_APPLIED_TAG = 'userbit_implications_applied_txid'
+IMPLICATIONS_APPLIED_AT_TAG = 'userbit_implications_applied_at'
+IMPLICATIONS_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 
 
 
@@ -626,19 +893,19 @@ class UserBitImplication(models.Model):
             This should be executed *after* a userbit has been deleted.
             (i.e. this should be run from UserBit.delete() 
         """
-        implications = UserBitImplication.get_under_bit(old_userbit)
-
-        # first we go through all implications
-        for implication in implications:
-            # now we get all the bits this implication created
-            for bit in implication.created_bits.all():
-                # if there is no other way this implication is valid for this user
-                # delete...
-                if not UserBit.UserHasPerms(user = bit.user,
-                                            qsc  = old_userbit.qsc,
-                                            verb = old_userbit.verb):
-                    bit.delete()
-        
+        implications = list(UserBitImplication.get_under_bit(old_userbit))
+        affected = set()
+        # The bits deleted may have implied more bits in turn
+        for depth in range(10):
+            stale = set()
+            for implication in implications:
+                stale.update(implication._prune([old_userbit.user_id]))
+            if not stale:
+                break
+            affected.update(stale)
+            implications = list(UserBitImplication.objects.all())
+        transaction.commit_unless_managed()
+        UserBitImplication._invalidate(affected)
         
     def impliedBit(self, originalBit):
         """ Returns the implied userbit if a bit is given. """
@@ -661,14 +928,13 @@ class UserBitImplication(models.Model):
         """ This will check to see if the addition of this userbit
             should force other userbits to be created via implications.
         """
-        implications = UserBitImplication.get_under_bit(userbit)
-
-        for implication in implications:
-            newbit = implication.impliedBit(userbit)
-
-            newbit.save()
-
-            implication.created_bits.add(newbit)
+        if userbit.enddate <= datetime.datetime.now():
+            # Expired, so the bits it implied may have to go
+            UserBitImplication.deleteUserBit(userbit)
+            return
+        implications = list(UserBitImplication.get_under_bit(userbit))
+        if implications:
+            UserBitImplication._propagate(implications, "o.id = %s", [userbit.id])
 
     def save(self, *args, **kwargs):
         super(UserBitImplication, self).save(*args, **kwargs)
@@ -681,53 +947,218 @@ class UserBitImplication(models.Model):
             
         super(UserBitImplication, self).delete()
 
+    #   The set-based implication engine.  Each implication turns into one
+    #   INSERT ... SELECT over the bits it applies to, and one DELETE of the
+    #   bits it created that nothing implies any more.  The callers collect the
+    #   users whose bits changed and purge each one's cache once at the end.
+
+    def _original_sql(self):
+        """ The joins and conditions on a bit "o" for this implication to apply to it, with their params """
+        db_tree = qn(DataTree._meta.db_table)
+        joins = []
+        where = ["o.enddate > %s"]
+        params = [datetime.datetime.now()]
+        for column, node_id in (('qsc', self.qsc_original_id), ('verb', self.verb_original_id)):
+            if node_id is None:
+                continue
+            # The bit's node is the original, or a recursive bit's node is above it
+            joins.append("INNER JOIN %s AS o_%s ON o_%s.id = o.%s_id" % (db_tree, column, column, column))
+            where.append("(o.%s_id = %%s OR (o.recursive = %%s AND "
+                         "o_%s.rangestart <= (SELECT rangestart FROM %s WHERE id = %%s) AND "
+                         "o_%s.rangeend >= (SELECT rangeend FROM %s WHERE id = %%s)))" % (column, column, db_tree, column, db_tree))
+            params += [node_id, True, node_id, node_id]
+        return " ".join(joins), " AND ".join(where), params
+
+    def _implied_sql(self):
+        """
+        SQL expressions for the implied qsc_id and verb_id of a bit "o", with their params,
+        and the columns of "o" that the implied bit varies with.
+        """
+        exprs = []
+        params = []
+        varying = ["o.user_id"]
+        for column, node_id in (('qsc', self.qsc_implied_id), ('verb', self.verb_implied_id)):
+            if node_id is None:
+                exprs.append("o.%s_id" % column)
+                varying.append("o.%s_id" % column)
+            else:
+                exprs.append("%s")
+                params.append(node_id)
+        return exprs, params, ", ".join(varying)
 
-
-    def apply(self):
-        " This will generate the userbits for this implication. "
+    def _insert_delta(self, bit_where, bit_params):
+        """
+        Create the bits this implication implies from the bits matching bit_where,
+        where they don't exist yet.  Returns the (id, user_id) of the new bits.
+        """
         if self.qsc_original_id is None and self.verb_original_id is None:
-            return
-        if self.qsc_original_id is not None:
-            Q_qsc = (QTree(qsc__above = self.qsc_original) &\
-                     Q(recursive       = True)) \
-                     | \
-                     Q(qsc = self.qsc_original_id)
-            
-        if self.verb_original_id is not None:
-            Q_verb = (QTree(verb__above = self.verb_original) &\
-                      Q(recursive       = True)) \
-                      | \
-                      Q(verb = self.verb_original_id)
-
-        userbits = UserBit.objects
-
-        if self.qsc_original_id is not None:
-            userbits = userbits.filter(Q_qsc)
-        if self.verb_original_id is not None:
-            userbits = userbits.filter(Q_verb)
-        
-        
-        for userbit in userbits:
-            # for each userbit we're going to create the correct
-            # corresponding userbits.
+            return []
+        db_userbit = qn(UserBit._meta.db_table)
+        joins, where, where_params = self._original_sql()
+        (qsc_expr, verb_expr), implied_params, varying = self._implied_sql()
+
+        # One new bit per user and implied node, lasting as long as the longest-lasting original
+        sql = ("INSERT INTO %(userbit)s (user_id, qsc_id, verb_id, startdate, enddate, recursive) "
+               "SELECT DISTINCT ON (%(varying)s) o.user_id, %(qsc)s, %(verb)s, %%s, o.enddate, %%s "
+               "FROM %(userbit)s AS o %(joins)s "
+               "WHERE %(where)s AND %(bits)s AND NOT EXISTS "
+               "(SELECT 1 FROM %(userbit)s AS b WHERE (b.user_id = o.user_id OR (b.user_id IS NULL AND o.user_id IS NULL)) "
+               "AND b.qsc_id = %(qsc)s AND b.verb_id = %(verb)s AND b.enddate > %%s) "
+               "ORDER BY %(varying)s, o.enddate DESC "
+               "RETURNING id, user_id") % \
+               {'userbit': db_userbit, 'qsc': qsc_expr, 'verb': verb_expr, 'varying': varying,
+                'joins': joins, 'where': where, 'bits': bit_where}
+        now = datetime.datetime.now()
+        params = implied_params + [now, self.recursive] + \
+                 where_params + bit_params + implied_params + [now]
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        created = cursor.fetchall()
+        if created:
+            through = UserBitImplication.created_bits.through._meta.db_table
+            cursor.executemany("INSERT INTO %s (userbitimplication_id, userbit_id) VALUES (%%s, %%s)" % qn(through),
+                               [(self.id, bit_id) for bit_id, user_id in created])
+        return created
+
+    @staticmethod
+    def _users_sql(column, user_ids):
+        """ A condition on a user_id column for it to be one of user_ids (which may include None), with its params """
+        ids = [user_id for user_id in user_ids if user_id is not None]
+        where = []
+        if ids:
+            where.append("%s IN (%s)" % (column, ", ".join(["%s"] * len(ids))))
+        if len(ids) < len(user_ids):
+            where.append("%s IS NULL" % column)
+        if not where:
+            return "1 = 0", []
+        return "(%s)" % " OR ".join(where), ids
+
+    def _prune(self, user_ids=None):
+        """
+        Delete the bits this implication created that no current bit implies any more,
+        for the given users or (by default) everyone.  Returns the ids of the users affected.
+        """
+        db_userbit = qn(UserBit._meta.db_table)
+        through = qn(UserBitImplication.created_bits.through._meta.db_table)
+        joins, where, where_params = self._original_sql()
+        (qsc_expr, verb_expr), implied_params, varying = self._implied_sql()
+
+        params = [self.id, datetime.datetime.now()]
+        if user_ids is None:
+            user_where = ""
+        else:
+            user_where, user_params = UserBitImplication._users_sql("b.user_id", list(user_ids))
+            user_where = "AND " + user_where
+            params += user_params
+        sql = ("SELECT b.id, b.user_id FROM %(through)s AS c INNER JOIN %(userbit)s AS b ON b.id = c.userbit_id "
+               "WHERE c.userbitimplication_id = %%s AND b.enddate > %%s %(user)s AND NOT EXISTS "
+               "(SELECT 1 FROM %(userbit)s AS o %(joins)s WHERE %(where)s AND o.id <> b.id AND "
+               "(o.user_id = b.user_id OR (o.user_id IS NULL AND b.user_id IS NULL)) AND "
+               "%(qsc)s = b.qsc_id AND %(verb)s = b.verb_id)") % \
+               {'through': through, 'userbit': db_userbit, 'joins': joins, 'where': where,
+                'qsc': qsc_expr, 'verb': verb_expr, 'user': user_where}
+        params += where_params + implied_params
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        stale = cursor.fetchall()
+        if not stale:
+            return set()
+        ids = [bit_id for bit_id, bit_user_id in stale]
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute("DELETE FROM %s WHERE userbit_id IN (%s)" % (through, placeholders), ids)
+        cursor.execute("DELETE FROM %s WHERE id IN (%s)" % (db_userbit, placeholders), ids)
+        return set([bit_user_id for bit_id, bit_user_id in stale])
 
-            newbit = self.impliedBit(userbit) # get this bit this implies
+    @staticmethod
+    def _propagate(implications, bit_where, bit_params, max_depth=10):
+        """
+        Apply the implications to the bits matching bit_where, then to the bits
+        that created, and so on, for chains of implications.  Returns the users affected.
+        """
+        affected = set()
+        for depth in range(max_depth):
+            created = []
+            for implication in implications:
+                created += implication._insert_delta(bit_where, bit_params)
+            if not created:
+                break
+            affected.update([user_id for bit_id, user_id in created])
+            bit_where = "o.id IN (%s)" % ", ".join(["%s"] * len(created))
+            bit_params = [bit_id for bit_id, user_id in created]
+            implications = list(UserBitImplication.objects.all())
+        transaction.commit_unless_managed()
+        UserBitImplication._invalidate(affected)
+        return affected
 
-            bits = UserBit.objects.filter(user = newbit.user,
-                                          qsc  = newbit.qsc,
-                                          verb = newbit.verb)
-            if self.recursive:
-                bits.filter(recursive = True)
+    @staticmethod
+    def _invalidate(user_ids):
+        """ Purge each affected user's permission cache, once """
+        for user_id in user_ids:
+            UserBit.updateCache(user_id)
 
-            if len(bits.values('id')[:1]) == 0:
-                newbit.save()
-                self.created_bits.add(newbit)
+    def apply(self):
+        " This will generate the userbits for this implication. "
+        UserBitImplication._propagate([self], "1 = 1", [])
         
     @staticmethod
-    def applyAllImplications():
+    def applyAllImplications(incremental=True):
         """ This function will make implications work, no matter what.
           In the entire tree.
+
+          With incremental=True, only the users with bits written, updated
+          or expired since the last run are looked at.  Their bits are found
+          by xmin rather than id, since ids are handed out before commit and
+          .update() keeps them.  Bits removed with QuerySet.delete() don't
+          leave a trace, so the bits they implied are only cleaned up by
+          a run with incremental=False.
         """
-        for implication in UserBitImplication.objects.all():
-            implication.apply()
+        from esp.tagdict.models import Tag
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        oldest_running = cursor.fetchone()[0]
+        now = datetime.datetime.now()
+
+        since = None
+        if incremental:
+            since = Tag.getTag(IMPLICATIONS_APPLIED_TAG)
+            applied_at = Tag.getTag(IMPLICATIONS_APPLIED_AT_TAG)
+            if since and applied_at:
+                since = long(since)
+                applied_at = datetime.datetime.strptime(applied_at, IMPLICATIONS_DATE_FORMAT)
+            else:
+                since = None
+        # xmin is the txid without its epoch, so it only orders within one
+        if since is not None and since >> 32 != oldest_running >> 32:
+            since = None
+
+        implications = list(UserBitImplication.objects.all())
+        if since is None:
+            users = None
+            bit_where, bit_params = "1 = 1", []
+        else:
+            cursor.execute("SELECT DISTINCT user_id FROM %s WHERE xmin::text::bigint >= %%s OR "
+                           "(enddate > %%s AND enddate <= %%s)" % qn(UserBit._meta.db_table),
+                           [since & 0xffffffff, applied_at, now])
+            users = [row[0] for row in cursor.fetchall()]
+            bit_where, bit_params = UserBitImplication._users_sql("o.user_id", users)
+
+        affected = set()
+        stale = set()
+        if users is None or users:
+            affected = UserBitImplication._propagate(implications, bit_where, bit_params)
+            for depth in range(10):
+                pruned = set()
+                for implication in implications:
+                    pruned.update(implication._prune(users))
+                if not pruned:
+                    break
+                stale.update(pruned)
+            transaction.commit_unless_managed()
+            UserBitImplication._invalidate(stale - affected)
+
+        Tag.setTag(IMPLICATIONS_APPLIED_TAG, value=str(oldest_running))
+        Tag.setTag(IMPLICATIONS_APPLIED_AT_TAG, value=now.strftime(IMPLICATIONS_DATE_FORMAT))
 
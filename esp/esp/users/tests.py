@@ -249,6 +249,164 @@ class MakeAdminTest(CacheFlushTestCase):
         response = self.client.get('/myesp/makeadmin/')
         self.assertEqual(response.status_code, 403)
 
+class PermissionIndexTest(CacheFlushTestCase):
+    """ The in-memory permission index should agree with the stored procedures. """
+    def setUp(self):
+        import datetime
+        self.user, created = ESPUser.objects.get_or_create(username='permission_index_test')
+        self.other, created = ESPUser.objects.get_or_create(username='permission_index_other')
+        self.qscs = [GetNode('Q/PermissionIndexTest'), GetNode('Q/PermissionIndexTest/Program'),
+                     GetNode('Q/PermissionIndexTest/Program/Class'), GetNode('Q/PermissionIndexTest/Other')]
+        self.verbs = [GetNode('V/PermissionIndexTest'), GetNode('V/PermissionIndexTest/Edit'),
+                      GetNode('V/PermissionIndexTest/Edit/Title'), GetNode('V/PermissionIndexTest/View')]
+        past = datetime.datetime.now() - datetime.timedelta(days=1)
+        future = datetime.datetime.now() + datetime.timedelta(days=1)
+        UserBit.objects.create(user=self.user, qsc=self.qscs[1], verb=self.verbs[1], recursive=True)
+        UserBit.objects.create(user=self.user, qsc=self.qscs[3], verb=self.verbs[3], recursive=False)
+        UserBit.objects.create(user=None, qsc=self.qscs[0], verb=self.verbs[3], recursive=True)
+        UserBit.objects.create(user=self.user, qsc=self.qscs[0], verb=self.verbs[0], startdate=future, recursive=True)
+        UserBit.objects.create(user=self.user, qsc=self.qscs[0], verb=self.verbs[2], enddate=past, recursive=True)
+        UserBit.objects.create(user=self.other, qsc=self.qscs[0], verb=self.verbs[0], recursive=True)
+
+    def runTest(self):
+        import datetime
+        for user in (self.user, self.other, None):
+            for qsc in self.qscs:
+                for verb in self.verbs:
+                    for recursive_required in (False, True):
+                        #   Passing now explicitly goes through the procedure
+                        expected = UserBit.objects.UserHasPerms(user, qsc, verb, datetime.datetime.now(), recursive_required)
+                        self.assertEqual(UserBit.objects.UserHasPerms(user, qsc, verb, recursive_required=recursive_required), expected,
+                                         'UserHasPerms(%s, %s, %s, recursive_required=%s) should be %s' % (user, qsc.uri, verb.uri, recursive_required, expected))
+                for verb in self.verbs:
+                    expected = set([bit.id for bit in UserBit.objects.bits_get_qsc(user, verb, now=datetime.datetime.now())])
+                    self.assertEqual(set([bit.id for bit in UserBit.objects.bits_get_qsc(user, verb)]), expected)
+                    expected = set([bit.id for bit in UserBit.objects.bits_get_qsc(user, verb, now=datetime.datetime.now(), qsc_root=self.qscs[1])])
+                    self.assertEqual(set([bit.id for bit in UserBit.objects.bits_get_qsc(user, verb, qsc_root=self.qscs[1])]), expected)
+
+        self.assertTrue(UserBit.objects.user_has_verb(self.user, self.verbs[2]))
+        self.assertFalse(UserBit.objects.user_has_verb(self.user, self.verbs[0]))
+        self.assertTrue(UserBit.objects.user_has_qsc(self.user, self.qscs[2]))
+        self.assertTrue(UserBit.objects.UserHasPerms(self.user, 'Q/PermissionIndexTest/Program', 'V/PermissionIndexTest/Edit'))
+        self.assertFalse(UserBit.objects.UserHasPerms(self.user, 'Q/PermissionIndexTest/NoSuchNode', 'V/PermissionIndexTest/Edit'))
+
+        #   New bits show up right away
+        self.assertFalse(UserBit.objects.UserHasPerms(self.other, self.qscs[3], self.verbs[3], recursive_required=True))
+        UserBit.objects.create(user=self.other, qsc=self.qscs[3], verb=self.verbs[3], recursive=True)
+        self.assertTrue(UserBit.objects.UserHasPerms(self.other, self.qscs[3], self.verbs[3], recursive_required=True))
+        #   And so do expired ones
+        UserBit.objects.filter(user=self.user, verb=self.verbs[1])[0].expire()
+        self.assertFalse(UserBit.objects.UserHasPerms(self.user, self.qscs[2], self.verbs[2]))
+
+        #   The public bits are cached once, not in each user's index...
+        from django.core.cache import cache
+        own_key = UserBit.objects.cache(self.user).get_index_key()
+        own = cache.get(own_key)
+        self.assertEqual([bit for bit in own.bits if bit[1] is None], [])
+        #   ... so a new public bit leaves the user's index alone, and still applies to them
+        self.assertFalse(UserBit.objects.UserHasPerms(self.user, self.qscs[3], self.verbs[1]))
+        UserBit.objects.create(user=None, qsc=self.qscs[3], verb=self.verbs[0], recursive=True)
+        self.assertEqual(cache.get(own_key).built, own.built)
+        self.assertTrue(UserBit.objects.UserHasPerms(self.user, self.qscs[3], self.verbs[1]))
+
+class BulkPermsTest(PermissionIndexTest):
+    """ bulk_user_has_perms and bulk_has_perms_on should agree with UserHasPerms. """
+    def runTest(self):
+        users = [self.user, self.other, None]
+        for verb in self.verbs:
+            for recursive_required in (False, True):
+                for qsc in self.qscs:
+                    result = UserBit.objects.bulk_user_has_perms(users, qsc, verb, recursive_required=recursive_required)
+                    for user in users:
+                        self.assertEqual(result[user and user.id], UserBit.objects.UserHasPerms(user, qsc, verb, recursive_required=recursive_required))
+                for user in users:
+                    result = UserBit.objects.bulk_has_perms_on(user, self.qscs, verb, recursive_required=recursive_required)
+                    for qsc in self.qscs:
+                        self.assertEqual(result[qsc.id], UserBit.objects.UserHasPerms(user, qsc, verb, recursive_required=recursive_required))
+        self.assertEqual(UserBit.objects.bulk_has_perms_on(self.user, [], self.verbs[0]), {})
+
+class FindByAnchorPermsTest(CacheFlushTestCase):
+    """ find_by_anchor_perms should find the same objects however many bits it merges. """
+    def runTest(self):
+        from esp.datatree.sql import query_utils
+        from esp.miniblog.models import Entry
+        user, created = ESPUser.objects.get_or_create(username='find_by_anchor_perms_test')
+        verb = GetNode('V/FindByAnchorPermsTest')
+        expected = set()
+        for i in range(4):
+            qsc = GetNode('Q/FindByAnchorPermsTest/Granted%d' % i)
+            UserBit.objects.create(user=user, qsc=qsc, verb=verb, recursive=True)
+            expected.add(Entry.objects.create(anchor=GetNode(qsc.uri + '/Child'), title='Granted', content='').id)
+        Entry.objects.create(anchor=GetNode('Q/FindByAnchorPermsTest/Other'), title='Other', content='')
+
+        #   More merged ranges than the threshold, so they are joined against as arrays
+        old_threshold = query_utils.UNNEST_THRESHOLD
+        query_utils.UNNEST_THRESHOLD = 2
+        try:
+            found = UserBit.find_by_anchor_perms(Entry, user, verb)
+            self.assertEqual(set(found.values_list('id', flat=True)), expected)
+            #   The same, used as a subquery
+            self.assertEqual(set(Entry.objects.filter(id__in=found.values('id')).values_list('id', flat=True)), expected)
+        finally:
+            query_utils.UNNEST_THRESHOLD = old_threshold
+
+class UserBitImplicationTest(CacheFlushTestCase):
+    """ Implied bits should come and go with the bits implying them. """
+    def setUp(self):
+        from esp.users.models.userbits import UserBitImplication
+        self.user, created = ESPUser.objects.get_or_create(username='implication_test')
+        self.qsc = GetNode('Q/ImplicationTest/Program')
+        self.verb = GetNode('V/ImplicationTest/Original')
+        self.implied_verb = GetNode('V/ImplicationTest/Implied')
+        self.implication = UserBitImplication.objects.create(qsc_original=self.qsc, verb_original=self.verb,
+                                                             verb_implied=self.implied_verb, recursive=False)
+
+    def implied_bits(self):
+        return UserBit.valid_objects().filter(user=self.user, qsc=self.qsc, verb=self.implied_verb)
+
+    def runTest(self):
+        import datetime
+        from esp.users.models.userbits import UserBitImplication
+
+        #   A recursive bit above the original implies it too, on its own qsc
+        bit = UserBit.objects.create(user=self.user, qsc=GetNode('Q/ImplicationTest'), verb=GetNode('V/ImplicationTest'))
+        above = UserBit.valid_objects().filter(user=self.user, qsc=GetNode('Q/ImplicationTest'), verb=self.implied_verb)
+        self.assertEqual(above.count(), 1)
+        bit.delete()
+        self.assertFalse(above.exists())
+
+        bit = UserBit.objects.create(user=self.user, qsc=self.qsc, verb=self.verb)
+        self.assertEqual(self.implied_bits().count(), 1)
+        self.assertEqual(list(self.implication.created_bits.values_list('id', flat=True)), list(self.implied_bits().values_list('id', flat=True)))
+        self.assertTrue(UserBit.objects.UserHasPerms(self.user, self.qsc, self.implied_verb))
+
+        #   Saving it again doesn't make another one
+        bit.save()
+        self.assertEqual(self.implied_bits().count(), 1)
+
+        #   Expiring it takes the implied bit away
+        bit.expire()
+        self.assertFalse(self.implied_bits().exists())
+        self.assertFalse(UserBit.objects.UserHasPerms(self.user, self.qsc, self.implied_verb))
+
+        #   applyAllImplications puts back what's missing, and takes away what shouldn't be there
+        bit.renew()
+        UserBit.objects.filter(id__in=self.implied_bits().values_list('id', flat=True)).delete()
+        UserBitImplication.applyAllImplications(incremental=False)
+        self.assertEqual(self.implied_bits().count(), 1)
+
+        #   Incremental runs pick up bits expired or extended with .update()
+        UserBit.objects.filter(id=bit.id).update(enddate=datetime.datetime.now() - datetime.timedelta(days=1))
+        UserBitImplication.applyAllImplications()
+        self.assertFalse(self.implied_bits().exists())
+        UserBit.objects.filter(id=bit.id).update(enddate=datetime.datetime(9999, 1, 1))
+        UserBitImplication.applyAllImplications()
+        self.assertEqual(self.implied_bits().count(), 1)
+
+        UserBit.objects.filter(id=bit.id).delete()
+        UserBitImplication.applyAllImplications(incremental=False)
+        self.assertFalse(self.implied_bits().exists())
+
 class AjaxExistenceChecker(TestCase):
     """ Check that an Ajax view is there by trying to retrieve it and checking for the desired keys
         in the response. 
@@ -36,6 +36,17 @@ class JSONField(models.TextField):
 
         return super(JSONField, self).get_db_prep_save(value, connection=connection)
 
+class CounterField(models.IntegerField):
+    """An integer column that is kept up to date by UPDATEs in SQL, such as
+    "SET x = x + 1".  Model.save() writes it when the row is created but
+    then leaves the column as it is, so saving an instance loaded before
+    someone else's UPDATE doesn't undo it."""
+
+    def pre_save(self, model_instance, add):
+        if add:
+            return super(CounterField, self).pre_save(model_instance, add)
+        return models.F(self.attname)
+
 #   Added to support South migrations
 from south.modelsinspector import add_introspection_rules
-add_introspection_rules([], ["^esp\.utils\.fields\.JSONField"])
+add_introspection_rules([], ["^esp\.utils\.fields\.JSONField", "^esp\.utils\.fields\.CounterField"])
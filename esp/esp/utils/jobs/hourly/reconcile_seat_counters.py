@@ -0,0 +1,18 @@
+from django_extensions.management.jobs import HourlyJob
+from django.db.models import Q
+from esp.program.models import Program, ClassSection
+from datetime import datetime, timedelta
+
+class Job(HourlyJob):
+    help = "Repair drift in the seat counters of programs with recent registrations"
+
+    def execute(self):
+        # Only programs whose registrations changed recently can have drifted since the last run
+        since = datetime.now() - timedelta(1)
+        programs = Program.objects.filter(Q(classsubject__sections__studentregistration__start_date__gte=since) |
+                                          Q(classsubject__sections__studentregistration__end_date__range=(since, datetime.now()))).distinct()
+
+        for p in programs:
+            drifted = ClassSection.reconcile_seats(program=p)
+            if drifted:
+                print "Repaired seat counters for %s:\n" % p + "\n".join("  section %d: %d -> %d" % (id, old, new) for id, (old, new) in sorted(drifted.items()))
@@ -0,0 +1,191 @@
+"""
+Streaming JSON responses, for the catalog and scheduling views whose
+output runs to megabytes on big programs.
+
+json_chunks() encodes a structure the way simplejson.dumps() would, but
+walks dicts, lists, querysets (through .iterator()) and generators as it
+goes, so that no more than one row and one chunk of output are held at a
+time.  The items of a list, queryset or generator are the rows: each one
+is encoded whole.
+
+json_response() and cached_json_response() encode the whole document,
+gzipped, as a CachedJSON before they return, so that any database or
+cache work done to produce the rows happens inside the view (and its
+transaction and error handling), and a cache_function is filled in before
+the response goes out.  Only the gzipped text is held: it's a fraction of
+the size of the JSON, and far smaller than the objects it was made from.
+StreamingJSONResponse then sends it a chunk at a time, gunzipping on the
+fly for clients that don't accept gzip.
+
+Middleware that reads response.content would undo all of this, so it
+should leave responses with .streaming set alone; see
+esp.middleware.gzipmiddleware.
+"""
+
+import re
+import types
+import zlib
+
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.utils import simplejson
+from django.utils.cache import patch_vary_headers
+
+__all__ = ['json_chunks', 'gzip_chunks', 'gunzip_chunks', 'accepts_gzip', 'CachedJSON',
+           'StreamingJSONResponse', 'json_response', 'cached_json_response']
+
+CHUNK_SIZE = 16 * 1024
+GZIP_LEVEL = 6
+# zlib's wbits for a gzip header and trailer rather than a zlib one
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_accepts_gzip_re = re.compile(r'\bgzip\b')
+
+def _key(key):
+    """ Object keys as simplejson would write them """
+    if isinstance(key, basestring):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, (int, long, float)):
+        return simplejson.dumps(key)
+    raise TypeError("key %r is not a string" % (key,))
+
+def _rows(obj):
+    """ The items of a sequence we know how to walk, or None """
+    if isinstance(obj, QuerySet):
+        return obj.iterator()
+    if isinstance(obj, (list, tuple, types.GeneratorType)) or hasattr(obj, 'next'):
+        return obj
+    return None
+
+def _iterencode(obj, encoder):
+    if isinstance(obj, dict):
+        yield '{'
+        first = True
+        for key, value in obj.iteritems():
+            if not first:
+                yield ', '
+            first = False
+            yield encoder.encode(_key(key))
+            yield ': '
+            for piece in _iterencode(value, encoder):
+                yield piece
+        yield '}'
+        return
+
+    rows = _rows(obj)
+    if rows is None:
+        yield encoder.encode(obj)
+        return
+
+    yield '['
+    first = True
+    for row in rows:
+        if not first:
+            yield ', '
+        first = False
+        yield encoder.encode(row)
+    yield ']'
+
+def json_chunks(obj, default=None, chunk_size=CHUNK_SIZE):
+    """ Yields the JSON encoding of obj, in pieces of about chunk_size bytes. """
+    encoder = simplejson.JSONEncoder(default=default)
+    pieces = []
+    size = 0
+    for piece in _iterencode(obj, encoder):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(pieces)
+            pieces = []
+            size = 0
+    if pieces:
+        yield ''.join(pieces)
+
+def _encode(chunk):
+    if isinstance(chunk, unicode):
+        return chunk.encode('utf-8')
+    return chunk
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """ Gzips a sequence of strings, flushing after each so that none of them is held back """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(_encode(chunk)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def gunzip_chunks(chunks):
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+def accepts_gzip(request):
+    return request is not None and bool(_accepts_gzip_re.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+class StreamingJSONResponse(HttpResponse):
+    """ An HttpResponse that sends its JSON body as the iterator produces it. """
+
+    streaming = True
+
+    def __init__(self, chunks, gzipped=False):
+        HttpResponse.__init__(self, chunks, content_type='application/json')
+        if gzipped:
+            self['Content-Encoding'] = 'gzip'
+        patch_vary_headers(self, ('Accept-Encoding',))
+
+class CachedJSON(object):
+    """ A JSON document, stored gzipped, as cached for the streaming views. """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    @classmethod
+    def from_data(cls, obj, default=None):
+        return cls(gzip_chunks(json_chunks(obj, default)))
+
+    def text(self):
+        return ''.join(gunzip_chunks(self.chunks))
+
+    def response(self, request=None):
+        if accepts_gzip(request):
+            return StreamingJSONResponse(iter(self.chunks), gzipped=True)
+        return StreamingJSONResponse(gunzip_chunks(self.chunks))
+
+def json_response(request, obj, default=None):
+    """ A StreamingJSONResponse for obj, gzipped if the client accepts it. """
+    return CachedJSON.from_data(obj, default).response(request)
+
+def cached_json_response(request, cached_func, args, data_func, default=None):
+    """
+    Serves a cache_function that returns CachedJSON.from_data(data), where
+    data_func() returns data.  On a miss, the data is encoded, saved in the
+    cache and then sent.  For member functions, pass the bound method and
+    the other arguments.
+    """
+    cache_obj = getattr(cached_func, 'im_func', cached_func)
+    if getattr(cached_func, 'im_self', None) is not None:
+        args = (cached_func.im_self,) + tuple(args)
+
+    value, done = cache_obj.get_or_claim(*args)
+    if value is not None:
+        return value.response(request)
+
+    try:
+        value = CachedJSON.from_data(data_func(), default)
+    except:
+        done(None)
+        raise
+    done(value)
+    return value.response(request)
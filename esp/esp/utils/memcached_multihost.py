@@ -36,22 +36,235 @@ are caching template content (so that updated content from one server
 will not be the same as updated content from another server), but you have
 a shared database backend (so that a change on one server does mean that all
 other servers need to regenerate their corresponding cached content).
+
+Writes to the local server happen immediately.  Writes to the remote
+servers are handed to a RemoteSender per server, which sends them from a
+background thread so that a request never waits on the slowest host.
+While a batch is on the wire, further writes pile up and are coalesced:
+only the last write to each key is sent, deletes go out in one delete_many()
+and sets in one set_many() per timeout.  Three more optional settings
+control this:
+
+REMOTE_CACHE_ASYNC (default True) -- set to False to send every remote write
+synchronously from the request thread, as this backend used to.
+
+REMOTE_CACHE_MAX_LAG (default 0.1) -- the longest, in seconds, the sender
+holds a write back waiting for more to batch with it.
+
+REMOTE_CACHE_MAX_PENDING (default 10000) -- the most distinct keys one
+sender will queue.  Past that the sender is clearly behind, so writes for
+new keys are sent synchronously instead of being dropped.
+
+Anything still queued is sent when the process exits, and writes after
+that go out synchronously.  remote_stats() returns
+the queue depth and error counts for each remote server.  A failed batch
+is counted and dropped; the keys in it may be stale on that host until
+they are next written or expire.
 """
 
+from __future__ import with_statement
+
+import atexit
+import os
+import threading
+import time
+
 from django.core.cache.backends.base import BaseCache
 from django.core.cache.backends.memcached import PyLibMCCache as MemcacheCacheClass
 from esp import settings
 
+DEFAULT_MAX_LAG = 0.1
+DEFAULT_MAX_PENDING = 10000
+BATCH_SIZE = 1000
+
+class RemoteSender(object):
+    """ Sends the writes meant for one remote cache from a background thread,
+        coalescing whatever piles up while the previous batch is in flight. """
+
+    def __init__(self, wrapped_cache, name, max_lag=DEFAULT_MAX_LAG, max_pending=DEFAULT_MAX_PENDING):
+        self.wrapped_cache = wrapped_cache
+        self.name = name
+        self.max_lag = max_lag
+        self.max_pending = max_pending
+        self.batch_size = BATCH_SIZE
+
+        self._cond = threading.Condition()
+        #   Held while a batch is on the wire.  Memcached clients aren't thread-safe,
+        #   and flush() and overflowing writes send from other threads.
+        self._send_lock = threading.Lock()
+        #   (key, version) -> (op, value, timeout); only the last write per key matters
+        self._pending = {}
+        self._oldest = None
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+
+        self.sent_count = 0
+        self.batch_count = 0
+        self.overflow_count = 0
+        self.error_count = 0
+        self.last_error = None
+
+        atexit.register(self.stop)
+
+    def _ensure_thread(self):
+        #   A forked child (mod_wsgi, multiprocessing) doesn't inherit our thread
+        if self._thread is None or self._pid != os.getpid() or not self._thread.isAlive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='cache sender %s' % self.name)
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def enqueue(self, op, key, value=None, timeout=0, version=None):
+        """ Queue op ('set', 'add' or 'delete') on key for sending. """
+        pending_key = (key, version)
+        with self._cond:
+            overflow = self._stopped or (len(self._pending) >= self.max_pending and pending_key not in self._pending)
+            if overflow:
+                self.overflow_count += 1
+            else:
+                was_empty = not self._pending
+                if op == 'add' and pending_key in self._pending:
+                    #   The local add succeeded after some earlier write to this key;
+                    #   the remote should end up with this value either way
+                    op = 'set'
+                self._pending[pending_key] = (op, value, timeout)
+                if was_empty:
+                    self._oldest = time.time()
+                    self._ensure_thread()
+                    self._cond.notify()
+
+        if overflow:
+            #   We're too far behind to queue this; better slow than lost
+            with self._send_lock:
+                self._send({pending_key: (op, value, timeout)})
+
+    def _take(self):
+        batch = self._pending
+        self._pending = {}
+        self._oldest = None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                #   Let more writes pile up, but hold none back longer than max_lag
+                #   (flush() from another thread may empty the queue meanwhile)
+                while self._pending:
+                    remaining = self._oldest + self.max_lag - time.time()
+                    if remaining <= 0 or len(self._pending) >= self.batch_size or self._stopped:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def _send(self, batch):
+        """ Send a batch of writes.  The caller must hold _send_lock. """
+        sets = {}
+        deletes = {}
+        adds = []
+        for (key, version), (op, value, timeout) in batch.iteritems():
+            if op == 'set':
+                sets.setdefault((timeout, version), {})[key] = value
+            elif op == 'delete':
+                deletes.setdefault(version, []).append(key)
+            else:
+                adds.append((key, value, timeout, version))
+
+        try:
+            for (timeout, version), data in sets.iteritems():
+                self.wrapped_cache.set_many(data, timeout=timeout, version=version)
+            for version, keys in deletes.iteritems():
+                self.wrapped_cache.delete_many(keys, version=version)
+            for key, value, timeout, version in adds:
+                self.wrapped_cache.add(key, value, timeout=timeout, version=version)
+        except Exception, e:
+            self.error_count += 1
+            self.last_error = '%s: %s' % (e.__class__.__name__, e)
+        else:
+            self.sent_count += len(batch)
+            self.batch_count += 1
+
+    def flush(self):
+        """ Send everything queued right now, from this thread.
+            Also waits out a batch the background thread already has in flight. """
+        with self._send_lock:
+            with self._cond:
+                batch = self._take()
+            if batch:
+                self._send(batch)
+
+    def stop(self):
+        """ Send what's queued and let the background thread exit; later writes go out synchronously. """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.currentThread():
+            self._thread.join(1)
+        self.flush()
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'queue_depth': self.queue_depth(),
+            'sent': self.sent_count,
+            'batches': self.batch_count,
+            'overflows': self.overflow_count,
+            'errors': self.error_count,
+            'last_error': self.last_error,
+        }
+
 class CacheClass(BaseCache):
     def __init__(self, server, params):
         BaseCache.__init__(self, params)
 
-        self._wrapped_caches = [ MemcacheCacheClass(server, params) ] + [ MemcacheCacheClass(remote_server, params) for remote_server in getattr(settings, 'REMOTE_CACHE_SERVERS', []) ]
-        self._wrapped_flush_caches = [ MemcacheCacheClass(server, params) for server in getattr(settings, 'REMOTE_CACHES_TO_FLUSH', []) ]
+        remote_servers = getattr(settings, 'REMOTE_CACHE_SERVERS', [])
+        flush_servers = getattr(settings, 'REMOTE_CACHES_TO_FLUSH', [])
+        self._setup_caches(MemcacheCacheClass(server, params),
+                           [ (remote_server, MemcacheCacheClass(remote_server, params)) for remote_server in remote_servers ],
+                           [ (flush_server, MemcacheCacheClass(flush_server, params)) for flush_server in flush_servers ])
+
+    def _setup_caches(self, local_cache, remote_caches, flush_caches):
+        """ Wire up the local cache and the (name, cache) pairs for the remote ones """
+        self._wrapped_caches = [ local_cache ] + [ cache for name, cache in remote_caches ]
+        self._wrapped_flush_caches = [ cache for name, cache in flush_caches ]
         
         if not hasattr(settings, 'CACHE_PREFIX'):
             settings.CACHE_PREFIX = ''
 
+        if getattr(settings, 'REMOTE_CACHE_ASYNC', True):
+            max_lag = getattr(settings, 'REMOTE_CACHE_MAX_LAG', DEFAULT_MAX_LAG)
+            max_pending = getattr(settings, 'REMOTE_CACHE_MAX_PENDING', DEFAULT_MAX_PENDING)
+            self._update_senders = [ RemoteSender(cache, name, max_lag, max_pending) for name, cache in remote_caches ]
+            self._flush_senders = [ RemoteSender(cache, name, max_lag, max_pending) for name, cache in flush_caches ]
+        else:
+            self._update_senders = self._flush_senders = None
+
+    def _fan_out(self, update_op, key, value=None, timeout=0, version=None):
+        """ Queue a write to every remote cache; flush-only caches just get a delete """
+        for sender in self._update_senders:
+            sender.enqueue(update_op, key, value, timeout, version)
+        for sender in self._flush_senders:
+            sender.enqueue('delete', key, version=version)
+
+    def flush(self):
+        """ Send every queued remote write now """
+        if self._update_senders is not None:
+            for sender in self._update_senders + self._flush_senders:
+                sender.flush()
+
+    def remote_stats(self):
+        """ Queue depth and error counts for each remote cache """
+        if self._update_senders is None:
+            return []
+        return [ sender.stats() for sender in self._update_senders + self._flush_senders ]
+
     def make_key(self, key):
         """ Prefix a key with CACHE_PREFIX so that we fetch it from the proper namespace """
         return settings.CACHE_PREFIX + key
@@ -65,7 +278,9 @@ class CacheClass(BaseCache):
         # But, don't bother doing anything to remote caches if we don't actually add anything locally
         retVal = self._wrapped_caches[0].add(self.make_key(key), value, timeout=timeout, version=version)
 
-        if retVal:
+        if retVal and self._update_senders is not None:
+            self._fan_out('add', self.make_key(key), value, timeout, version)
+        elif retVal:
             for wrapped_cache in self._wrapped_caches[1:]:
                 wrapped_cache.add(self.make_key(key), value, timeout=timeout, version=version)
 
@@ -81,6 +296,11 @@ class CacheClass(BaseCache):
 
     def set(self, key, value, timeout=0, version=None):
         # Set this key in all caches that we're keeping up-to-date
+        if self._update_senders is not None:
+            self._wrapped_caches[0].set(self.make_key(key), value, timeout=timeout, version=version)
+            self._fan_out('set', self.make_key(key), value, timeout, version)
+            return
+
         for wrapped_cache in self._wrapped_caches:
             wrapped_cache.set(self.make_key(key), value, timeout=timeout, version=version)
 
@@ -90,6 +310,11 @@ class CacheClass(BaseCache):
         
     def delete(self, key, version=None):
         # Delete this key everywhere
+        if self._update_senders is not None:
+            self._wrapped_caches[0].delete(self.make_key(key), version=version)
+            self._fan_out('delete', self.make_key(key), version=version)
+            return
+
         for wrapped_cache in self._wrapped_caches + self._wrapped_flush_caches:
             wrapped_cache.delete(self.make_key(key), version=version)
 
@@ -104,27 +329,61 @@ class CacheClass(BaseCache):
 
         return cleanedDict
 
-    def has_key(self, key, version=None):
-        # Do we have this key locally?
-        return self._wrapped_caches[0].has_key(self.make_key(key), version=version)
+    def set_many(self, data, timeout=0, version=None):
+        # Set these keys in all caches that we're keeping up-to-date
+        prefixed_data = dict((self.make_key(key), value) for key, value in data.iteritems())
+        if self._update_senders is not None:
+            self._wrapped_caches[0].set_many(prefixed_data, timeout=timeout, version=version)
+            for key, value in prefixed_data.iteritems():
+                self._fan_out('set', key, value, timeout, version)
+            return
 
-    def incr(self, key, delta=1, version=None):
-        # Update this key in all caches that we're keeping up-to-date
         for wrapped_cache in self._wrapped_caches:
-            return wrapped_cache.incr(self.make_key(key), delta, version=version)
+            wrapped_cache.set_many(prefixed_data, timeout=timeout, version=version)
 
         # Delete all cache keys from caches that we're flushing on edit
         for wrapped_cache in self._wrapped_flush_caches:
-            wrapped_cache.delete(self.make_key(key), version=version)
+            wrapped_cache.delete_many(prefixed_data.keys(), version=version)
+
+    def delete_many(self, keys, version=None):
+        # Delete these keys everywhere
+        prefixed_keys = [self.make_key(key) for key in keys]
+        if self._update_senders is not None:
+            self._wrapped_caches[0].delete_many(prefixed_keys, version=version)
+            for key in prefixed_keys:
+                self._fan_out('delete', key, version=version)
+            return
+
+        for wrapped_cache in self._wrapped_caches + self._wrapped_flush_caches:
+            wrapped_cache.delete_many(prefixed_keys, version=version)
+
+    def has_key(self, key, version=None):
+        # Do we have this key locally?
+        return self._wrapped_caches[0].has_key(self.make_key(key), version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Count locally, then copy the new value to every cache we're keeping up-to-date
+        value = self._wrapped_caches[0].incr(self.make_key(key), delta, version=version)
+        self._copy_to_remotes(key, value, version)
+        return value
 
     def decr(self, key, delta=1, version=None):
-        # Update this key in all caches that we're keeping up-to-date
-        for wrapped_cache in self._wrapped_caches:
-            return wrapped_cache.decr(self.make_key(key), delta, version=version)
+        value = self._wrapped_caches[0].decr(self.make_key(key), delta, version=version)
+        self._copy_to_remotes(key, value, version)
+        return value
+
+    def _copy_to_remotes(self, key, value, version=None):
+        """ Write a value the local cache already has to the remote ones """
+        if self._update_senders is not None:
+            self._fan_out('set', self.make_key(key), value, 0, version)
+            return
+
+        for wrapped_cache in self._wrapped_caches[1:]:
+            wrapped_cache.set(self.make_key(key), value, version=version)
 
         # Delete all cache keys from caches that we're flushing on edit
         for wrapped_cache in self._wrapped_flush_caches:
-            wrapped_cache.delete(self.make_key(key), version=version)        
+            wrapped_cache.delete(self.make_key(key), version=version)
 
     def __contains__(self, key):
         # Do we have this key locally?
@@ -132,6 +391,11 @@ class CacheClass(BaseCache):
     
     def close(self, **kwargs):
         # Close all of our cache connections
+        # The remote ones belong to the sender threads when sending in the background
+        if self._update_senders is not None:
+            self._wrapped_caches[0].close()
+            return
+
         for wrapped_cache in self._wrapped_caches + self._wrapped_flush_caches:
             wrapped_cache.close()
 
@@ -1,4 +1,15 @@
-"Memcached cache backend"
+"""
+Memcached cache backend
+
+Values are pickled here, once, rather than by the memcached client, so that
+we know their size up front.  Pickles over CACHE_COMPRESS_THRESHOLD bytes are
+zlib-compressed, and anything still over CACHE_CHUNK_SIZE (memcached's item
+limit) is split across several keys that get() fetches in a single
+get_multi, instead of silently not being cached.  size_report() summarizes
+the sizes stored so far in this process, per cache.
+
+Values written by older versions of this backend are returned as they are.
+"""
 from django.core.cache.backends.base import BaseCache
 try:
     #   Test whether we have pylibmc, and if it works, use the real pylibmc backend;
@@ -11,6 +22,8 @@ from esp import settings
 from esp.utils.try_multi import try_multi
 from esp.utils import ascii
 import hashlib
+import os
+import zlib
 
 try:
     import cPickle as pickle
@@ -20,12 +33,27 @@ except:
 FAILFAST = getattr(settings, "DEBUG", True)
 
 # Is there any way to introspect this?
+# memcached's default item limit is 1MB, including its own per-item overhead
+CACHE_CHUNK_SIZE = getattr(settings, 'CACHE_CHUNK_SIZE', 1000 * 1000)
+CACHE_MAX_CHUNKS = 32
 CACHE_WARNING_SIZE = 1 * 1024**2
-CACHE_SIZE = 2 * 1024**2
+CACHE_COMPRESS_THRESHOLD = getattr(settings, 'CACHE_COMPRESS_THRESHOLD', 16 * 1024)
+CACHE_COMPRESS_LEVEL = getattr(settings, 'CACHE_COMPRESS_LEVEL', 1)
 MAX_KEY_LENGTH = 250
 NO_HASH_PREFIX = "NH_"
 HASH_PREFIX = "H_"
 
+# Stored values start with MAGIC and one of these flags.
+# A chunk manifest is MAGIC + CHUNKED + the flag for the joined chunks + "<token>:<count>:<length>".
+MAGIC = '\x00MK1'
+PICKLED = 'P'
+COMPRESSED = 'Z'
+CHUNKED = 'C'
+
+def key_family(key):
+    """ The part of a cache key that names the cache, e.g. ArgCache keys' function name """
+    return key.split('|', 1)[0][:100]
+
 class CacheClass(BaseCache):
     idebug = False
     queries = []
@@ -33,6 +61,7 @@ class CacheClass(BaseCache):
     def __init__(self, server, params):
         BaseCache.__init__(self, params)
         self._wrapped_cache = PylibmcCacheClass(server, params)
+        self.size_stats = {}
         if not hasattr(settings, 'CACHE_PREFIX'):
             settings.CACHE_PREFIX = ''
 
@@ -46,29 +75,136 @@ class CacheClass(BaseCache):
             hashkey = HASH_PREFIX + hashlib.md5(key).hexdigest()
             return hashkey + '_' + rawkey[ :  real_max_length - len(hashkey) - 1 ]
 
-    def _failfast_test(self, key, value):
-        if FAILFAST:
-            data_size = len(pickle.dumps(value))
-            if data_size > CACHE_SIZE:
-                assert False, "Data size for key '%s' too large: %d bytes" % (key, data_size)
-            elif data_size > CACHE_WARNING_SIZE:
-                print "Data size for key '%s' is dangerously large: %d bytes" % (key, data_size)
+    def _chunk_key(self, key, token, i, version=None):
+        return self.make_key('%s|CHUNK|%s|%d' % (key, token, i), version)
+
+    def _encode(self, key, value, version=None):
+        """
+        Pickle and, if worthwhile, compress value.
+        Returns a dict of the wrapped-cache keys and strings to store for it:
+        just key, or key's chunk manifest plus the chunks.
+        Returns None if the value is too big to cache at all.
+        """
+        if type(value) in (int, long):
+            #   Leave these to the client, which stores them in the form memcached can incr()
+            return {self.make_key(key, version): value}
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        raw_size = len(data)
+        flag = PICKLED
+        if raw_size > CACHE_COMPRESS_THRESHOLD:
+            compressed = zlib.compress(data, CACHE_COMPRESS_LEVEL)
+            if len(compressed) < raw_size:
+                data, flag = compressed, COMPRESSED
+
+        n_chunks = (len(data) + CACHE_CHUNK_SIZE - 1) // CACHE_CHUNK_SIZE
+        if n_chunks > CACHE_MAX_CHUNKS:
+            if FAILFAST:
+                assert False, "Data size for key '%s' too large: %d bytes" % (key, len(data))
+            return None
+        if FAILFAST and len(data) > CACHE_WARNING_SIZE:
+            print "Data size for key '%s' is dangerously large: %d bytes" % (key, len(data))
+        self._record_size(key, raw_size, len(data), n_chunks)
+
+        if n_chunks <= 1:
+            return {self.make_key(key, version): MAGIC + flag + data}
+        #   A fresh token per write, so a reader never joins chunks from two different values
+        token = os.urandom(4).encode('hex')
+        stored = {self.make_key(key, version): MAGIC + CHUNKED + flag + '%s:%d:%d' % (token, n_chunks, len(data))}
+        for i in range(n_chunks):
+            stored[self._chunk_key(key, token, i, version)] = data[i * CACHE_CHUNK_SIZE : (i + 1) * CACHE_CHUNK_SIZE]
+        return stored
+
+    def _unpickle(self, flag, data):
+        if flag == COMPRESSED:
+            data = zlib.decompress(data)
+        return pickle.loads(data)
+
+    def _decode_many(self, found, version=None):
+        """
+        Given a dict of keys to the strings stored for them, return a dict of keys to values.
+        The chunks of every chunked value are fetched together.  A value missing any of its
+        chunks is left out, i.e. treated as a miss.
+        """
+        ans = {}
+        manifests = {}
+        for key, stored in found.iteritems():
+            if not (isinstance(stored, str) and stored.startswith(MAGIC)):
+                #   Written before we did our own pickling
+                ans[key] = stored
+            elif stored[len(MAGIC)] == CHUNKED:
+                flag = stored[len(MAGIC) + 1]
+                token, n_chunks, length = stored[len(MAGIC) + 2:].split(':')
+                chunk_keys = [self._chunk_key(key, token, i, version) for i in range(int(n_chunks))]
+                manifests[key] = (flag, int(length), chunk_keys)
+            else:
+                ans[key] = self._unpickle(stored[len(MAGIC)], stored[len(MAGIC) + 1:])
+
+        if manifests:
+            all_chunk_keys = []
+            for flag, length, chunk_keys in manifests.itervalues():
+                all_chunk_keys += chunk_keys
+            chunks = self._wrapped_cache.get_many(all_chunk_keys, version=version)
+            for key, (flag, length, chunk_keys) in manifests.iteritems():
+                if not all(chunk_key in chunks for chunk_key in chunk_keys):
+                    continue
+                data = ''.join(chunks[chunk_key] for chunk_key in chunk_keys)
+                if len(data) == length:
+                    ans[key] = self._unpickle(flag, data)
+        return ans
+
+    def _record_size(self, key, raw_size, stored_size, n_chunks):
+        #   Imported here since esp.cache imports the cache backend
+        from esp.cache.telemetry import record_value_size
+        record_value_size(key, raw_size)
+        stats = self.size_stats.setdefault(key_family(key), {'count': 0, 'raw_bytes': 0, 'stored_bytes': 0, 'max_bytes': 0, 'chunked': 0})
+        stats['count'] += 1
+        stats['raw_bytes'] += raw_size
+        stats['stored_bytes'] += stored_size
+        stats['max_bytes'] = max(stats['max_bytes'], stored_size)
+        if n_chunks > 1:
+            stats['chunked'] += 1
+
+    def size_report(self):
+        """ Sizes of the values written by this process, per cache, biggest first """
+        report = []
+        for name, stats in self.size_stats.items():
+            row = dict(stats, name=name)
+            row['avg_bytes'] = stats['stored_bytes'] / stats['count']
+            row['compression'] = float(stats['stored_bytes']) / max(stats['raw_bytes'], 1)
+            report.append(row)
+        report.sort(key=lambda row: -row['stored_bytes'])
+        return report
 
     @try_multi(8)
     def add(self, key, value, timeout=0, version=None):
-        self._failfast_test(key, value)
-        return self._wrapped_cache.add(self.make_key(key, version), value, timeout=timeout, version=version)
+        stored = self._encode(key, value, version)
+        if stored is None:
+            return False
+        real_key = self.make_key(key, version)
+        manifest = stored.pop(real_key)
+        #   The chunks go first, so the manifest never points at chunks that aren't there yet
+        if stored:
+            self._wrapped_cache.set_many(stored, timeout=timeout, version=version)
+        return self._wrapped_cache.add(real_key, manifest, timeout=timeout, version=version)
 
     @try_multi(8)
     def get(self, key, default=None, version=None):
-        val = self._wrapped_cache.get(self.make_key(key, version), default=default, version=version)
+        stored = self._wrapped_cache.get(self.make_key(key, version), version=version)
+        if stored is None:
+            val = default
+        else:
+            val = self._decode_many({key: stored}, version).get(key, default)
         if self.idebug: self._idebuglog("get", key, val)
         return val
 
     @try_multi(8)
     def set(self, key, value, timeout=0, version=None):
-        self._failfast_test(key, value)
-        return self._wrapped_cache.set(self.make_key(key, version), value, timeout=timeout, version=version)
+        stored = self._encode(key, value, version)
+        if stored is None:
+            return self._wrapped_cache.delete(self.make_key(key, version), version=version)
+        if len(stored) == 1:
+            return self._wrapped_cache.set(self.make_key(key, version), stored.values()[0], timeout=timeout, version=version)
+        return self._wrapped_cache.set_many(stored, timeout=timeout, version=version)
 
     @try_multi(8)
     def delete(self, key, version=None):
@@ -79,10 +215,28 @@ class CacheClass(BaseCache):
     def get_many(self, keys, version=None):
         keys_dict = dict((self.make_key(key, version), key) for key in keys)
         wrapped_ans = self._wrapped_cache.get_many(keys_dict.keys(), version=version)
-        ans = {}
+        found = {}
         for k,v in wrapped_ans.items():
-            ans[keys_dict[k]] = v
-        return ans
+            found[keys_dict[k]] = v
+        return self._decode_many(found, version)
+
+    @try_multi(8)
+    def set_many(self, data, timeout=0, version=None):
+        wrapped_data = {}
+        too_big = []
+        for key, value in data.items():
+            stored = self._encode(key, value, version)
+            if stored is None:
+                too_big.append(self.make_key(key, version))
+            else:
+                wrapped_data.update(stored)
+        if too_big:
+            self._wrapped_cache.delete_many(too_big, version=version)
+        return self._wrapped_cache.set_many(wrapped_data, timeout=timeout, version=version)
+
+    @try_multi(8)
+    def delete_many(self, keys, version=None):
+        return self._wrapped_cache.delete_many([self.make_key(key, version) for key in keys], version=version)
 
     # Django 1.1 feature
     # Don't try_multi, that could be all kinds of bad...
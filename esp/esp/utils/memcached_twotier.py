@@ -0,0 +1,251 @@
+"""
+Two-tier cache backend: a small per-process LRU in front of memcached.
+
+Everything is stored in memcached through the multikey backend, as usual.
+Keys belonging to the caches named in CACHE_LOCAL_CACHES are also kept in
+an in-process LRU of up to CACHE_LOCAL_MAX_ITEMS values, so that the hot,
+rarely-changing lookups (DataTree.get_by_uri, Tag.getTag and the like)
+don't need a memcached round trip every time.
+
+Coherence comes from a generation counter kept in memcached.  Every
+invalidation of a locally-cached key (a delete, an incr/decr, or a write
+to one of its ArgCache tokens) bumps the counter, and each process checks
+the counter at most once per request -- or every CACHE_LOCAL_MAX_AGE
+seconds outside of requests -- dropping its LRU when it has moved.  So a
+process may serve a value up to one request stale, the same promise
+memoize_per_request() makes.
+
+Plain value writes don't bump the counter: ArgCache only writes a value
+after computing it from the current data, and the value is checked against
+its tokens, which do.
+
+To use it, point CACHE_BACKEND at esp.utils.memcached_twotier instead of
+esp.utils.memcached_multikey.
+"""
+
+from __future__ import with_statement
+
+import threading
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.core.cache.backends.base import BaseCache
+from django.core.signals import request_started
+from esp import settings
+from esp.utils.memcached_multikey import CacheClass as MultikeyCacheClass
+from esp.utils.memoize import LRUDict
+
+DEFAULT_LOCAL_CACHES = (
+    'esp.datatree.models.DataTree.get_by_uri',
+    'esp.tagdict.models.Tag.getTag',
+    'esp.program.models.RegistrationType.get_cached',
+    'esp.program.models.RegistrationType.get_map',
+    'esp.program.modules.base.ProgramModuleObj.findModuleObject',
+)
+LOCAL_CACHES = frozenset(getattr(settings, 'CACHE_LOCAL_CACHES', DEFAULT_LOCAL_CACHES))
+LOCAL_MAX_ITEMS = getattr(settings, 'CACHE_LOCAL_MAX_ITEMS', 5000)
+LOCAL_MAX_AGE = getattr(settings, 'CACHE_LOCAL_MAX_AGE', 5)
+# Bigger values aren't worth the memory in every process
+LOCAL_MAX_VALUE_SIZE = 64 * 1024
+
+GENERATION_KEY = 'TWOTIER_GENERATION'
+TOKEN_PREFIXES = ('TOKEN__', 'TOKENVEC__')
+
+def cache_name(key):
+    """ The name of the ArgCache a key belongs to, for value and token keys alike """
+    for prefix in TOKEN_PREFIXES:
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+            break
+    return key.split('|', 1)[0]
+
+def is_token_key(key):
+    return key.startswith(TOKEN_PREFIXES)
+
+class CacheClass(BaseCache):
+    def __init__(self, server, params):
+        BaseCache.__init__(self, params)
+        self._setup_caches(MultikeyCacheClass(server, params))
+
+    def _setup_caches(self, shared_cache, local_caches=LOCAL_CACHES, max_items=LOCAL_MAX_ITEMS):
+        self._shared = shared_cache
+        self._local_caches = local_caches
+        self._lru = LRUDict(max_items)
+        self._lock = threading.Lock()
+        self._generation = None
+        #   When this thread last checked the generation
+        self._checked = threading.local()
+        self.local_hits = self.local_misses = self.generation_checks = self.local_flushes = 0
+        request_started.connect(self._request_started, weak=False)
+
+    def _request_started(self, **kwargs):
+        self._checked.at = None
+
+    def is_local(self, key):
+        return cache_name(key) in self._local_caches
+
+    def _check_generation(self):
+        """ Drop the LRU if some process has invalidated a local key since we last looked """
+        checked_at = getattr(self._checked, 'at', None)
+        now = time.time()
+        if checked_at is not None and now - checked_at < LOCAL_MAX_AGE:
+            return
+        self._checked.at = now
+        self.generation_checks += 1
+        generation = self._shared.get(GENERATION_KEY)
+        with self._lock:
+            if generation != self._generation:
+                if self._generation is not None or len(self._lru):
+                    self.local_flushes += 1
+                self._lru.clear()
+                self._generation = generation
+
+    def _bump_generation(self):
+        """ Tell every process to drop its LRU, including this one """
+        try:
+            generation = self._shared.incr(GENERATION_KEY)
+        except ValueError:
+            #   Start somewhere no process can have seen before, in case the counter was evicted
+            generation = int(time.time() * 1000)
+            if not self._shared.add(GENERATION_KEY, generation, timeout=0):
+                generation = self._shared.incr(GENERATION_KEY)
+        with self._lock:
+            self._lru.clear()
+            self._generation = generation
+        self._checked.at = time.time()
+
+    def _remember(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) <= LOCAL_MAX_VALUE_SIZE:
+            with self._lock:
+                self._lru[key] = data
+
+    def _forget(self, keys):
+        """ Handles a write to keys; returns whether other processes need to hear about it """
+        local_keys = [(key, version) for key, version in keys if self.is_local(key)]
+        with self._lock:
+            for key in local_keys:
+                self._lru.pop(key)
+        return bool(local_keys)
+
+    def add(self, key, value, timeout=0, version=None):
+        added = self._shared.add(key, value, timeout=timeout, version=version)
+        if added and self.is_local(key) and is_token_key(key):
+            self._bump_generation()
+        return added
+
+    def get(self, key, default=None, version=None):
+        if not self.is_local(key):
+            return self._shared.get(key, default=default, version=version)
+
+        self._check_generation()
+        with self._lock:
+            data = self._lru.get((key, version))
+        if data is not None:
+            self.local_hits += 1
+            return pickle.loads(data)
+
+        self.local_misses += 1
+        value = self._shared.get(key, version=version)
+        if value is None:
+            return default
+        self._remember((key, version), value)
+        return value
+
+    def get_many(self, keys, version=None):
+        ans = {}
+        remote_keys = []
+        checked = False
+        for key in keys:
+            if self.is_local(key):
+                if not checked:
+                    self._check_generation()
+                    checked = True
+                with self._lock:
+                    data = self._lru.get((key, version))
+                if data is not None:
+                    self.local_hits += 1
+                    ans[key] = pickle.loads(data)
+                    continue
+                self.local_misses += 1
+            remote_keys.append(key)
+
+        if remote_keys:
+            found = self._shared.get_many(remote_keys, version=version)
+            for key, value in found.iteritems():
+                if self.is_local(key):
+                    self._remember((key, version), value)
+            ans.update(found)
+        return ans
+
+    def set(self, key, value, timeout=0, version=None):
+        self._shared.set(key, value, timeout=timeout, version=version)
+        if self._forget([(key, version)]):
+            if is_token_key(key):
+                self._bump_generation()
+            else:
+                self._remember((key, version), value)
+
+    def set_many(self, data, timeout=0, version=None):
+        self._shared.set_many(data, timeout=timeout, version=version)
+        token_written = False
+        for key, value in data.iteritems():
+            if self._forget([(key, version)]):
+                if is_token_key(key):
+                    token_written = True
+                else:
+                    self._remember((key, version), value)
+        if token_written:
+            self._bump_generation()
+
+    def delete(self, key, version=None):
+        self._shared.delete(key, version=version)
+        if self._forget([(key, version)]):
+            self._bump_generation()
+
+    def delete_many(self, keys, version=None):
+        self._shared.delete_many(keys, version=version)
+        if self._forget([(key, version) for key in keys]):
+            self._bump_generation()
+
+    def incr(self, key, delta=1, version=None):
+        value = self._shared.incr(key, delta, version=version)
+        if self._forget([(key, version)]):
+            self._bump_generation()
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        value = self._shared.decr(key, delta, version=version)
+        if self._forget([(key, version)]):
+            self._bump_generation()
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def close(self, **kwargs):
+        self._shared.close()
+
+    def local_stats(self):
+        """ How the in-process tier is doing, for this process """
+        return [{
+            'items': len(self._lru),
+            'hits': self.local_hits,
+            'misses': self.local_misses,
+            'generation_checks': self.generation_checks,
+            'flushes': self.local_flushes,
+        }]
+
+    #   The multikey backend's debugging and size stats pass straight through
+    def size_report(self):
+        return self._shared.size_report()
+
+    def idebug_on(self):
+        self._shared.idebug_on()
+
+    def idebug_off(self):
+        self._shared.idebug_off()
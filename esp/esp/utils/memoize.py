@@ -60,3 +60,61 @@ def lru_cache(maxsize):
         return wrapper
     return decorating_function
 
+
+class LRUDict(object):
+    '''A dict holding at most maxsize keys, dropping the least recently used.
+
+    Uses the same access queue and reference counts as lru_cache above.
+    Not thread-safe; callers sharing one between threads must lock it.
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        self.data = {}
+        self.queue = deque()
+        self.refcount = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def _touch(self, key):
+        self.queue.append(key)
+        self.refcount[key] = self.refcount.get(key, 0) + 1
+
+        # Purge least recently accessed contents
+        while len(self.data) > self.maxsize:
+            k = self.queue.popleft()
+            self.refcount[k] -= 1
+            if not self.refcount[k]:
+                del self.refcount[k]
+                self.data.pop(k, None)
+
+        # Periodically compact the queue by duplicate keys
+        if len(self.queue) > self.maxsize * 4:
+            for i in [None] * len(self.queue):
+                k = self.queue.popleft()
+                if self.refcount[k] == 1:
+                    self.queue.append(k)
+                else:
+                    self.refcount[k] -= 1
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            return default
+        self._touch(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self._touch(key)
+
+    def pop(self, key, default=None):
+        # Its entries in the queue stay behind until they're purged or compacted
+        return self.data.pop(key, default)
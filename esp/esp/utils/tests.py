@@ -15,6 +15,7 @@ except:
 
 import os
 import sys
+import time
 try:
     from utils.memcached_multihost import CacheClass as MultihostCacheClass
 except:
@@ -28,10 +29,13 @@ from esp.utils.models import TemplateOverride
 from django.test import TestCase as DjangoTestCase
 
 from django.core.management import call_command
-from django.core.cache.backends.base import default_key_func
+from django.core.signals import request_started
+from django.core.cache.backends.base import BaseCache, default_key_func
+from django.core.cache.backends.locmem import LocMemCache
 from django.db.models import loading
 
 from django.template import loader, Template, Context, TemplateDoesNotExist
+from django.utils import simplejson
 import reversion
 
 # Code from <http://snippets.dzone.com/posts/show/6313>
@@ -222,18 +226,21 @@ if MultihostCacheClass:
         
         def validate_inAllClients(self, key, value):
             """ Validate that the given key is set in all clients to the given value """
+            self.cacheclass.flush()
             for client in self.clients:
                 client_value = client.get( self.make_key(key) )
                 self.assertEqual(client_value, value)
 
         def validate_inUpdatingClients(self, key, value):
             """ Validate that the given key is set in clients that we're updating, to the given value """
+            self.cacheclass.flush()
             for client in self.clients[0:3] + self.clients[5:6]:
                 client_value = client.get( self.make_key(key) )
                 self.assertEqual(client_value, value)
                 
         def validate_inDeleteOnlyClients(self, key, value):
             """ Validate that the given key is set in clients that we're only flushing, to the given value """
+            self.cacheclass.flush()
             for client in self.clients[3:5]:
                 client_value = client.get( self.make_key(key) )
                 self.assertEqual(client_value, value)
@@ -341,6 +348,338 @@ if MultihostCacheClass:
             self.assertEqual(3, self.cacheclass.get('test_math'))
         
 
+class RecordingCache(LocMemCache):
+    """ A local stand-in for a remote memcached server that remembers the calls it got """
+    def __init__(self, name, params):
+        super(RecordingCache, self).__init__(name, params)
+        self.calls = []
+        self.fail = False
+
+    def set_many(self, data, timeout=None, version=None):
+        if self.fail:
+            raise IOError('host unreachable')
+        self.calls.append(('set_many', sorted(data.keys())))
+        super(RecordingCache, self).set_many(data, timeout=timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        if self.fail:
+            raise IOError('host unreachable')
+        self.calls.append(('delete_many', sorted(keys)))
+        super(RecordingCache, self).delete_many(keys, version=version)
+
+class MultihostFanOutTest(unittest.TestCase):
+    """ Test the background fan-out of the multihost backend, with local caches standing in for memcached """
+
+    def setUp(self):
+        from esp.utils.memcached_multihost import CacheClass, RemoteSender
+        self.local = LocMemCache('multihost-local', {})
+        self.remote = RecordingCache('multihost-remote', {})
+        self.flushed = RecordingCache('multihost-flushed', {})
+        self.cacheclass = CacheClass.__new__(CacheClass)
+        BaseCache.__init__(self.cacheclass, {})
+        self.cacheclass._setup_caches(self.local, [('remote', self.remote)], [('flushed', self.flushed)])
+        #   Hold everything back until we flush, so the tests can see what got coalesced
+        for sender in self.cacheclass._update_senders + self.cacheclass._flush_senders:
+            sender.max_lag = 60
+
+    def tearDown(self):
+        for cache in [self.local, self.remote, self.flushed]:
+            cache.clear()
+
+    def key(self, key):
+        return self.cacheclass.make_key(key)
+
+    def testCoalescing(self):
+        self.flushed.set(self.key('a'), 'old')
+        self.cacheclass.set('a', 1)
+        self.cacheclass.set('a', 2)
+        self.cacheclass.set_many({'b': 3, 'c': 4})
+        self.cacheclass.delete('c')
+        self.cacheclass.delete_many(['d', 'e'])
+
+        #   The local cache is written right away; the remote ones wait
+        self.assertEqual(self.local.get(self.key('a')), 2)
+        self.assertEqual(self.local.get(self.key('c')), None)
+        self.assertEqual(self.remote.get(self.key('a')), None)
+        self.assertEqual(self.flushed.get(self.key('a')), 'old')
+        self.assertEqual([stats['queue_depth'] for stats in self.cacheclass.remote_stats()], [5, 5])
+
+        self.cacheclass.flush()
+        self.assertEqual(self.remote.calls, [('set_many', [self.key('a'), self.key('b')]),
+                                             ('delete_many', [self.key('c'), self.key('d'), self.key('e')])])
+        self.assertEqual(self.remote.get(self.key('a')), 2)
+        self.assertEqual(self.remote.get(self.key('b')), 3)
+        self.assertEqual(self.flushed.calls, [('delete_many', [self.key(k) for k in 'abcde'])])
+        self.assertEqual(self.flushed.get(self.key('a')), None)
+        self.assertEqual([stats['queue_depth'] for stats in self.cacheclass.remote_stats()], [0, 0])
+        self.assertEqual([stats['batches'] for stats in self.cacheclass.remote_stats()], [1, 1])
+
+    def testAdd(self):
+        self.assert_(self.cacheclass.add('f', 'first'))
+        self.failIf(self.cacheclass.add('f', 'second'))
+        self.cacheclass.flush()
+        self.assertEqual(self.remote.get(self.key('f')), 'first')
+
+    def testIncr(self):
+        self.cacheclass.set('k', 1)
+        self.assertEqual(self.cacheclass.incr('k'), 2)
+        self.assertEqual(self.cacheclass.decr('k', 2), 0)
+        self.cacheclass.flush()
+        self.assertEqual(self.remote.get(self.key('k')), 0)
+        self.assertEqual(self.flushed.calls, [('delete_many', [self.key('k')])])
+        self.assertRaises(ValueError, self.cacheclass.incr, 'missing')
+
+    def testBackgroundSend(self):
+        sender = self.cacheclass._update_senders[0]
+        sender.max_lag = 0.01
+        self.cacheclass.set('g', 'sent')
+        for i in range(500):
+            if self.remote.get(self.key('g')) is not None:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.remote.get(self.key('g')), 'sent')
+        self.assertEqual(sender.queue_depth(), 0)
+        self.assert_(sender._thread.isAlive())
+
+    def testOverflow(self):
+        sender = self.cacheclass._update_senders[0]
+        sender.max_pending = 1
+        self.cacheclass.set('h', 1)
+        self.cacheclass.set('i', 2)
+        #   The second key didn't fit in the queue, so it went out synchronously
+        self.assertEqual(sender.overflow_count, 1)
+        self.assertEqual(self.remote.get(self.key('i')), 2)
+        self.assertEqual(self.remote.get(self.key('h')), None)
+        self.cacheclass.flush()
+        self.assertEqual(self.remote.get(self.key('h')), 1)
+
+    def testErrors(self):
+        self.remote.fail = True
+        self.cacheclass.set('j', 1)
+        self.cacheclass.flush()
+        remote_stats, flushed_stats = self.cacheclass.remote_stats()
+        self.assertEqual(remote_stats['errors'], 1)
+        self.assertEqual(remote_stats['last_error'], 'IOError: host unreachable')
+        self.assertEqual(remote_stats['queue_depth'], 0)
+        self.assertEqual(flushed_stats['errors'], 0)
+        #   One bad host doesn't hold up the local cache
+        self.assertEqual(self.cacheclass.get('j'), 1)
+
+
+class MultikeyStorageTest(unittest.TestCase):
+    """ Test compression and chunking in the multikey backend, with a locmem cache standing in for memcached """
+
+    def setUp(self):
+        from esp.utils import memcached_multikey
+        self.module = memcached_multikey
+        self._old_sizes = (memcached_multikey.CACHE_CHUNK_SIZE, memcached_multikey.CACHE_COMPRESS_THRESHOLD)
+        memcached_multikey.CACHE_CHUNK_SIZE = 1000
+        memcached_multikey.CACHE_COMPRESS_THRESHOLD = 100
+        self.wrapped = LocMemCache('multikey-wrapped', {})
+        self.cacheclass = memcached_multikey.CacheClass.__new__(memcached_multikey.CacheClass)
+        BaseCache.__init__(self.cacheclass, {})
+        self.cacheclass._wrapped_cache = self.wrapped
+        self.cacheclass.size_stats = {}
+        if not hasattr(settings, 'CACHE_PREFIX'):
+            settings.CACHE_PREFIX = ''
+
+    def tearDown(self):
+        self.module.CACHE_CHUNK_SIZE, self.module.CACHE_COMPRESS_THRESHOLD = self._old_sizes
+        self.wrapped.clear()
+
+    def stored(self, key):
+        return self.wrapped.get(self.cacheclass.make_key(key))
+
+    def testSmallValue(self):
+        self.cacheclass.set('small|1', {'a': 1})
+        self.assertEqual(self.stored('small|1')[:len(self.module.MAGIC) + 1], self.module.MAGIC + self.module.PICKLED)
+        self.assertEqual(self.cacheclass.get('small|1'), {'a': 1})
+        self.assertEqual(self.cacheclass.get('small|2', 'default'), 'default')
+
+    def testCompression(self):
+        value = ['the same section data'] * 40
+        self.cacheclass.set('compressed|1', value)
+        stored = self.stored('compressed|1')
+        self.assertEqual(stored[len(self.module.MAGIC)], self.module.COMPRESSED)
+        self.assert_(len(stored) < 400)
+        self.assertEqual(self.cacheclass.get('compressed|1'), value)
+
+    def testChunking(self):
+        value = os.urandom(5000)
+        self.cacheclass.set('chunked|1', value)
+        self.cacheclass.set('chunked|2', 'small')
+        self.assertEqual(self.stored('chunked|1')[len(self.module.MAGIC)], self.module.CHUNKED)
+        self.assertEqual(self.cacheclass.get('chunked|1'), value)
+        self.assertEqual(self.cacheclass.get_many(['chunked|1', 'chunked|2', 'chunked|3']), {'chunked|1': value, 'chunked|2': 'small'})
+
+        #   Losing any one chunk is a miss, not a corrupt value
+        token = self.stored('chunked|1')[len(self.module.MAGIC) + 2:].split(':')[0]
+        self.wrapped.delete(self.cacheclass._chunk_key('chunked|1', token, 2))
+        self.assertEqual(self.cacheclass.get('chunked|1'), None)
+
+    def testAdd(self):
+        value = os.urandom(3000)
+        self.assert_(self.cacheclass.add('added|1', value))
+        self.failIf(self.cacheclass.add('added|1', 'something else'))
+        self.assertEqual(self.cacheclass.get('added|1'), value)
+
+    def testTooBig(self):
+        self.module.CACHE_CHUNK_SIZE = 10
+        old_failfast, self.module.FAILFAST = self.module.FAILFAST, False
+        try:
+            self.cacheclass.set('huge|1', 'small')
+            self.cacheclass.set('huge|1', os.urandom(1000))
+        finally:
+            self.module.FAILFAST = old_failfast
+        self.assertEqual(self.cacheclass.get('huge|1'), None)
+
+    def testCounters(self):
+        self.cacheclass.add('counter|1', 0)
+        self.cacheclass.incr('counter|1', 5)
+        self.assertEqual(self.cacheclass.get('counter|1'), 5)
+
+    def testOldValues(self):
+        self.wrapped.set(self.cacheclass.make_key('old|1'), {'written': 'before'})
+        self.assertEqual(self.cacheclass.get('old|1'), {'written': 'before'})
+
+    def testSizeReport(self):
+        self.cacheclass.set('report|1', os.urandom(5000))
+        self.cacheclass.set('report|2', 'x' * 500)
+        self.cacheclass.set('other|1', 'y')
+        report = self.cacheclass.size_report()
+        self.assertEqual([row['name'] for row in report], ['report', 'other'])
+        self.assertEqual(report[0]['count'], 2)
+        self.assertEqual(report[0]['chunked'], 1)
+        self.assert_(report[0]['stored_bytes'] < report[0]['raw_bytes'])
+
+
+class TwoTierCacheTest(unittest.TestCase):
+    """ Test the two-tier backend, with two instances sharing a locmem cache standing in for two processes and memcached """
+
+    LOCAL_CACHE = 'esp.tagdict.models.Tag.getTag'
+
+    def setUp(self):
+        from esp.utils.memcached_twotier import CacheClass
+        self.shared = LocMemCache('twotier-shared', {})
+        self.processes = []
+        for i in range(2):
+            cacheclass = CacheClass.__new__(CacheClass)
+            BaseCache.__init__(cacheclass, {})
+            cacheclass._setup_caches(self.shared, local_caches=[self.LOCAL_CACHE], max_items=3)
+            self.processes.append(cacheclass)
+
+    def tearDown(self):
+        self.shared.clear()
+
+    def value_key(self, arg):
+        return self.LOCAL_CACHE + '|' + arg
+
+    def token_key(self, arg):
+        return 'TOKEN__' + self.LOCAL_CACHE + '|tok|' + arg
+
+    def testLocalHits(self):
+        first, second = self.processes
+        first.set(self.value_key('a'), 'A')
+        self.shared.delete(self.value_key('a'))
+        #   Still held locally by the process that wrote it, but not by the other one
+        self.assertEqual(first.get(self.value_key('a')), 'A')
+        self.assertEqual(second.get(self.value_key('a')), None)
+        self.assertEqual(first.local_hits, 1)
+
+        #   Other caches always go to the shared cache
+        first.set('other|b', 'B')
+        self.shared.delete('other|b')
+        self.assertEqual(first.get('other|b'), None)
+
+    def testValuesAreCopies(self):
+        first = self.processes[0]
+        first.set(self.value_key('list'), [1, 2])
+        first.get(self.value_key('list')).append(3)
+        self.assertEqual(first.get(self.value_key('list')), [1, 2])
+
+    def testInvalidation(self):
+        first, second = self.processes
+        second.set(self.value_key('a'), 'old')
+        self.assertEqual(first.get(self.value_key('a')), 'old')
+
+        #   Another process invalidates the value by writing its token
+        second.set(self.token_key('a'), 2)
+        self.shared.set(self.value_key('a'), 'new')
+
+        #   The first process notices at its next request, not before
+        self.assertEqual(first.get(self.value_key('a')), 'old')
+        request_started.send(sender=None)
+        self.assertEqual(first.get(self.value_key('a')), 'new')
+        self.assertEqual(first.local_flushes, 1)
+
+    def testDelete(self):
+        first, second = self.processes
+        first.set(self.value_key('a'), 'A')
+        second.get(self.value_key('a'))
+        first.delete(self.value_key('a'))
+        request_started.send(sender=None)
+        self.assertEqual(second.get(self.value_key('a')), None)
+
+    def testGetMany(self):
+        first = self.processes[0]
+        first.set_many({self.value_key('a'): 'A', 'other|b': 'B'})
+        self.shared.delete(self.value_key('a'))
+        self.assertEqual(first.get_many([self.value_key('a'), 'other|b', 'other|c']), {self.value_key('a'): 'A', 'other|b': 'B'})
+
+    def testBounded(self):
+        first = self.processes[0]
+        for arg in 'abcde':
+            first.set(self.value_key(arg), arg)
+        self.assertEqual(first.local_stats()[0]['items'], 3)
+
+
+class JSONStreamTest(unittest.TestCase):
+    """ Test that the streaming JSON writer produces what simplejson would """
+
+    class FakeRequest(object):
+        def __init__(self, accept_encoding=''):
+            self.META = {'HTTP_ACCEPT_ENCODING': accept_encoding}
+
+    def data(self):
+        return {'rows': ({'id': i, 'name': u'section %d' % i, 'grades': [7, 12]} for i in range(500)),
+                'timeslots': [(1, 'Sat 10:00'), (2, 'Sat 11:00')],
+                'nested': {1: None, 'empty': []}}
+
+    def expected(self):
+        data = self.data()
+        data['rows'] = list(data['rows'])
+        return simplejson.loads(simplejson.dumps(data))
+
+    def testChunks(self):
+        from esp.utils.json_stream import json_chunks
+        chunks = list(json_chunks(self.data(), chunk_size=1024))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(simplejson.loads(''.join(chunks)), self.expected())
+
+    def testGzip(self):
+        from esp.utils.json_stream import gzip_chunks, gunzip_chunks
+        self.assertEqual(''.join(gunzip_chunks(gzip_chunks(['abc', u'def', '']))), 'abcdef')
+
+    def testResponse(self):
+        from esp.utils.json_stream import json_response, gunzip_chunks
+        response = json_response(self.FakeRequest('gzip, deflate'), self.data())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = ''.join(gunzip_chunks(list(response)))
+        self.assertEqual(simplejson.loads(body), self.expected())
+
+        #   Plain clients get the same document
+        plain = json_response(self.FakeRequest(), self.data())
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(plain.content, body)
+
+    def testRowsBuiltInView(self):
+        """ The rows are produced before the response is returned, so errors surface in the view """
+        from esp.utils.json_stream import json_response
+        def rows():
+            yield {'id': 1}
+            raise ValueError('database went away')
+        self.assertRaises(ValueError, json_response, self.FakeRequest(), {'rows': rows()})
+
 class DefaultclassTestCase(unittest.TestCase):
     def testDefaultclass(self):
         """ Verify that defaultclass correctly lets you select out a custom instance of a class """
@@ -0,0 +1,16 @@
+#!/usr/bin/python
+
+import sys
+sys.path += ['/esp/web/esp/']
+sys.path += ['/esp/web/esp/esp/']
+sys.path += ['/esp/web/esp/django/']
+
+import os
+os.environ['DJANGO_SETTINGS_MODULE'] = 'esp.settings'
+
+from esp import cache_loader
+import esp.manage
+from esp.mailman import sync_list_members
+#   Make all of the queued list membership changes that are due
+while sync_list_members():
+    pass
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""
+Compares find_by_anchor_perms' query with one QTree per user bit (as it
+used to be built) and with the bits' ranges merged by QTreeBelowAny.
+
+Picks the users holding the most V/Administer bits, and for each one
+reports the SQL length and the time to run the ClassSubject query both
+ways.
+
+Usage: python anchor_perms_ranges.py [number of users]
+"""
+
+import operator
+import sys
+import time
+
+from common import report
+
+from django.db.models import Count, Q
+from esp.datatree.models import GetNode
+from esp.datatree.sql.query_utils import QTree, QTreeBelowAny
+from esp.program.models import ClassSubject
+from esp.users.models import UserBit
+
+num_users = len(sys.argv) > 1 and int(sys.argv[1]) or 5
+verb = GetNode('V/Administer')
+user_ids = UserBit.valid_objects().filter(verb=verb, user__isnull=False).values('user').annotate(num_bits=Count('id')).order_by('-num_bits').values_list('user', flat=True)[:num_users]
+
+def per_bit_query(bits):
+    query_list = []
+    for bit in bits:
+        if bit.recursive:
+            query_list.append(QTree(anchor__below=bit.qsc_id))
+        else:
+            query_list.append(Q(anchor=bit.qsc_id))
+    return ClassSubject.objects.filter(reduce(operator.or_, query_list, Q(id=-1))).distinct()
+
+def merged_query(bits):
+    below_ids = set([bit.qsc_id for bit in bits if bit.recursive])
+    exact_ids = set([bit.qsc_id for bit in bits if not bit.recursive]) - below_ids
+    query_list = [Q(id=-1)]
+    if below_ids:
+        query_list.append(QTreeBelowAny('anchor', below_ids))
+    if exact_ids:
+        query_list.append(Q(anchor__in=exact_ids))
+    return ClassSubject.objects.filter(reduce(operator.or_, query_list)).distinct()
+
+def run(make_query, bits):
+    start = time.time()
+    query = make_query(bits)
+    ids = list(query.values_list('id', flat=True))
+    return (time.time() - start) * 1000.0, len(str(query.query)), len(ids)
+
+for user_id in user_ids:
+    bits = list(UserBit.objects.bits_get_qsc(user_id, verb))
+    for label, make_query in (('per bit', per_bit_query), ('merged', merged_query)):
+        elapsed, sql_length, count = run(make_query, bits)
+        report('[%s] user %s, %d bits: %d results' % (label, user_id, len(bits), count), elapsed)
+        report('[%s] user %s SQL' % (label, user_id), sql_length, 'chars')
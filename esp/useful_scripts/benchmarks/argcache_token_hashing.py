@@ -0,0 +1,54 @@
+#!/usr/bin/python
+"""
+Compares the catalog path with and without hashed ArgCache tokens.
+
+For ClassManager.catalog_cached and ClassSection._get_capacity (called once
+per section while rendering the catalog), reports the number of keys each
+lookup fetches, the pickled size of the stored value and the time to read
+every value for the program from a warm cache.
+
+Usage: python argcache_token_hashing.py <program> <instance>
+"""
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from common import program_from_argv, timeit, report
+
+from esp.program.models import ClassSubject, ClassSection
+from esp.cache.argcache import TOKEN_VECTOR_SLOTS
+
+prog = program_from_argv()
+sections = list(prog.sections())
+catalog_cache = ClassSubject.objects.catalog_cached
+capacity_cache = ClassSection._get_capacity
+catalog_args = [ClassSubject.objects, prog, None, False, None, None]
+
+def wrapped_size(cache_obj, arg_list):
+    return len(pickle.dumps(cache_obj.cache.get(cache_obj.key(arg_list)), -1))
+
+def keys_per_lookup(cache_obj, arg_list):
+    if cache_obj.token_vector_slots:
+        return 1 + len(set(cache_obj._slot_keys(arg_list)))
+    return 1 + len(cache_obj._token_keys(arg_list))
+
+for slots in (None, TOKEN_VECTOR_SLOTS):
+    mode = slots and 'hashed' or 'plain'
+    for cache_obj in (catalog_cache, capacity_cache):
+        cache_obj.token_vector_slots = slots
+
+    # Warm everything up in this mode
+    ClassSubject.objects.catalog(prog)
+    for sec in sections:
+        sec._get_capacity()
+
+    report('[%s] catalog_cached keys per lookup' % mode, keys_per_lookup(catalog_cache, catalog_args), 'keys')
+    report('[%s] catalog_cached stored size' % mode, wrapped_size(catalog_cache, catalog_args), 'bytes')
+    report('[%s] catalog_cached get' % mode, timeit(lambda: catalog_cache.get(catalog_args)))
+    if sections:
+        report('[%s] _get_capacity keys per lookup' % mode, keys_per_lookup(capacity_cache, [sections[0], False]), 'keys')
+        report('[%s] _get_capacity stored size' % mode, wrapped_size(capacity_cache, [sections[0], False]), 'bytes')
+    report('[%s] _get_capacity get, %d sections' % (mode, len(sections)),
+           timeit(lambda: [capacity_cache.get([sec, False]) for sec in sections]))
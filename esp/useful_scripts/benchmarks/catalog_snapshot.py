@@ -0,0 +1,43 @@
+#!/usr/bin/python
+"""
+Compares computing the catalog's per-class statistics (enrollment,
+teachers, documents, index page and application questions) with the
+correlated subqueries the catalog used to run, against reading them from
+ClassCatalogSnapshot.
+
+Times the statistics both ways for the 500 most recent classes on the
+site and for the given program's classes, then the whole uncached catalog
+for the program, the cost of refreshing one class's snapshot, which is
+what each relevant save now pays, and of expiring one, which is what
+each enrollment pays.
+
+Usage: python catalog_snapshot.py <program> <instance>
+"""
+
+from common import program_from_argv, timeit, report
+
+from esp.program.models import ClassSubject, ClassSection, ClassCatalogSnapshot
+
+prog = program_from_argv()
+
+def subqueries(classes):
+    select, select_params = ClassCatalogSnapshot.objects.stats_select()
+    return list(classes.extra(select=select, select_params=select_params).values_list('id', *select.keys()))
+
+def snapshot(classes):
+    return list(ClassCatalogSnapshot.objects.extra_for(classes).values_list('id', *ClassCatalogSnapshot.objects.COLUMNS.keys()))
+
+class_ids = list(ClassSubject.objects.order_by('-id').values_list('id', flat=True)[:500])
+recent = ClassSubject.objects.filter(id__in=class_ids)
+program_classes = ClassSubject.objects.filter(parent_program=prog)
+ClassCatalogSnapshot.objects.fill(recent)
+ClassCatalogSnapshot.objects.fill(program_classes)
+
+report('[subqueries] stats for %d classes' % len(class_ids), timeit(lambda: subqueries(recent)))
+report('[snapshot] stats for %d classes' % len(class_ids), timeit(lambda: snapshot(recent)))
+report('[subqueries] stats for %s' % prog.niceName(), timeit(lambda: subqueries(program_classes)))
+report('[snapshot] stats for %s' % prog.niceName(), timeit(lambda: snapshot(program_classes)))
+report('[snapshot] uncached catalog', timeit(lambda: ClassSubject.objects.catalog_cached(prog, use_cache=False), repeat=3))
+report('[snapshot] refresh one class', timeit(lambda: ClassCatalogSnapshot.objects.refresh(class_ids[:1])))
+section_id = ClassSection.objects.filter(parent_class__in=class_ids[:1]).values_list('id', flat=True)[0]
+report('[snapshot] expire one class', timeit(lambda: ClassCatalogSnapshot.objects.expire(section_id)))
@@ -0,0 +1,34 @@
+""" Shared setup for the benchmark scripts in this directory. """
+
+import os
+import sys
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path += [os.path.join(_here, '../../'), os.path.join(_here, '../../esp/')]
+os.environ['DJANGO_SETTINGS_MODULE'] = 'esp.settings'
+
+from esp import cache_loader
+import esp.manage
+
+def program_from_argv():
+    """ Returns the Program named by the first two command-line arguments. """
+    from esp.program.models import Program
+    if len(sys.argv) < 3:
+        print "Usage: %s <program> <instance>" % sys.argv[0]
+        sys.exit(1)
+    return Program.by_prog_inst(sys.argv[1], sys.argv[2])
+
+def timeit(func, repeat=10):
+    """ Returns the best wall-clock time of `repeat` calls to func, in ms. """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = (time.time() - start) * 1000.0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(label, value, unit='ms'):
+    print '%-50s %10.2f %s' % (label, value, unit)
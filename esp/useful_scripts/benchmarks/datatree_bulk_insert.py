@@ -0,0 +1,53 @@
+#!/usr/bin/python
+"""
+Compares creating a subtree of DataTree nodes one GetNode at a time with
+creating it through DataTree.objects.create_many().
+
+Builds a program-like subtree of about 550 nodes (50 classes, each with
+a Sections node holding 9 sections) under a scratch node next to the
+given program's anchor, once each way, and reports the time taken and
+the number of UPDATEs that moved ranges.  Run it against a populated copy of the database, since the cost
+of the range shifts grows with the size of the tree; the scratch nodes
+are deleted afterwards.
+
+Usage: python datatree_bulk_insert.py <program> <instance>
+"""
+
+import time
+
+from common import program_from_argv, report
+
+from django.conf import settings
+from django.db import connection
+from esp.datatree.models import DataTree, GetNode
+
+prog = program_from_argv()
+settings.DEBUG = True
+
+paths = []
+for i in range(50):
+    paths.append('Classes/C%d' % i)
+    for j in range(9):
+        paths.append('Classes/C%d/Sections/S%d' % (i, j))
+
+def shifts(start):
+    return len([query for query in connection.queries[start:] if query['sql'].lstrip().startswith('UPDATE') and 'rangestart' in query['sql']])
+
+def one_at_a_time(base):
+    for path in paths:
+        GetNode(base.uri + '/' + path)
+
+def bulk(base):
+    DataTree.objects.create_many(paths, parent=base)
+
+def bulk_sparse(base):
+    DataTree.objects.create_many(paths, parent=base, spacing=DataTree.SPARSE_SPACING)
+
+for label, func in (('GetNode', one_at_a_time), ('create_many', bulk), ('create_many sparse', bulk_sparse)):
+    base = GetNode('%s/BulkInsertBenchmark' % prog.anchor.parent.uri)
+    start_queries = len(connection.queries)
+    start = time.time()
+    func(base)
+    report('[%s] create subtree' % label, (time.time() - start) * 1000.0)
+    report('[%s] range shifts' % label, shifts(start_queries), 'queries')
+    base.delete(recurse=True)
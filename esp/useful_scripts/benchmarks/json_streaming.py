@@ -0,0 +1,113 @@
+#!/usr/bin/python
+"""
+Compares building a big JSON response the old way (a list of dicts, dumped
+into one string in an HttpResponse) with encoding it a row at a time into
+gzipped chunks and streaming those through esp.utils.json_stream, plain
+and gzipped.
+
+Uses a synthetic program of section rows shaped like ajax_sections' (1000
+sections by default), generated in Python so that no database is needed.
+Each variant runs in its own forked process, which reports the time to
+first byte, the total time to send the response, and how far the peak RSS
+rose above where it started.
+
+Usage: python json_streaming.py [<sections>]
+"""
+
+import os
+import resource
+import sys
+import time
+
+from common import report
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.http import HttpResponse
+from django.utils import simplejson
+from esp.utils.json_stream import json_response
+
+num_sections = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+def section_rows():
+    for i in xrange(num_sections):
+        yield {
+            'id': i,
+            'class_id': i / 2,
+            'emailcode': 'S%ds%d' % (i / 2, i % 2 + 1),
+            'text': 'A class about the number %d, and everything that goes with it' % i,
+            'category': 'Math & Computer Science',
+            'length': 1.83,
+            'teachers': [i, i + 1, i + 2],
+            'resource_requests': [[1, 'LCD projector'], [2, 'Chalkboard']],
+            'max_class_capacity': 30,
+            'capacity': 25,
+            'class_size_max': 30,
+            'optimal_class_size': 20,
+            'optimal_class_size_range': '15-25',
+            'allowable_class_size_ranges': ['10-15', '15-25', '25-35'],
+            'status': 10,
+            'parent_status': 10,
+            'grades': [7, 12],
+            'prereqs': 'Some algebra; ' * 10,
+            'comments': 'Please schedule this in the morning. ' * 5,
+        }
+
+class FakeRequest(object):
+    def __init__(self, accept_encoding):
+        self.META = {'HTTP_ACCEPT_ENCODING': accept_encoding}
+
+def old_response():
+    response = HttpResponse(content_type='application/json')
+    simplejson.dump(list(section_rows()), response)
+    return response
+
+def streaming_response():
+    return json_response(FakeRequest(''), section_rows())
+
+def streaming_gzip_response():
+    return json_response(FakeRequest('gzip'), section_rows())
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(make_response):
+    """ Sends a response to nowhere; returns (ms to first byte, ms in total, KB of peak RSS growth, bytes sent) """
+    start_rss = max_rss_kb()
+    start = time.time()
+    first_byte = None
+    sent = 0
+    for chunk in make_response():
+        if first_byte is None:
+            first_byte = time.time()
+        sent += len(chunk)
+    end = time.time()
+    return ((first_byte - start) * 1000.0, (end - start) * 1000.0, max_rss_kb() - start_rss, sent)
+
+def in_child(func):
+    """ Runs func in a forked process, so that peak RSS is measured from a clean slate """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        os.write(write_fd, pickle.dumps(func()))
+        os._exit(0)
+    os.close(write_fd)
+    data = ''
+    while True:
+        more = os.read(read_fd, 4096)
+        if not more:
+            break
+        data += more
+    os.waitpid(pid, 0)
+    return pickle.loads(data)
+
+for label, func in (('dump', old_response), ('stream', streaming_response), ('stream gzip', streaming_gzip_response)):
+    first_byte, total, rss, sent = in_child(lambda: measure(func))
+    report('[%s] time to first byte, %d sections' % (label, num_sections), first_byte)
+    report('[%s] time to last byte' % label, total)
+    report('[%s] peak RSS growth' % label, rss, 'KB')
+    report('[%s] bytes sent' % label, sent, 'bytes')
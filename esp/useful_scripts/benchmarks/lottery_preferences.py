@@ -0,0 +1,58 @@
+#!/usr/bin/python
+"""
+Compares saving a student's lottery preferences one section at a time,
+with preregister_student() and unpreregister_student() as lsr_submit used
+to, against LotteryPreferenceController.set_preferences().
+
+A student flags <sections> of the program's sections (40 by default) and
+then clears them again; each way, the time and the number of queries for
+the round trip are reported.  The registrations made along the way are
+deleted at the end.
+
+Usage: python lottery_preferences.py <program> <instance> [<sections>]
+"""
+
+import sys
+from datetime import datetime
+
+from common import program_from_argv, timeit, report
+
+from django.db import connection
+from esp.program.controllers.lottery import LotteryPreferenceController
+from esp.program.models import RegistrationType, StudentRegistration
+from esp.users.models import ESPUser
+
+prog = program_from_argv()
+num_sections = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+
+sections = list(prog.sections().order_by('id')[:num_sections])
+student = ESPUser.objects.filter(ESPUser.getAllOfType('Student')).exclude(studentregistration__section__parent_class__parent_program=prog).distinct()[0]
+priority, created = RegistrationType.objects.get_or_create(name='Priority/1', category='student')
+controller = LotteryPreferenceController(prog)
+start = datetime.now()
+
+def one_at_a_time():
+    for section in sections:
+        section.preregister_student(student, prereg_verb=priority.name, overridefull=True)
+    for section in sections:
+        section.unpreregister_student(student, prereg_verb=priority.name)
+
+def in_bulk():
+    controller.set_preferences(student, {priority: [s.id for s in sections]})
+    controller.set_preferences(student, {priority: []})
+
+def count_queries(func):
+    connection.use_debug_cursor = True
+    before = len(connection.queries)
+    try:
+        func()
+    finally:
+        connection.use_debug_cursor = None
+    return len(connection.queries) - before
+
+try:
+    for label, func in (('one at a time', one_at_a_time), ('set_preferences', in_bulk)):
+        report('[%s] flag and clear %d sections' % (label, len(sections)), timeit(func, repeat=3))
+        report('[%s] queries' % label, count_queries(func), 'queries')
+finally:
+    StudentRegistration.objects.filter(user=student, start_date__gte=start).delete()
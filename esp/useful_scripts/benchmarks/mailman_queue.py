@@ -0,0 +1,79 @@
+#!/usr/bin/python
+"""
+Compares the latency of enrolling a student in a class (what the addclass
+view does) and dropping them again, with the mailing list changes queued
+for esp.mailman.sync_list_members(), against running Mailman inline the
+way registration used to.
+
+Mailman is replaced by a fake add_members and remove_members, Python
+scripts that read their input and sleep for <delay> ms (100 by default)
+to stand in for Mailman loading its configuration.  Then the changes that
+the queued runs left behind are drained with sync_list_members(), to
+show the cost per change when they're batched by list.
+
+Usage: python mailman_queue.py <program> <instance> [<delay>]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from common import program_from_argv, timeit, report
+
+import esp.mailman as mailman
+from esp.dbmail.models import ListMembershipChange
+from esp.program.models import StudentRegistration
+from esp.program.models import class_
+from esp.users.models import ESPUser
+
+prog = program_from_argv()
+delay = float(sys.argv[3]) / 1000.0 if len(sys.argv) > 3 else 0.1
+
+fake_dir = tempfile.mkdtemp()
+for script in ('add_members', 'remove_members'):
+    path = os.path.join(fake_dir, script)
+    f = open(path, 'w')
+    f.write('#!%s\nimport sys, time\nsys.stdin.read()\ntime.sleep(%f)\n' % (sys.executable, delay))
+    f.close()
+    os.chmod(path, 0755)
+mailman.USE_MAILMAN = True
+mailman.MM_PATH = fake_dir + '/'
+
+section = prog.sections().filter(status__gt=0)[0]
+student = ESPUser.objects.filter(ESPUser.getAllOfType('Student')).exclude(studentregistration__section=section).distinct()[0]
+start = datetime.now()
+first_change = (ListMembershipChange.objects.order_by('-id').values_list('id', flat=True)[:1] or [0])[0]
+
+def add_and_drop():
+    section.preregister_student(student, overridefull=True)
+    section.unpreregister_student(student)
+
+def inline_add(list, member):
+    return mailman._run_member_script('add', list, mailman._member_addresses(member))
+
+def inline_remove(list, member):
+    return mailman._run_member_script('remove', list, mailman._member_addresses(member))
+
+try:
+    report('[queued] enroll and drop', timeit(add_and_drop))
+    queued = ListMembershipChange.objects.filter(id__gt=first_change, done__isnull=True).count()
+
+    class_.queue_list_member, class_.queue_remove_list_member = inline_add, inline_remove
+    try:
+        report('[inline] enroll and drop', timeit(add_and_drop))
+    finally:
+        class_.queue_list_member, class_.queue_remove_list_member = mailman.queue_list_member, mailman.queue_remove_list_member
+
+    sync_start = time.time()
+    while mailman.sync_list_members():
+        pass
+    elapsed = (time.time() - sync_start) * 1000.0
+    report('[queued] sync %d changes' % queued, elapsed)
+    report('[queued] sync per change', elapsed / max(queued, 1))
+finally:
+    StudentRegistration.objects.filter(user=student, section=section, start_date__gte=start).delete()
+    ListMembershipChange.objects.filter(id__gt=first_change).delete()
+    shutil.rmtree(fake_dir)
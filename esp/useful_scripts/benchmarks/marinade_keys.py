@@ -0,0 +1,32 @@
+#!/usr/bin/python
+"""
+Compares the cost of building ArgCache keys with and without fingerprints.
+
+On the catalog path, student_counts_by_section_id() passes catalog_cached a
+QuerySet of the classes it's missing, and the plain marinade runs that
+query just to build the key. Reports the time to build the key and its
+length for that QuerySet, and for a list of every section id in the
+program, in both modes.
+
+Usage: python marinade_keys.py <program> <instance>
+"""
+
+from common import program_from_argv, timeit, report
+
+from esp.program.models import ClassSubject
+from esp.cache.marinade import marinade_dish
+
+prog = program_from_argv()
+section_ids = list(prog.sections().values_list('id', flat=True))
+catalog_cache = ClassSubject.objects.catalog_cached
+initial_queryset = ClassSubject.objects.filter(sections__in=section_ids)
+catalog_args = [ClassSubject.objects, prog, None, False, initial_queryset, None]
+
+for fingerprint in (False, True):
+    mode = fingerprint and 'fingerprint' or 'plain'
+    catalog_cache.fingerprint = fingerprint
+
+    report('[%s] catalog_cached key with initial_queryset' % mode, timeit(lambda: catalog_cache.key(catalog_args)))
+    report('[%s] catalog_cached key length' % mode, len(catalog_cache.key(catalog_args)), 'chars')
+    report('[%s] marinade %d section ids' % (mode, len(section_ids)), timeit(lambda: marinade_dish(section_ids, fingerprint), repeat=100))
+    report('[%s] marinaded section ids length' % mode, len(marinade_dish(section_ids, fingerprint)), 'chars')
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+"""
+Compares how the multikey cache backend stores our largest values, with
+and without its own pickling, compression and chunking.
+
+Computes the catalog and the program-wide module views (ajax_sections_cached
+and friends) for a program, then for each value reports the bytes sent to
+memcached and the time to set and get it, once through the memcached client
+directly (as the backend used to store values) and once through the backend.
+
+Usage: python multikey_values.py <program> <instance>
+"""
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from common import program_from_argv, timeit, report
+
+from django.core.cache import cache
+from esp.program.models import ClassSubject
+from esp.program.cache_warmup import MODULE_VIEW_CACHES
+
+if not hasattr(cache, '_encode'):
+    print "The configured cache backend isn't esp.utils.memcached_multikey."
+    raise SystemExit(1)
+
+prog = program_from_argv()
+
+values = [('catalog_cached', ClassSubject.objects.catalog_cached(prog))]
+for module in prog.getModules_cached():
+    for name in MODULE_VIEW_CACHES:
+        if hasattr(module, name):
+            values.append((name, getattr(module, name)(prog)))
+
+client = cache._wrapped_cache
+def plain_set(key, value):
+    try:
+        client.set(cache.make_key(key), value)
+    except Exception:
+        #   Most likely over memcached's item size limit
+        pass
+
+for name, value in values:
+    key = 'BENCHMARK_MULTIKEY|%s' % name
+
+    report('[plain] %s bytes' % name, len(pickle.dumps(value, -1)), 'bytes')
+    report('[plain] %s set' % name, timeit(lambda: plain_set(key, value)))
+    report('[plain] %s get' % name, timeit(lambda: client.get(cache.make_key(key))))
+    client.delete(cache.make_key(key))
+
+    stored = cache._encode(key, value)
+    if stored is None:
+        print '%s is too big to cache even in chunks' % name
+        continue
+    report('[multikey] %s bytes' % name, sum([len(data) for data in stored.values()]), 'bytes')
+    report('[multikey] %s keys' % name, len(stored), 'keys')
+    report('[multikey] %s set' % name, timeit(lambda: cache.set(key, value)))
+    report('[multikey] %s get' % name, timeit(lambda: cache.get(key)))
+    cache.delete(key)
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+"""
+Compares answering permission checks from the per-user permission index
+with the stored procedures it replaces.
+
+Asks UserHasPerms about every verb under V/Flags/Registration and
+V/Administer on the program's anchor and its classes, the way a page full
+of sections would, for the program's first few teachers.  The procedure
+path is forced by passing an explicit time, as it used to be taken for
+every call.
+
+Usage: python permission_index.py <program> <instance>
+"""
+
+import datetime
+
+from common import program_from_argv, timeit, report
+
+from esp.datatree.models import GetNode
+from esp.users.models import UserBit
+
+prog = program_from_argv()
+users = list(prog.teachers_union()[:10])
+qscs = [prog.anchor] + [cls.anchor for cls in prog.classes()[:50]]
+verbs = [GetNode('V/Administer')] + list(GetNode('V/Flags/Registration').descendants())
+checks = [(user, qsc, verb) for user in users for qsc in qscs for verb in verbs]
+
+def run_index():
+    for user, qsc, verb in checks:
+        UserBit.objects.UserHasPerms(user, qsc, verb)
+
+def run_procedure():
+    now = datetime.datetime.now()
+    for user, qsc, verb in checks:
+        UserBit.objects.UserHasPerms(user, qsc, verb, now)
+
+def cold(func):
+    def run():
+        for user in users:
+            UserBit.updateCache(user.id)
+        func()
+    return run
+
+report('[procedure] %d checks, cold' % len(checks), timeit(cold(run_procedure), repeat=3))
+report('[index] %d checks, cold' % len(checks), timeit(cold(run_index), repeat=3))
+report('[index] %d checks, warm' % len(checks), timeit(run_index, repeat=3))
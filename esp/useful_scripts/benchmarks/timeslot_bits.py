@@ -0,0 +1,65 @@
+#!/usr/bin/python
+"""
+Compares checking a section for conflicts with a student's schedule by
+walking the student's sections and their timeslots, as cannotAdd() used
+to, against ANDing the cached timeslot bitsets.
+
+Uses a synthetic 10-timeslot program (sections and a schedule made of
+plain objects), so that no database is needed; the bit positions are
+computed the way Program.timeslot_bit_index() does.  Reports the time to
+check every section against a schedule of 4 sections.
+
+Usage: python timeslot_bits.py [<sections>]
+"""
+
+import random
+import sys
+
+from common import timeit, report
+
+num_timeslots = 10
+num_sections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+random.seed(0)
+
+class FakeSection(object):
+    def __init__(self, id, timeslot_ids):
+        self.id = id
+        self._timeslot_ids = timeslot_ids
+
+timeslot_ids = range(1000, 1000 + num_timeslots)
+index = dict([(tid, i) for i, tid in enumerate(timeslot_ids)])
+
+def bits_for(ids):
+    bits = 0
+    for tid in ids:
+        bits |= 1 << index[tid]
+    return bits
+
+sections = []
+for i in xrange(num_sections):
+    start = random.randrange(num_timeslots - 1)
+    sections.append(FakeSection(i, timeslot_ids[start:start + random.choice([1, 2])]))
+schedule = random.sample(sections, 4)
+section_bits = dict([(sec.id, bits_for(sec._timeslot_ids)) for sec in sections])
+schedule_bits = bits_for([tid for sec in schedule for tid in sec._timeslot_ids])
+
+def by_timeslots():
+    conflicts = 0
+    for candidate in sections:
+        my_timeslots = candidate._timeslot_ids
+        for sec in schedule:
+            if [tid for tid in sec._timeslot_ids if tid in my_timeslots]:
+                conflicts += 1
+                break
+    return conflicts
+
+def by_bits():
+    conflicts = 0
+    for candidate in sections:
+        if section_bits[candidate.id] & schedule_bits:
+            conflicts += 1
+    return conflicts
+
+assert by_timeslots() == by_bits()
+report('[timeslots] check %d sections, %d timeslots' % (num_sections, num_timeslots), timeit(by_timeslots, repeat=100))
+report('[bits] check %d sections, %d timeslots' % (num_sections, num_timeslots), timeit(by_bits, repeat=100))
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+"""
+Compares the two-tier cache backend with plain memcached (the multikey
+backend) on the hot lookups it keeps in process.
+
+Looks up DataTree.get_by_uri for the program's anchor and its children,
+and RegistrationType.get_map, the way ArgCache does (one get_many of the
+value and its tokens), and reports the time for a simulated request that
+does every lookup once.  Both backends talk to the memcached server in
+CACHE_BACKEND.
+
+Usage: python twotier_cache.py <program> <instance>
+"""
+
+from common import program_from_argv, timeit, report
+
+from django.core.cache import parse_backend_uri
+from django.core.signals import request_started
+from esp import settings
+from esp.datatree.models import DataTree
+from esp.program.models import RegistrationType
+from esp.utils.memcached_multikey import CacheClass as MultikeyCacheClass
+from esp.utils.memcached_twotier import CacheClass as TwoTierCacheClass
+
+prog = program_from_argv()
+scheme, host, params = parse_backend_uri(settings.CACHE_BACKEND)
+
+lookups = [(DataTree.get_by_uri_cached, [node.uri, False]) for node in [prog.anchor] + list(prog.anchor.children())]
+lookups.append((RegistrationType.get_map, [None, None]))
+values = [(cache_obj.key(args), cache_obj._token_keys(args), cache_obj(*args)) for cache_obj, args in lookups]
+
+def one_request(backend):
+    request_started.send(sender=None)
+    for key, token_keys, value in values:
+        backend.get_many([key] + token_keys)
+
+for label, backend in (('memcached', MultikeyCacheClass(host, params)), ('two-tier', TwoTierCacheClass(host, params))):
+    for key, token_keys, value in values:
+        backend.set(key, value)
+    one_request(backend)
+    report('[%s] request with %d lookups' % (label, len(values)), timeit(lambda: one_request(backend), repeat=50))
+    backend.delete_many([key for key, token_keys, value in values])
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""
+Counts the SQL queries the in-process DataTree URI cache saves on the
+registration pages.
+
+Fetches the student and teacher registration main pages as the given
+users, with the URI cache turned off and then on, and reports the number
+of queries each took and the URI cache's hits and misses.  The first
+fetch of each page is thrown away, so both runs start with the same
+memcached contents.
+
+Usage: python uri_cache_queries.py <program> <instance> <student username> <teacher username>
+"""
+
+import sys
+
+from common import program_from_argv, report
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.client import Client
+from django.utils.importlib import import_module
+from esp.datatree.uri_cache import uri_cache
+
+if len(sys.argv) < 5:
+    print __doc__
+    sys.exit(1)
+
+prog = program_from_argv()
+settings.DEBUG = True
+
+def client_for(username):
+    """ A test client logged in as username, without needing their password """
+    user = User.objects.get(username=username)
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user.id
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session.save()
+    client = Client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+    return client
+
+pages = [('studentreg', client_for(sys.argv[3]), '/learn/%s/studentreg' % prog.getUrlBase()),
+         ('teacherreg', client_for(sys.argv[4]), '/teach/%s/teacherreg' % prog.getUrlBase())]
+
+for name, client, url in pages:
+    client.get(url)
+    for enabled in (False, True):
+        uri_cache.enabled = enabled
+        hits, misses = uri_cache.hits, uri_cache.misses
+        start = len(connection.queries)
+        client.get(url)
+        label = enabled and 'uri cache' or 'no uri cache'
+        report('[%s] %s queries' % (label, name), len(connection.queries) - start, 'queries')
+        if enabled:
+            report('[%s] %s hits' % (label, name), uri_cache.hits - hits, 'hits')
+            report('[%s] %s misses' % (label, name), uri_cache.misses - misses, 'misses')
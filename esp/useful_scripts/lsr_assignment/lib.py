@@ -11,6 +11,7 @@ import random
 from esp.cal.models import Event
 from esp.users.models import User, ESPUser
 from esp.program.models import Program, ClassSection, StudentRegistration, RegistrationType
+from esp.cache.invalidation import defer_invalidation
 
 ################################
 # Global Settings and Thingies #
@@ -269,6 +270,7 @@ def check_sanity():
 # Lottery Assignment Functions #
 ################################
 
+@defer_invalidation()
 def assign_priorities():
     """
     Assign people to their priority classes.  At the end of this function
@@ -389,6 +391,7 @@ def screwed_sweep_by_type(reg_type, fd=None):
         fd.write(output.encode('utf-8'))
         
 
+@defer_invalidation()
 def assign_interesteds():
     """
     Go through all sections that still have space in them, and assign them